@@ -0,0 +1,146 @@
+import importlib.util
+
+from nylas.models.errors import (
+    NylasApiError,
+    NylasApiErrorResponse,
+    NylasApiErrorResponseData,
+)
+from nylas.models.events import Event
+from nylas.models.response import DeleteResponse, ListResponse, Response
+
+from service import AsyncCalendarService, NylasService, build_reminders
+from throttle import Throttle, grant_bucket
+
+
+def validate_response(response):
+    """
+    Тело ответа API или NylasApiError, как в синхронном SDK
+    """
+    try:
+        body = response.json()
+    except ValueError:
+        body = {}
+    if response.status_code < 400:
+        return body
+    try:
+        error = NylasApiErrorResponse.from_dict(body)
+    except (KeyError, TypeError):
+        error = NylasApiErrorResponse(
+            body.get("request_id"),
+            NylasApiErrorResponseData(type="unknown", message=str(body)),
+        )
+    raise NylasApiError(error, response.status_code, response.headers)
+
+
+class AsyncNylasService(AsyncCalendarService):
+    """
+    Асинхронная реализация CalendarService для API Nylas.
+
+    Запросы идут напрямую в REST API через общий пул соединений
+    httpx.AsyncClient, ответы разбираются моделями SDK. Ограничение
+    частоты и повторы те же, что у NylasService, и квота grant общая
+    с синхронными клиентами процесса. Требует пакет httpx
+    (pip install "scheduler[async]"). http2=True включает HTTP/2, если
+    установлен пакет h2, иначе соединения остаются на HTTP/1.1.
+    """
+
+    def __init__(
+        self,
+        grant_id: str,
+        api_key: str,
+        api_uri: str,
+        rate: float = 5.0,
+        burst: float = 10.0,
+        max_retries: int = 4,
+        pool_size: int = 100,
+        timeout: float = 90,
+        connect_timeout: float = 10,
+        keep_alive: bool = True,
+        gzip: bool = True,
+        http2: bool = False,
+    ):
+        try:
+            import httpx
+        except ImportError as e:
+            raise ImportError(
+                'AsyncNylasService requires httpx: pip install "scheduler[async]"'
+            ) from e
+        self.grant_id = grant_id
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+        self.client = httpx.AsyncClient(
+            base_url=api_uri,
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Accept": "application/json",
+                "Accept-Encoding": "gzip, deflate" if gzip else "identity",
+            },
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size if keep_alive else 0,
+            ),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            http2=self.http2,
+        )
+        self.throttle = Throttle(
+            grant_bucket(grant_id, rate, burst),
+            max_retries=max_retries,
+            transient_errors=(httpx.TransportError,),
+        )
+
+    page_query = NylasService.page_query
+
+    @property
+    def stats(self):
+        return dict(self.throttle.stats)
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def request(self, method, path, query_params=None, request_body=None):
+        response = await self.client.request(
+            method,
+            f"/v3/grants/{self.grant_id}/events{path}",
+            params=query_params,
+            json=request_body,
+        )
+        return validate_response(response), response.headers
+
+    async def send(self, method, path, query_params, request_body=None):
+        body, headers = await self.request(method, path, query_params, request_body)
+        return Response.from_dict(body, Event, headers)
+
+    async def create_event(self, request_body, reminders, calendar_id):
+        request_body["reminders"] = build_reminders(reminders)
+        # Создание не идемпотентно: повторяем только отклонённые провайдером запросы
+        return await self.throttle.acall(
+            self.send,
+            "POST",
+            "",
+            {"notify_participants": False, "calendar_id": calendar_id},
+            request_body,
+            idempotent=False,
+        )
+
+    async def update_event(self, event_id, request_body, reminders, calendar_id):
+        if reminders is not None:
+            request_body["reminders"] = build_reminders(reminders)
+        return await self.throttle.acall(
+            self.send,
+            "PUT",
+            f"/{event_id}",
+            {"notify_participants": False, "calendar_id": calendar_id},
+            request_body,
+        )
+
+    async def delete_event(self, event_id, calendar_id):
+        body, headers = await self.throttle.acall(
+            self.request,
+            "DELETE",
+            f"/{event_id}",
+            {"notify_participants": False, "calendar_id": calendar_id},
+        )
+        return DeleteResponse.from_dict(body, headers)
+
+    async def search_events(self, query_params):
+        body, headers = await self.throttle.acall(self.request, "GET", "", query_params)
+        return ListResponse.from_dict(body, Event, headers)
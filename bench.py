@@ -0,0 +1,181 @@
+"""
+Бенчмарк планировщика на фейковом календаре.
+
+Прогоняет Scheduler по расписаниям из config/ и синтетическим расписаниям,
+печатает время, число вызовов API по типам и пиковую память, а при
+наличии базовой линии завершается с кодом 1, если метрики ухудшились
+сверх порога.
+
+    python bench.py --latency 0.01 --workers 16
+    python bench.py --save          # записать базовую линию
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from config import LoadSchedule
+from fake import FakeCalendarService
+from scheduler import Scheduler
+from throttle import Throttle
+
+BASELINE_PATH = "./bench_baseline.json"
+
+
+def synthetic_schedule(calendars: int, events: int):
+    """
+    Расписание из calendars календарей по events событий в каждом
+    """
+    schedule = []
+    for c in range(calendars):
+        day_events = []
+        for e in range(events):
+            minute = 12 * 60 + (e * 11) % (11 * 60)
+            day_events.append(
+                {
+                    "title": f"Событие {e}",
+                    "time": f"{minute // 60:02d}:{minute % 60:02d}",
+                    "duration": 10,
+                    "reminders": [e % 3 * 5] if e % 2 else [],
+                }
+            )
+        schedule.append(
+            {
+                "calendar_title": f"cal_{c}",
+                "calendar_id": f"calendar-{c}",
+                "calendar_routine": [
+                    {
+                        "title": "Day",
+                        "schedule": day_events,
+                        "recurrence": "RRULE:FREQ=DAILY",
+                    }
+                ],
+            }
+        )
+    return schedule
+
+
+def measure(label, service, fn):
+    service.calls.clear()
+    tracemalloc.start()
+    started = time.perf_counter()
+    results = fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "label": label,
+        "seconds": round(elapsed, 4),
+        "calls": dict(service.calls),
+        "errors": sum(1 for result in results if not result.ok),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def run_scenario(name, schedule, args):
+    service = FakeCalendarService(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        seed=1,
+        throttle=Throttle(max_retries=args.retries, base_delay=0.01, max_delay=1.0),
+    )
+    scheduler = Scheduler(service, schedule, max_workers=args.workers)
+    # Фиксированное время пробуждения, чтобы дневные рутины всегда выполнялись
+    scheduler.wake_up = scheduler.wake_up.replace(hour=12, minute=0)
+    return [
+        measure(f"{name}/initial", service, scheduler.reconcile_routine),
+        measure(f"{name}/steady", service, scheduler.reconcile_routine),
+        measure(f"{name}/recreate", service, scheduler.create_routine),
+    ]
+
+
+def compare(reports, baseline, tolerance):
+    """
+    Список регрессий относительно базовой линии
+    """
+    regressions = []
+    for report in reports:
+        base = baseline.get(report["label"])
+        if base is None:
+            continue
+        if report["seconds"] > base["seconds"] * (1 + tolerance) + 0.01:
+            regressions.append(
+                f"{report['label']}: {report['seconds']}s > {base['seconds']}s"
+            )
+        if report["peak_kib"] > base["peak_kib"] * (1 + tolerance):
+            regressions.append(
+                f"{report['label']}: {report['peak_kib']} KiB > {base['peak_kib']} KiB"
+            )
+        for call, count in report["calls"].items():
+            if count > base["calls"].get(call, 0):
+                regressions.append(
+                    f"{report['label']}: {call} {count} > {base['calls'].get(call, 0)}"
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--schedule",
+        nargs="*",
+        default=["./config/schedule.json", "./config/test_schedule.json"],
+    )
+    parser.add_argument("--scale", type=int, nargs="*", default=[1000, 5000])
+    parser.add_argument("--calendars", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=None)
+    parser.add_argument("--retries", type=int, default=4)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--save", action="store_true")
+    args = parser.parse_args(argv)
+
+    scenarios = []
+    for path in args.schedule:
+        try:
+            schedule = LoadSchedule(path).load()
+        except ValueError as e:
+            print(f"SKIP {path}: {e}", file=sys.stderr)
+            continue
+        scenarios.append((os.path.splitext(os.path.basename(path))[0], schedule))
+    for total in args.scale:
+        events = max(1, total // args.calendars)
+        scenarios.append(
+            (f"synthetic-{total}", synthetic_schedule(args.calendars, events))
+        )
+
+    reports = []
+    for name, schedule in scenarios:
+        reports.extend(run_scenario(name, schedule, args))
+
+    for report in reports:
+        calls = ", ".join(f"{k}={v}" for k, v in sorted(report["calls"].items()))
+        print(
+            f"{report['label']:<28} {report['seconds']:>9.4f}s "
+            f"{report['peak_kib']:>10.1f} KiB  errors={report['errors']}  {calls}"
+        )
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump({r["label"]: r for r in reports}, file, indent=2)
+        return 0
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline, "r", encoding="utf-8") as file:
+        regressions = compare(reports, json.load(file), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
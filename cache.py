@@ -0,0 +1,154 @@
+import sqlite3
+import time
+from collections import defaultdict
+from datetime import date
+
+from reconcile import CREATE, DELETE, NOOP, UPDATE, Operation, content_hash
+
+
+class CachedWhen:
+    __slots__ = ("start_time", "end_time")
+
+    def __init__(self, start_time=None, end_time=None):
+        self.start_time = start_time
+        self.end_time = end_time
+
+
+class CachedEvent:
+    """
+    Событие календаря, известное только по записи в кэше или журнале.
+    Время начала может быть неизвестно (None)
+    """
+
+    def __init__(self, event_id, title, start=None):
+        self.id = event_id
+        self.title = title
+        self.when = CachedWhen(start)
+
+
+class EventCache:
+    """
+    Локальный кэш созданных планировщиком событий в SQLite.
+
+    Ключ записи (grant, calendar_id, routine, title, day), значение —
+    идентификатор события у провайдера и хэш его содержимого.
+
+    Правила инвалидации:
+    - записи за прошедшие дни удаляются при открытии кэша;
+    - запись перезаписывается после каждой успешной операции над событием;
+    - запись удаляется при удалении события и при ошибке операции над ним;
+    - сверка с провайдером (verify) пересобирает записи календаря целиком.
+    """
+
+    def __init__(self, path="./config/events.sqlite3"):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                grant_id TEXT NOT NULL,
+                calendar_id TEXT NOT NULL,
+                routine TEXT NOT NULL,
+                title TEXT NOT NULL,
+                day TEXT NOT NULL,
+                event_id TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (grant_id, calendar_id, routine, title, day)
+            )
+            """)
+        self.purge(date.today())
+
+    def close(self):
+        self.connection.close()
+
+    def purge(self, before: date):
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM events WHERE day < ?", (before.isoformat(),)
+            )
+
+    def load(self, grant_id, days):
+        entries = {}
+        for day in days:
+            rows = self.connection.execute(
+                "SELECT calendar_id, routine, title, day, event_id, content_hash "
+                "FROM events WHERE grant_id = ? AND day = ?",
+                (grant_id, day.isoformat()),
+            )
+            entries.update((tuple(row[:4]), (row[4], row[5])) for row in rows)
+        return entries
+
+    def put(self, grant_id, desired, event_id):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    grant_id,
+                    desired.calendar_id,
+                    desired.routine,
+                    desired.title,
+                    desired.day.isoformat(),
+                    event_id,
+                    content_hash(desired),
+                    time.time(),
+                ),
+            )
+
+    def forget(self, grant_id, event_id):
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM events WHERE grant_id = ? AND event_id = ?",
+                (grant_id, event_id),
+            )
+
+    def plan(self, grant_id, desired_events):
+        """
+        Строит операции по кэшу без запросов к провайдеру.
+
+        Возвращает операции для календарей, все события которых есть в кэше,
+        и множество календарей, которые нужно сверить через провайдера.
+        """
+        desired_events = list(desired_events)
+        entries = self.load(grant_id, {event.day for event in desired_events})
+        by_calendar = defaultdict(list)
+        for desired in desired_events:
+            by_calendar[desired.calendar_id].append(desired)
+
+        operations, uncached = [], set()
+        for calendar_id, events in by_calendar.items():
+            keys = [
+                (calendar_id, event.routine, event.title, event.day.isoformat())
+                for event in events
+            ]
+            if not all(key in entries for key in keys):
+                uncached.add(calendar_id)
+                continue
+            for key, desired in zip(keys, events):
+                event_id, cached_hash = entries[key]
+                event = CachedEvent(event_id, desired.title)
+                if cached_hash == content_hash(desired):
+                    operations.append(Operation(NOOP, calendar_id, desired, event))
+                else:
+                    operations.append(
+                        Operation(UPDATE, calendar_id, desired, event, True, True)
+                    )
+        return operations, uncached
+
+    def record(self, grant_id, operations, results):
+        """
+        Обновляет кэш по итогам выполнения операций
+        """
+        outcome = {id(result.operation): result for result in results}
+        for operation in operations:
+            result = outcome.get(id(operation))
+            if result is not None and not result.ok:
+                if operation.event is not None:
+                    self.forget(grant_id, operation.event.id)
+                continue
+            if operation.kind == DELETE:
+                self.forget(grant_id, operation.event.id)
+            elif operation.kind == CREATE:
+                created = getattr(result.result, "data", result.result)
+                self.put(grant_id, operation.desired, created.id)
+            else:
+                self.put(grant_id, operation.desired, operation.event.id)
@@ -0,0 +1,296 @@
+"""
+Командная строка планировщика.
+
+    scheduler plan --days 7         # желаемые события, без обращения к API
+    scheduler apply                 # привести календари к расписанию
+    scheduler verify                # расхождения с календарём, без изменений
+    scheduler apply --timing        # разбивка времени запуска в stderr
+
+apply ведёт журнал операций (см. journal.py) рядом с файлом расписания
+и начинает с того, что не удалось или не успело выполниться в прошлый раз.
+
+Модули планировщика импортируются внутри команд, а SDK провайдера —
+только когда команде нужна сеть: apply и verify с пустым планом
+завершаются без создания клиента.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+STARTED = time.perf_counter()
+
+
+class Timings:
+    """
+    Замеры фаз запуска в миллисекундах, начиная с импорта cli
+    """
+
+    def __init__(self):
+        self.phases = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def report(self):
+        total = (time.perf_counter() - STARTED) * 1000
+        phases = ", ".join(f"{name} {ms:.1f}" for name, ms in self.phases.items())
+        return f"startup: {phases}, total {total:.1f} ms"
+
+
+def load_scheduler(args, timings):
+    with timings.phase("import"):
+        from config import LoadSchedule
+        from scheduler import Scheduler
+    with timings.phase("compile"):
+        plan = LoadSchedule(args.schedule).compile()
+    cache = None
+    if getattr(args, "cache", None):
+        with timings.phase("import"):
+            from cache import EventCache
+        cache = EventCache(args.cache)
+    journal = None
+    # Журнал ведёт только apply: plan и verify ничего не меняют
+    if args.command == "apply" and not args.no_journal:
+        with timings.phase("import"):
+            from journal import OperationJournal, journal_path
+        journal = OperationJournal(args.journal or journal_path(args.schedule))
+    # Клиент подключается позже, только если план не пуст
+    return Scheduler(
+        None,
+        plan,
+        max_workers=args.workers,
+        cache=cache,
+        journal=journal,
+        busy_calendars=busy_calendars(args),
+        shift_conflicts=getattr(args, "shift_conflicts", False),
+    )
+
+
+def busy_calendars(args):
+    """
+    Календари занятости для проверки конфликтов или None без проверки.
+    --busy без значений и --shift-conflicts проверяют только календари
+    расписания
+    """
+    busy = getattr(args, "busy", None)
+    if busy is None and getattr(args, "shift_conflicts", False):
+        return []
+    return busy
+
+
+def connect(scheduler, args, timings):
+    """
+    Создаёт клиент провайдера по файлу конфигурации и подключает его
+    к планировщику. Возвращает клиент и InstrumentedService с метриками
+    вызовов API (None без --metrics)
+    """
+    with timings.phase("import_client"):
+        from config import LoadConfig
+        from guard import READ_TIMEOUT, GuardedService
+        from service import NylasService
+    with timings.phase("client"):
+        grant_id, api_key, api_uri = LoadConfig(args.config).load()
+        service = NylasService(
+            grant_id,
+            api_key,
+            api_uri,
+            pool_size=args.workers,
+            read_timeout=READ_TIMEOUT,
+        )
+        metrics = None
+        if args.metrics:
+            from metrics import InstrumentedService
+
+            service = metrics = InstrumentedService(service)
+        scheduler.service = GuardedService(service)
+        if args.mirror:
+            from mirror import MirroredService
+
+            scheduler.service = MirroredService(scheduler.service, args.mirror)
+        scheduler.grant_id = grant_id
+        return scheduler.service, metrics
+
+
+def disconnect(service, metrics, args):
+    try:
+        if metrics is not None:
+            metrics.write(args.metrics)
+    finally:
+        service.close()
+
+
+def has_work(scheduler, args, timings):
+    from datetime import date
+
+    with timings.phase("plan"):
+        return any(True for _ in scheduler.desired_events(date.today(), args.days))
+
+
+def format_time(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(timestamp))
+
+
+def report_conflicts(conflicts):
+    for conflict in conflicts:
+        desired = conflict.desired
+        status = "shifted" if conflict.shifted else "conflict"
+        titles = ", ".join(block.title for _, _, block in conflict.blocks)
+        print(
+            f"{status.upper():<8} {format_time(desired.start)}  "
+            f"{desired.calendar_id}  {desired.title} | busy: {titles}",
+            file=sys.stderr,
+        )
+
+
+def plan_command(args, timings):
+    from datetime import date
+
+    scheduler = load_scheduler(args, timings)
+    with timings.phase("plan"):
+        desired = list(scheduler.desired_events(date.today(), args.days))
+    for event in desired:
+        reminders = ",".join(str(minutes) for minutes in event.reminders)
+        end = time.strftime("%H:%M", time.localtime(event.end))
+        line = f"{format_time(event.start)}-{end}  {event.calendar_id}  {event.key}"
+        print(f"{line}  [{reminders}]" if reminders else line)
+    print(f"{len(desired)} events", file=sys.stderr)
+    return 0
+
+
+def apply_command(args, timings):
+    scheduler = load_scheduler(args, timings)
+    if not has_work(scheduler, args, timings):
+        print("Nothing to do")
+        return 0
+    service, metrics = connect(scheduler, args, timings)
+    try:
+        with timings.phase("run"):
+            results = scheduler.reconcile_routine(days=args.days)
+    finally:
+        disconnect(service, metrics, args)
+    operations = {}
+    for result in results:
+        kind = result.operation.kind
+        operations[kind] = operations.get(kind, 0) + 1
+    failed = [result for result in results if not result.ok]
+    for result in failed:
+        print(f"FAILED {result.operation} | {result.error}", file=sys.stderr)
+    report_conflicts(scheduler.conflicts)
+    summary = {"operations": operations, "failed": len(failed)}
+    if scheduler.busy_calendars is not None:
+        summary["conflicts"] = len(scheduler.conflicts)
+    if scheduler.lead is not None:
+        summary["lead"] = {key: round(value) for key, value in scheduler.lead.items()}
+    print(json.dumps(summary, ensure_ascii=False))
+    return 1 if failed else 0
+
+
+def verify_command(args, timings):
+    from reconcile import NOOP
+
+    scheduler = load_scheduler(args, timings)
+    if not has_work(scheduler, args, timings):
+        print("Nothing to verify")
+        return 0
+    service, metrics = connect(scheduler, args, timings)
+    try:
+        with timings.phase("run"):
+            operations = scheduler.drift(verify=True, days=args.days)
+    finally:
+        disconnect(service, metrics, args)
+    report_conflicts(scheduler.conflicts)
+    changes = [operation for operation in operations if operation.kind != NOOP]
+    for operation in changes:
+        event = operation.desired or operation.event
+        start = getattr(event, "start", None) or event.when.start_time
+        line = f"{operation.kind:<6} {format_time(start)}  {operation.calendar_id}"
+        print(f"{line}  {event.title}")
+    print(f"{len(changes)} changes pending", file=sys.stderr)
+    return 1 if changes else 0
+
+
+COMMANDS = {"plan": plan_command, "apply": apply_command, "verify": verify_command}
+
+
+def parse_args(argv=None):
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--schedule", default="./config/schedule.json")
+    common.add_argument("--days", type=int, default=1)
+    common.add_argument("--workers", type=int, default=8)
+    common.add_argument(
+        "--timing", action="store_true", help="print startup breakdown to stderr"
+    )
+    common.add_argument("--trace", default=os.environ.get("SCHEDULER_TRACE"))
+    common.add_argument("--profile", default=os.environ.get("SCHEDULER_PROFILE"))
+
+    network = argparse.ArgumentParser(add_help=False)
+    network.add_argument("--config", default="./config/config.json")
+    network.add_argument(
+        "--mirror", default=None, help="calendar mirror JSON, synced incrementally"
+    )
+    network.add_argument(
+        "--busy",
+        nargs="*",
+        default=None,
+        metavar="CALENDAR_ID",
+        help="check events against busy time of these calendars and their own",
+    )
+    network.add_argument(
+        "--shift-conflicts",
+        action="store_true",
+        help="move flexible events out of busy time",
+    )
+    network.add_argument(
+        "--metrics",
+        default=None,
+        help="export API call metrics after the run (.json or Prometheus text)",
+    )
+
+    parser = argparse.ArgumentParser(prog="scheduler", description="Calendar routines")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("plan", parents=[common], help="list desired events")
+    apply_parser = commands.add_parser(
+        "apply", parents=[common, network], help="reconcile calendars"
+    )
+    apply_parser.add_argument("--cache", default=None, help="SQLite event cache path")
+    apply_parser.add_argument(
+        "--journal", default=None, help="operation journal (default: next to schedule)"
+    )
+    apply_parser.add_argument(
+        "--no-journal", action="store_true", help="run without operation journal"
+    )
+    commands.add_parser(
+        "verify", parents=[common, network], help="show pending changes"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    timings = Timings()
+    if args.trace or args.profile:
+        from tracing import tracer
+    if args.trace:
+        tracer.enable()
+    profile = tracer.profile(args.profile) if args.profile else contextlib.nullcontext()
+    with profile:
+        code = COMMANDS[args.command](args, timings)
+    if args.trace:
+        tracer.write(args.trace)
+    if args.timing:
+        print(timings.report(), file=sys.stderr)
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
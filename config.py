@@ -1,6 +1,9 @@
 import json
 from typing import Dict
 
+from plan import load_plan
+from tracing import span
+
 
 class LoadSchedule:
     """
@@ -11,8 +14,13 @@ class LoadSchedule:
         self.path = path
 
     def load(self):
-        with open(self.path, "r", encoding="utf-8") as file:
-            return json.load(file)
+        with span("load_schedule", path=self.path):
+            with open(self.path, "r", encoding="utf-8") as file:
+                return json.load(file)
+
+    def compile(self):
+        with span("compile_schedule", path=self.path):
+            return load_plan(self.path)
 
 
 class LoadConfig:
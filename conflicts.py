@@ -0,0 +1,212 @@
+from bisect import bisect_left, insort
+from datetime import date, datetime, time, timedelta
+from itertools import count
+
+from index import OWNER_KEY, event_metadata, event_start
+
+# Поля событий, нужные для занятости
+BUSY_FIELDS = ("id", "title", "when", "busy", "metadata")
+
+
+class IntervalTree:
+    """
+    Статическое дерево интервалов [start, end) на отсортированном массиве.
+
+    Корень поддерева — середина отрезка массива, для каждого узла хранится
+    максимальный конец интервалов его поддерева. Поиск пересечений —
+    O(log n + k), где k — число найденных интервалов.
+    """
+
+    def __init__(self, intervals):
+        intervals = sorted(intervals, key=lambda interval: interval[:2])
+        self.starts = [interval[0] for interval in intervals]
+        self.ends = [interval[1] for interval in intervals]
+        self.items = [interval[2] for interval in intervals]
+        self.max_end = [0] * len(intervals)
+        self.build(0, len(intervals))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def build(self, lo, hi):
+        if lo >= hi:
+            return float("-inf")
+        mid = (lo + hi) // 2
+        self.max_end[mid] = max(
+            self.ends[mid], self.build(lo, mid), self.build(mid + 1, hi)
+        )
+        return self.max_end[mid]
+
+    def overlapping(self, start, end):
+        """
+        Интервалы, пересекающиеся с [start, end), в порядке начала
+        """
+        yield from self.search(0, len(self.starts), start, end)
+
+    def search(self, lo, hi, start, end):
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        if self.max_end[mid] <= start:
+            return
+        yield from self.search(lo, mid, start, end)
+        if self.starts[mid] >= end:
+            return
+        if self.ends[mid] > start:
+            yield (self.starts[mid], self.ends[mid], self.items[mid])
+        yield from self.search(mid + 1, hi, start, end)
+
+    def first(self, start, end):
+        return next(self.overlapping(start, end), None)
+
+
+class Conflict:
+    """
+    Пересечение желаемого события с занятым временем.
+    shifted — True, если событие удалось сдвинуть в свободное время
+    """
+
+    def __init__(self, desired, blocks, shifted=False):
+        self.desired = desired
+        self.blocks = blocks
+        self.shifted = shifted
+
+    def __repr__(self):
+        titles = [getattr(block, "title", None) for _, _, block in self.blocks]
+        status = "shifted" if self.shifted else "conflict"
+        return f"Conflict({self.desired!r}, {titles!r}, {status})"
+
+
+class ConflictDetector:
+    """
+    Проверка желаемых событий на пересечение с занятым временем календарей.
+
+    Занятость всех календарей (например, health, family и professional
+    из old/main.py) загружается одним постраничным запросом на календарь
+    в дерево интервалов, после чего каждое событие проверяется за
+    O(log n). События самого расписания, помеченные его владельцем,
+    занятостью не считаются. Для расписания без пометок (owner None)
+    вместо метки используются пары (календарь, название) его событий.
+
+    Дерево статическое, поэтому размещённые события расписания хранятся
+    рядом в отсортированном списке (начало, конец, номер, событие):
+    сдвигаемое событие не попадает ни на занятость, ни на другие события.
+    """
+
+    def __init__(self, service, calendars):
+        self.service = service
+        self.calendars = list(calendars)
+        self.tree = IntervalTree([])
+        self.placed = []
+        # Самое длинное размещённое событие ограничивает поиск по списку
+        self.longest = 0
+        self.numbers = count()
+
+    def load(self, start: int, end: int, owner=None, untagged=()):
+        untagged = set(untagged) if owner is None else set()
+        blocks = []
+        for calendar_id in self.calendars:
+            events = self.service.iter_events(
+                {"calendar_id": calendar_id, "start": start, "end": end},
+                select=BUSY_FIELDS,
+            )
+            for event in events:
+                event_begin = event_start(event)
+                event_end = getattr(event.when, "end_time", None)
+                if event_begin is None or event_end is None:
+                    continue
+                if not getattr(event, "busy", True):
+                    continue
+                if owner is not None:
+                    if event_metadata(event).get(OWNER_KEY) == owner:
+                        continue
+                elif (calendar_id, event.title) in untagged:
+                    continue
+                blocks.append((event_begin, event_end, event))
+        self.tree = IntervalTree(blocks)
+        return self
+
+    def check(self, desired):
+        return list(self.tree.overlapping(desired.start, desired.end))
+
+    def place(self, start, end, item):
+        """
+        Занимает [start, end) событием расписания и возвращает запись
+        для remove
+        """
+        entry = (start, end, next(self.numbers), item)
+        insort(self.placed, entry)
+        self.longest = max(self.longest, end - start)
+        return entry
+
+    def remove(self, entry):
+        del self.placed[bisect_left(self.placed, entry)]
+
+    def occupied(self, start, end, skip=None):
+        """
+        Занятость и размещённые события (кроме записи skip),
+        пересекающиеся с [start, end)
+        """
+        yield from self.tree.overlapping(start, end)
+        lo = bisect_left(self.placed, (start - self.longest,))
+        hi = bisect_left(self.placed, (end,))
+        for entry in self.placed[lo:hi]:
+            if entry[1] > start and entry is not skip:
+                yield entry[0], entry[1], entry[3]
+
+    def resolve(
+        self, desired_events, flexible=lambda desired: False, limit=None, moved=None
+    ):
+        """
+        Проверяет события и возвращает список конфликтов.
+
+        Все события сначала занимают своё время. Гибкие события по порядку
+        сдвигаются вперёд за конец мешающих интервалов, пока не найдётся
+        окно той же длины, свободное от занятости и других событий, до
+        limit(desired) (по умолчанию — до конца дня события). Остальные
+        события остаются на своём времени. moved(desired) вызывается после
+        сдвига и возвращает пары (событие, [start, end] или None) событий,
+        сдвинувшихся вслед за ним; None — событие больше не размещено.
+        """
+        desired_events = list(desired_events)
+        entries = {
+            id(desired): self.place(desired.start, desired.end, desired)
+            for desired in desired_events
+        }
+        conflicts = []
+        for desired in desired_events:
+            if id(desired) not in entries:
+                continue
+            blocks = self.check(desired)
+            if not blocks:
+                continue
+            start = None
+            if flexible(desired):
+                start = self.free_start(desired, blocks, limit, entries[id(desired)])
+            if start is not None:
+                changes = [(desired, (start, start + desired.end - desired.start))]
+                desired.start, desired.end = changes[0][1]
+                changes += moved(desired) if moved else []
+                for event, event_span in changes:
+                    if (entry := entries.pop(id(event), None)) is not None:
+                        self.remove(entry)
+                    if event_span is not None:
+                        event.start, event.end = event_span
+                        entries[id(event)] = self.place(*event_span, event)
+            conflicts.append(Conflict(desired, blocks, shifted=start is not None))
+        return conflicts
+
+    def free_start(self, desired, blocks, limit=None, skip=None):
+        duration = desired.end - desired.start
+        deadline = limit(desired) if limit else day_end(desired.start)
+        while blocks:
+            start = max(block[1] for block in blocks)
+            if start + duration > deadline:
+                return None
+            blocks = list(self.occupied(start, start + duration, skip))
+        return start
+
+
+def day_end(timestamp):
+    day = date.fromtimestamp(timestamp) + timedelta(days=1)
+    return int(datetime.combine(day, time()).timestamp())
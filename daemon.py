@@ -0,0 +1,364 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from config import LoadConfig, LoadSchedule
+from guard import READ_TIMEOUT, GuardedService
+from journal import OperationJournal, journal_path
+from metrics import InstrumentedService
+from mirror import MirroredService
+from plan import ScheduleError, compile_schedule, schedule_name
+from scheduler import Scheduler
+from service import NylasService
+from triggers import TriggerEngine, next_apply
+
+logger = logging.getLogger("scheduler")
+
+
+def routine_key(calendar, routine):
+    return (calendar["calendar_id"], routine["title"])
+
+
+def routine_hashes(schedule):
+    """
+    Хэши определений рутин расписания по ключу (calendar_id, routine)
+    """
+    hashes = {}
+    for calendar in schedule:
+        for routine in calendar["calendar_routine"]:
+            payload = json.dumps(routine, sort_keys=True, ensure_ascii=False)
+            hashes[routine_key(calendar, routine)] = hashlib.sha1(
+                payload.encode("utf-8")
+            ).hexdigest()
+    return hashes
+
+
+def select_routines(schedule, keys):
+    """
+    Часть расписания, содержащая только рутины с указанными ключами
+    """
+    selected = []
+    for calendar in schedule:
+        routines = [
+            routine
+            for routine in calendar["calendar_routine"]
+            if routine_key(calendar, routine) in keys
+        ]
+        if routines:
+            selected.append({**calendar, "calendar_routine": routines})
+    return selected
+
+
+def calendar_ids(plan):
+    return {event.calendar_id for event in plan}
+
+
+class Daemon:
+    """
+    Резидентный режим планировщика.
+
+    Держит один прогретый NylasService с пулом keep-alive соединений,
+    следит за изменением файлов конфигурации и расписаний и применяет
+    только изменившиеся рутины, а полную сверку запускает раз в run_every
+    секунд. Раз в sweep_every секунд после полной сверки из календарей
+    удаляются будущие события, пропавшие из расписаний, в том числе из
+    календарей, убранных из них за время работы. С mirror_path календари
+    читаются из зеркала (см. mirror.py), которое между прогонами догружает
+    только изменения. Операции каждого расписания пишутся в журнал рядом
+    с его файлом (см. journal.py), и следующий прогон начинается с того,
+    что не выполнилось. С metrics_path после каждого прогона выгружаются
+    метрики вызовов API (см. metrics.py).
+
+    Всё это — триггеры на колесе таймеров (см. triggers.py): проверка
+    файлов, полная сверка и запуск каждой рутины в её apply_at в дни
+    повторения. Между срабатываниями демон спит. engine можно передать
+    общий на несколько демонов (например, по демону на пользователя) —
+    тогда ключи их триггеров различаются по config_path.
+    """
+
+    def __init__(
+        self,
+        config_path,
+        schedule_paths,
+        run_every: float = 900,
+        watch_every: float = 2,
+        max_workers: int = 8,
+        sweep_every: float = 86400,
+        mirror_path=None,
+        engine=None,
+        journal: bool = True,
+        metrics_path=None,
+        busy_calendars=None,
+        shift_conflicts: bool = False,
+    ):
+        self.config_path = config_path
+        self.schedule_paths = list(schedule_paths)
+        self.run_every = run_every
+        self.watch_every = watch_every
+        self.max_workers = max_workers
+        self.sweep_every = sweep_every
+        # Файл зеркала календарей; None — читать календари без зеркала
+        self.mirror_path = mirror_path
+        # Вести журнал операций каждого расписания рядом с его файлом
+        self.journal = journal
+        # Файл метрик вызовов API, переписываемый после каждого прогона
+        self.metrics_path = metrics_path
+        self.metrics = None
+        # Проверка конфликтов с занятостью (см. Scheduler.resolve_conflicts)
+        self.busy_calendars = busy_calendars
+        self.shift_conflicts = shift_conflicts
+        self.engine = TriggerEngine() if engine is None else engine
+        self.service = None
+        self.mtimes = {}
+        self.schedules = {}
+        self.hashes = {}
+        # Скомпилированные расписания и ключи рутин с триггерами по файлу
+        self.plans = {}
+        self.armed = {}
+        # Календари, убранные из расписаний: их ещё нужно вычистить
+        self.dropped = defaultdict(set)
+        self.next_sweep = 0.0
+
+    def trigger(self, *name):
+        return (self.config_path, *name)
+
+    def connect(self):
+        if self.service is not None:
+            self.service.close()
+        grant_id, api_key, api_uri = LoadConfig(self.config_path).load()
+        service = NylasService(
+            grant_id,
+            api_key,
+            api_uri,
+            pool_size=self.max_workers,
+            read_timeout=READ_TIMEOUT,
+        )
+        if self.metrics_path is not None:
+            # Метрики копятся через переподключения
+            if self.metrics is None:
+                self.metrics = InstrumentedService(service)
+            else:
+                self.metrics.service = service
+            service = self.metrics
+        self.service = GuardedService(service)
+        if self.mirror_path is not None:
+            self.service = MirroredService(self.service, self.mirror_path)
+
+    def changed_paths(self):
+        changed = []
+        for path in [self.config_path, *self.schedule_paths]:
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            if self.mtimes.get(path) != mtime:
+                self.mtimes[path] = mtime
+                changed.append(path)
+        return changed
+
+    def reload(self, path):
+        """
+        Перечитывает расписание и возвращает ключи изменившихся рутин
+        """
+        try:
+            schedule = LoadSchedule(path).load()
+        except ValueError as e:
+            logger.error(f"Schedule {path} is invalid, keeping previous | {e}")
+            return set()
+        hashes = routine_hashes(schedule)
+        previous = self.hashes.get(path, {})
+        self.schedules[path] = schedule
+        self.hashes[path] = hashes
+        return {key for key, value in hashes.items() if previous.get(key) != value}
+
+    def arm(self, path, now: float):
+        """
+        Назначает триггеры рутин расписания на их ближайший apply_at
+        и снимает триггеры рутин, которых в расписании больше нет
+        """
+        try:
+            plan = compile_schedule(self.schedules[path])
+        except ScheduleError as e:
+            logger.error(f"Schedule {path} does not compile, triggers kept | {e}")
+            return
+        if path in self.plans:
+            self.dropped[path] |= calendar_ids(self.plans[path]) - calendar_ids(plan)
+        self.plans[path] = plan
+        keys = set(plan.apply_at)
+        for key in self.armed.get(path, set()) - keys:
+            self.engine.cancel(self.trigger(path, *key))
+        for key in keys:
+            self.arm_routine(path, key, now)
+        self.armed[path] = keys
+
+    def arm_routine(self, path, key, after: float):
+        when = next_apply(self.plans[path], key, datetime.fromtimestamp(after))
+        if when is None:
+            self.engine.cancel(self.trigger(path, *key))
+        else:
+            self.engine.schedule(
+                self.trigger(path, *key), when, self.routine_due, path, key, when
+            )
+
+    def scheduler(self, path, schedule):
+        return Scheduler(
+            self.service,
+            schedule,
+            max_workers=self.max_workers,
+            journal=OperationJournal(journal_path(path)) if self.journal else None,
+            schedule_id=schedule_name(path),
+            busy_calendars=self.busy_calendars,
+            shift_conflicts=self.shift_conflicts,
+        )
+
+    def apply(self, path, schedule):
+        scheduler = self.scheduler(path, schedule)
+        try:
+            results = scheduler.reconcile_routine()
+            for conflict in scheduler.conflicts:
+                logger.warning(f"Schedule {path} | {conflict}")
+            return self.report(results, scheduler.lead)
+        finally:
+            self.export_metrics()
+
+    def sweep(self, path):
+        dropped = set(self.dropped[path])
+        try:
+            results = self.scheduler(path, self.schedules[path]).sweep(dropped)
+            if all(result.ok for result in results):
+                self.dropped[path] -= dropped
+            return self.report(results)
+        finally:
+            self.export_metrics()
+
+    def export_metrics(self):
+        if self.metrics is not None:
+            self.metrics.write(self.metrics_path)
+
+    def report(self, results, lead=None):
+        failed = [result for result in results if not result.ok]
+        logger.info(f"Applied {len(results)} operations, {len(failed)} failed")
+        if lead is not None:
+            logger.info(
+                f"Lead time: min {lead['min']:.0f}s, median {lead['median']:.0f}s, "
+                f"late {lead['late']}"
+            )
+        for result in failed:
+            logger.error(f"{result.operation} | {result.error}")
+        return results
+
+    def start(self, now: float):
+        """
+        Назначает проверку файлов и первую полную сверку на now
+        """
+        self.engine.schedule(self.trigger("watch"), now, self.watch)
+        self.engine.schedule(self.trigger("full"), now, self.full_run)
+
+    def watch(self):
+        now = self.engine.now
+        # Следующий запуск назначается до работы: сбой не останавливает цикл
+        self.engine.schedule(self.trigger("watch"), now + self.watch_every, self.watch)
+        changed = self.changed_paths()
+        if self.config_path in changed:
+            self.connect()
+        full = self.engine.due(self.trigger("full"))
+        for path in changed:
+            if path == self.config_path:
+                continue
+            keys = self.reload(path)
+            if path in self.schedules:
+                self.arm(path, now)
+            if keys and full is not None and now < full:
+                logger.info(f"Schedule {path} changed | routines: {sorted(keys)}")
+                self.apply(path, select_routines(self.schedules[path], keys))
+
+    def full_run(self):
+        now = self.engine.now
+        self.engine.schedule(self.trigger("full"), now + self.run_every, self.full_run)
+        for path, schedule in self.schedules.items():
+            self.apply(path, schedule)
+        if now >= self.next_sweep:
+            for path in self.schedules:
+                self.sweep(path)
+            self.next_sweep = now + self.sweep_every
+
+    def routine_due(self, path, key, when: float):
+        """
+        Наступил apply_at рутины: применяет её и назначает следующий
+        """
+        schedule = self.schedules.get(path)
+        if schedule is None:
+            return
+        self.arm_routine(path, key, when)
+        logger.info(f"Routine {key} is due | {path}")
+        self.apply(path, select_routines(schedule, {key}))
+
+    def tick(self, now: float):
+        """
+        Выполняет триггеры, наступившие к now
+        """
+        return self.engine.fire(now)
+
+    def run_forever(self):
+        self.start(time.time())
+        self.engine.run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scheduler daemon")
+    parser.add_argument("--config", default="./config/config.json")
+    parser.add_argument("--schedule", nargs="+", default=["./config/schedule.json"])
+    parser.add_argument("--run-every", type=float, default=900)
+    parser.add_argument("--watch-every", type=float, default=2)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--sweep-every", type=float, default=86400)
+    parser.add_argument("--mirror", default=None, help="calendar mirror JSON path")
+    parser.add_argument(
+        "--no-journal", action="store_true", help="run without operation journals"
+    )
+    parser.add_argument(
+        "--busy",
+        nargs="*",
+        default=None,
+        metavar="CALENDAR_ID",
+        help="check events against busy time of these calendars and their own",
+    )
+    parser.add_argument(
+        "--shift-conflicts",
+        action="store_true",
+        help="move flexible events out of busy time",
+    )
+    parser.add_argument(
+        "--metrics",
+        default=None,
+        help="API call metrics file rewritten after each run (.json or Prometheus)",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    Daemon(
+        args.config,
+        args.schedule,
+        args.run_every,
+        args.watch_every,
+        args.workers,
+        args.sweep_every,
+        args.mirror,
+        journal=not args.no_journal,
+        metrics_path=args.metrics,
+        busy_calendars=(
+            [] if args.busy is None and args.shift_conflicts else args.busy
+        ),
+        shift_conflicts=args.shift_conflicts,
+    ).run_forever()
+
+
+if __name__ == "__main__":
+    main()
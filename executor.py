@@ -0,0 +1,245 @@
+import heapq
+import itertools
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class OperationResult:
+    """
+    Результат выполнения одной операции над календарём.
+
+    deadline — время начала события операции, finished — время
+    завершения операции; lead_time — насколько раньше начала события
+    операция была выполнена (отрицательное — опоздала)
+    """
+
+    def __init__(
+        self,
+        operation,
+        result=None,
+        error=None,
+        skipped=False,
+        deadline=None,
+        finished=None,
+    ):
+        self.operation = operation
+        self.result = result
+        self.error = error
+        self.skipped = skipped
+        self.deadline = deadline
+        self.finished = time.time() if finished is None else finished
+
+    @property
+    def ok(self):
+        return self.error is None and not self.skipped
+
+    @property
+    def lead_time(self):
+        if self.deadline is None:
+            return None
+        return self.deadline - self.finished
+
+    def __repr__(self):
+        status = "skipped" if self.skipped else ("error" if self.error else "ok")
+        return f"OperationResult({self.operation!r}, {status})"
+
+
+class Chain:
+    """
+    Последовательность операций с одним ключом. Приоритет цепочки —
+    самый ранний срок её операций
+    """
+
+    def __init__(self, key, seq):
+        self.key = key
+        self.seq = seq
+        self.steps = []
+        self.deadline = float("inf")
+
+    def add(self, operation, fn, args, deadline):
+        self.steps.append((operation, fn, args, deadline))
+        if deadline is not None:
+            self.deadline = min(self.deadline, deadline)
+
+    def __lt__(self, other):
+        return (self.deadline, self.seq) < (other.deadline, other.seq)
+
+
+class OperationExecutor:
+    """
+    Выполняет операции над календарём параллельно с ограничением числа потоков.
+
+    Операции с одинаковым ключом (например, удаление и повторное создание
+    одного события) выполняются последовательно в порядке добавления,
+    операции с разными ключами выполняются параллельно. Если операция
+    в цепочке падает, оставшиеся операции этой цепочки пропускаются.
+
+    Цепочки ждут в очереди с приоритетом по сроку (deadline, обычно
+    начало события): освободившийся поток берёт самую срочную цепочку,
+    так что события ближайших минут создаются раньше далёких, даже если
+    добавлены позже или упираются в лимит запросов. Цепочки без срока
+    выполняются последними в порядке добавления.
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self.max_workers = max_workers
+        self.chains = {}
+        self.queue = []
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+
+    def submit(self, key, operation, fn, *args, deadline=None):
+        """
+        Добавляет операцию. Можно вызывать и во время run(): ещё не
+        начатые цепочки переупорядочиваются по новому сроку
+        """
+        with self.lock:
+            chain = self.chains.get(key)
+            if chain is None:
+                chain = self.chains[key] = Chain(key, next(self.counter))
+                chain.add(operation, fn, args, deadline)
+                heapq.heappush(self.queue, chain)
+                return
+            previous = chain.deadline
+            chain.add(operation, fn, args, deadline)
+            if chain.deadline != previous and chain in self.queue:
+                heapq.heapify(self.queue)
+
+    def next_chain(self):
+        with self.lock:
+            if not self.queue:
+                return None
+            return heapq.heappop(self.queue)
+
+    def drain(self):
+        with self.lock:
+            chains = sorted(self.queue)
+            self.queue = []
+            return chains
+
+    def run(self):
+        with self.lock:
+            size = len(self.queue)
+        if not size:
+            return []
+        if self.max_workers <= 1:
+            done = self.work()
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, size)) as pool:
+                futures = [
+                    pool.submit(self.work) for _ in range(min(self.max_workers, size))
+                ]
+                done = [chain for future in futures for chain in future.result()]
+        return self.collect(done)
+
+    def work(self):
+        """
+        Цикл потока: выполняет самые срочные цепочки, пока очередь не пуста
+        """
+        done = []
+        while True:
+            chain = self.next_chain()
+            if chain is None:
+                return done
+            chain.results = self.run_chain(chain)
+            done.append(chain)
+
+    @staticmethod
+    def collect(chains):
+        """
+        Результаты в порядке добавления цепочек
+        """
+        chains = sorted(chains, key=lambda chain: chain.seq)
+        return [result for chain in chains for result in chain.results]
+
+    async def arun(self):
+        """
+        Асинхронный вариант run для корутинных функций: цепочки выполняются
+        через asyncio.gather, не больше max_workers одновременно, и
+        занимают семафор в порядке срока
+        """
+        # asyncio загружается только асинхронными прогонами: он заметно
+        # замедляет запуск CLI
+        import asyncio
+
+        chains = self.drain()
+        semaphore = asyncio.Semaphore(max(1, self.max_workers))
+
+        async def run_chain(chain):
+            async with semaphore:
+                chain.results = await self.arun_chain(chain)
+
+        await asyncio.gather(*(run_chain(chain) for chain in chains))
+        return self.collect(chains)
+
+    def steps(self, chain):
+        """
+        Шаги цепочки; пока цепочка выполняется, в неё можно добавлять операции.
+        Выполненная цепочка убирается, и следующая операция с её ключом
+        начинает новую цепочку
+        """
+        i = 0
+        while True:
+            with self.lock:
+                if i >= len(chain.steps):
+                    if self.chains.get(chain.key) is chain:
+                        del self.chains[chain.key]
+                    return
+                step = chain.steps[i]
+            yield step
+            i += 1
+
+    async def arun_chain(self, chain):
+        results = []
+        failed = False
+        for operation, fn, args, deadline in self.steps(chain):
+            if failed:
+                results.append(
+                    OperationResult(operation, skipped=True, deadline=deadline)
+                )
+                continue
+            try:
+                result = await fn(*args)
+                results.append(OperationResult(operation, result, deadline=deadline))
+            except Exception as e:
+                failed = True
+                results.append(OperationResult(operation, error=e, deadline=deadline))
+        return results
+
+    def run_chain(self, chain):
+        results = []
+        failed = False
+        for operation, fn, args, deadline in self.steps(chain):
+            if failed:
+                results.append(
+                    OperationResult(operation, skipped=True, deadline=deadline)
+                )
+                continue
+            try:
+                result = fn(*args)
+                results.append(OperationResult(operation, result, deadline=deadline))
+            except Exception as e:
+                failed = True
+                results.append(OperationResult(operation, error=e, deadline=deadline))
+        return results
+
+
+def lead_report(results):
+    """
+    Сводка опережения по выполненным операциям со сроком: минимум, медиана
+    и число операций, выполненных уже после начала события
+    """
+    leads = [
+        result.lead_time
+        for result in results
+        if result.ok and result.lead_time is not None
+    ]
+    if not leads:
+        return None
+    return {
+        "min": min(leads),
+        "median": statistics.median(leads),
+        "late": sum(lead < 0 for lead in leads),
+    }
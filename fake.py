@@ -0,0 +1,360 @@
+import itertools
+import json
+import random
+import threading
+import time
+from collections import Counter, deque
+
+from service import CalendarService, build_reminders
+
+
+class FakeApiError(Exception):
+    """
+    Ошибка фейкового провайдера, повторяющая атрибуты ошибок Nylas
+    """
+
+    def __init__(self, message, status_code, headers=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeWhen:
+    def __init__(self, start_time, end_time):
+        self.start_time = start_time
+        self.end_time = end_time
+
+
+class FakeReminderOverride:
+    def __init__(self, reminder_minutes, reminder_method="display"):
+        self.reminder_minutes = reminder_minutes
+        self.reminder_method = reminder_method
+
+
+class FakeReminders:
+    def __init__(self, use_default, overrides=None):
+        self.use_default = use_default
+        self.overrides = overrides
+
+    @classmethod
+    def from_request(cls, body):
+        overrides = [
+            FakeReminderOverride(**override) for override in body.get("overrides", [])
+        ]
+        return cls(body.get("use_default", True), overrides)
+
+
+class FakeEvent:
+    def __init__(self, event_id, calendar_id, title, when, reminders, metadata=None):
+        self.id = event_id
+        self.calendar_id = calendar_id
+        self.title = title
+        self.when = when
+        self.reminders = reminders
+        self.metadata = metadata or {}
+        self.updated_at = int(time.time())
+        self.busy = True
+        self.status = "confirmed"
+
+
+class FakeResponse:
+    def __init__(self, data, next_cursor=None):
+        self.data = data
+        self.next_cursor = next_cursor
+
+
+class FakeCalendarService(CalendarService):
+    """
+    Календарь в памяти с семантикой NylasService для тестов и бенчмарков.
+
+    latency и jitter задают задержку каждого вызова в секундах,
+    error_rate — долю вызовов, падающих с ошибкой 500, rate_limit —
+    число вызовов в секунду, сверх которого возвращается 429.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit: float = None,
+        page_size: int = 50,
+        seed: int = None,
+        throttle=None,
+    ):
+        self.grant_id = "fake"
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.page_size = page_size
+        self.random = random.Random(seed)
+        self.throttle = throttle
+        self.events = {}
+        self.calls = Counter()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.window = deque()
+
+    @property
+    def stats(self):
+        return dict(self.throttle.stats) if self.throttle else {}
+
+    def call(self, name, fn, *args, idempotent=True):
+        if self.throttle is None:
+            return self.simulate(name, fn, *args)
+        return self.throttle.call(self.simulate, name, fn, *args, idempotent=idempotent)
+
+    def simulate(self, name, fn, *args):
+        with self.lock:
+            self.calls[name] += 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            failed = self.random.random() < self.error_rate
+            limited = self.limited()
+        if delay:
+            time.sleep(delay)
+        if limited:
+            with self.lock:
+                self.calls["rate_limited"] += 1
+            raise FakeApiError("Too many requests", 429, {"Retry-After": "1"})
+        if failed:
+            with self.lock:
+                self.calls["errors"] += 1
+            raise FakeApiError("Internal error", 500)
+        with self.lock:
+            return fn(*args)
+
+    def limited(self):
+        if self.rate_limit is None:
+            return False
+        now = time.monotonic()
+        while self.window and now - self.window[0] >= 1.0:
+            self.window.popleft()
+        if len(self.window) >= self.rate_limit:
+            return True
+        self.window.append(now)
+        return False
+
+    def create_event(self, request_body, reminders, calendar_id):
+        return self.call(
+            "create_event",
+            self._create,
+            dict(request_body),
+            reminders,
+            calendar_id,
+            idempotent=False,
+        )
+
+    def update_event(self, event_id, request_body, reminders, calendar_id):
+        return self.call(
+            "update_event",
+            self._update,
+            event_id,
+            dict(request_body),
+            reminders,
+            calendar_id,
+        )
+
+    def delete_event(self, event_id, calendar_id):
+        return self.call("delete_event", self._delete, event_id, calendar_id)
+
+    def search_events(self, query_params):
+        return self.call("search_events", self._list, dict(query_params))
+
+    def _create(self, request_body, reminders, calendar_id):
+        event = FakeEvent(
+            str(next(self.ids)),
+            calendar_id,
+            request_body["title"],
+            FakeWhen(**request_body["when"]),
+            FakeReminders.from_request(build_reminders(reminders)),
+            request_body.get("metadata"),
+        )
+        self.events[event.id] = event
+        return FakeResponse(event)
+
+    def _update(self, event_id, request_body, reminders, calendar_id):
+        event = self.get(event_id, calendar_id)
+        if "when" in request_body:
+            event.when = FakeWhen(**request_body["when"])
+        if "title" in request_body:
+            event.title = request_body["title"]
+        if "metadata" in request_body:
+            event.metadata = request_body["metadata"]
+        if reminders is not None:
+            event.reminders = FakeReminders.from_request(build_reminders(reminders))
+        event.updated_at = int(time.time())
+        return FakeResponse(event)
+
+    def _delete(self, event_id, calendar_id):
+        self.get(event_id, calendar_id)
+        del self.events[event_id]
+        return FakeResponse(None)
+
+    def _list(self, query_params):
+        matched = [
+            event
+            for event in self.events.values()
+            if event.calendar_id == query_params["calendar_id"]
+            and query_params.get("title", event.title) == event.title
+            and event.when.start_time >= query_params.get("start", 0)
+            and event.when.end_time <= query_params.get("end", float("inf"))
+            and self.metadata_match(event, query_params.get("metadata_pair"))
+        ]
+        offset = int(query_params.get("page_token") or 0)
+        limit = min(query_params.get("limit", self.page_size), self.page_size)
+        page = matched[offset : offset + limit]
+        cursor = str(offset + limit) if offset + limit < len(matched) else None
+        return FakeResponse(page, cursor)
+
+    @staticmethod
+    def metadata_match(event, pair):
+        if pair is None:
+            return True
+        key, _, value = pair.partition(":")
+        return event.metadata.get(key) == value
+
+    def get(self, event_id, calendar_id):
+        event = self.events.get(event_id)
+        if event is None or event.calendar_id != calendar_id:
+            raise FakeApiError("Event not found", 404)
+        return event
+
+
+class ReplayCalendarService(CalendarService):
+    """
+    Провайдер, проигрывающий записанную историю изменений календарей,
+    для проверки инкрементальной синхронизации без сети.
+
+    История — список версий событий в порядке изменения или путь
+    к JSON-файлу с таким списком. Версия — {"id", "calendar_id", "title",
+    "start", "end", "updated_at"} и необязательные "reminders" (минуты),
+    "metadata", "busy", "status"; status "cancelled" означает удаление.
+    Видны версии с updated_at не позже clock, advance() проигрывает
+    историю дальше. Изменения через API дописываются в историю с
+    текущим clock. Запросы понимают параметры FakeCalendarService,
+    а также updated_after и show_cancelled.
+    """
+
+    def __init__(self, history, clock=None, page_size: int = 50):
+        if isinstance(history, str):
+            with open(history, "r", encoding="utf-8") as file:
+                history = json.load(file)
+        self.grant_id = "replay"
+        self.history = [dict(version) for version in history]
+        if clock is None:
+            clock = max((version["updated_at"] for version in self.history), default=0)
+        self.clock = clock
+        self.page_size = page_size
+        self.calls = Counter()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def now(self):
+        return self.clock
+
+    def advance(self, clock):
+        self.clock = clock
+
+    def current(self):
+        """
+        Последние видимые версии событий по id
+        """
+        versions = {}
+        for version in self.history:
+            if version["updated_at"] <= self.clock:
+                versions[version["id"]] = version
+        return versions
+
+    @staticmethod
+    def event(version):
+        event = FakeEvent(
+            version["id"],
+            version["calendar_id"],
+            version["title"],
+            FakeWhen(version["start"], version["end"]),
+            version.get("reminders"),
+            version.get("metadata"),
+        )
+        event.updated_at = version["updated_at"]
+        event.busy = version.get("busy", True)
+        event.status = version.get("status", "confirmed")
+        return event
+
+    def record(self, version):
+        version["updated_at"] = self.clock
+        self.history.append(version)
+        return FakeResponse(self.event(version))
+
+    def search_events(self, query_params):
+        with self.lock:
+            self.calls["search_events"] += 1
+            pair = query_params.get("metadata_pair")
+            key, _, value = (pair or "").partition(":")
+            matched = [
+                version
+                for version in self.current().values()
+                if version["calendar_id"] == query_params["calendar_id"]
+                and query_params.get("title", version["title"]) == version["title"]
+                and version["start"] >= query_params.get("start", 0)
+                and version["end"] <= query_params.get("end", float("inf"))
+                and version["updated_at"] > query_params.get("updated_after", -1)
+                and (
+                    version.get("status") != "cancelled"
+                    or query_params.get("show_cancelled")
+                )
+                and (pair is None or (version.get("metadata") or {}).get(key) == value)
+            ]
+        matched.sort(key=lambda version: (version["start"], version["id"]))
+        offset = int(query_params.get("page_token") or 0)
+        limit = min(query_params.get("limit", self.page_size), self.page_size)
+        cursor = str(offset + limit) if offset + limit < len(matched) else None
+        page = [self.event(version) for version in matched[offset : offset + limit]]
+        return FakeResponse(page, cursor)
+
+    def get(self, event_id, calendar_id):
+        version = self.current().get(event_id)
+        if (
+            version is None
+            or version["calendar_id"] != calendar_id
+            or version.get("status") == "cancelled"
+        ):
+            raise FakeApiError("Event not found", 404)
+        return version
+
+    def create_event(self, request_body, reminders, calendar_id):
+        with self.lock:
+            self.calls["create_event"] += 1
+            return self.record(
+                {
+                    "id": f"replay-{next(self.ids)}",
+                    "calendar_id": calendar_id,
+                    "title": request_body["title"],
+                    "start": request_body["when"]["start_time"],
+                    "end": request_body["when"]["end_time"],
+                    "reminders": list(reminders or []),
+                    "metadata": request_body.get("metadata") or {},
+                }
+            )
+
+    def update_event(self, event_id, request_body, reminders, calendar_id):
+        with self.lock:
+            self.calls["update_event"] += 1
+            version = dict(self.get(event_id, calendar_id))
+            if "when" in request_body:
+                version["start"] = request_body["when"]["start_time"]
+                version["end"] = request_body["when"]["end_time"]
+            if "title" in request_body:
+                version["title"] = request_body["title"]
+            if "metadata" in request_body:
+                version["metadata"] = request_body["metadata"]
+            if reminders is not None:
+                version["reminders"] = list(reminders)
+            return self.record(version)
+
+    def delete_event(self, event_id, calendar_id):
+        with self.lock:
+            self.calls["delete_event"] += 1
+            version = dict(self.get(event_id, calendar_id), status="cancelled")
+            self.record(version)
+            return FakeResponse(None)
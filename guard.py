@@ -0,0 +1,284 @@
+import json
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+
+from service import CalendarService
+from throttle import attempt_guard
+
+# Таймаут чтения клиентов за автоматом: зависший провайдер должен
+# засчитываться сбоем быстрее таймаута SDK по умолчанию (90 секунд)
+READ_TIMEOUT = 20.0
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Вызов отклонён без обращения к провайдеру: автомат разомкнут
+    """
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"Circuit {name} is open, retry in {retry_in:.1f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Автомат отключения вызовов к неисправному провайдеру.
+
+    После failure_threshold сбоев подряд автомат размыкается и reset_timeout
+    секунд отклоняет вызовы сразу. Затем пропускает один пробный вызов
+    (полуоткрытое состояние): успех замыкает автомат, сбой снова размыкает.
+    Сбоем считаются только ошибки провайдера (5xx, таймауты, обрывы) —
+    ответ 4xx означает, что провайдер работает.
+    """
+
+    def __init__(self, name, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def before(self):
+        with self.lock:
+            if self.state == OPEN:
+                retry_in = self.opened + self.reset_timeout - time.monotonic()
+                if retry_in > 0:
+                    raise CircuitOpenError(self.name, retry_in)
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN:
+                if self.probing:
+                    raise CircuitOpenError(self.name, 0.0)
+                self.probing = True
+
+    def success(self):
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened = time.monotonic()
+
+    def release(self):
+        with self.lock:
+            self.probing = False
+
+    def call(self, fn, *args, is_failure=lambda error: True):
+        self.before()
+        try:
+            result = fn(*args)
+        except Exception as e:
+            if is_failure(e):
+                self.failure()
+            else:
+                self.success()
+            raise
+        finally:
+            # Прерванный пробный вызов (KeyboardInterrupt, отмена) не должен
+            # оставлять автомат полуоткрытым навсегда
+            self.release()
+        self.success()
+        return result
+
+
+# Общие автоматы на grant и метод API: все клиенты одного пользователя
+# видят одно состояние провайдера
+breakers = {}
+breakers_lock = threading.Lock()
+
+
+def grant_breaker(grant_id, endpoint, failure_threshold=5, reset_timeout=30.0):
+    with breakers_lock:
+        key = (grant_id, endpoint)
+        if key not in breakers:
+            breakers[key] = CircuitBreaker(
+                f"{grant_id}/{endpoint}", failure_threshold, reset_timeout
+            )
+        return breakers[key]
+
+
+class GuardedService(CalendarService):
+    """
+    Прослойка перед CalendarService: объединение чтений и автоматы отключения.
+
+    Одинаковые search_events, выполняющиеся одновременно, превращаются
+    в один запрос к провайдеру, а его ответ ещё ttl секунд отдаётся
+    повторным запросам. Изменение событий календаря сбрасывает сохранённые
+    ответы по этому календарю. Каждый метод API идёт через свой автомат
+    на grant, поэтому при отказе провайдера прогон быстро получает
+    CircuitOpenError вместо ожидания таймаутов. У сервиса с Throttle
+    автомат считает каждую попытку, и повторы прекращаются, как только
+    он разомкнулся.
+    """
+
+    def __init__(
+        self,
+        service: CalendarService,
+        ttl: float = 2.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        failure_errors=None,
+    ):
+        self.service = service
+        self.grant_id = getattr(service, "grant_id", None)
+        self.ttl = ttl
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        throttle = getattr(service, "throttle", None)
+        # С Throttle автомат проверяется на каждой попытке внутри цикла
+        # повторов, иначе — на весь вызов
+        self.throttled = throttle is not None
+        if failure_errors is None:
+            failure_errors = getattr(throttle, "transient_errors", ())
+        self.failure_errors = (TimeoutError, ConnectionError, *failure_errors)
+        self.inflight = {}
+        self.recent = {}
+        self.keys = defaultdict(set)
+        self.generation = defaultdict(int)
+        self.counters = {"coalesced": 0, "cached": 0, "rejected": 0}
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.service, name)
+
+    @property
+    def stats(self):
+        return {**(getattr(self.service, "stats", None) or {}), **self.counters}
+
+    def is_failure(self, error):
+        status = getattr(error, "status_code", None)
+        if status is not None:
+            return status >= 500
+        return isinstance(error, self.failure_errors)
+
+    def guarded(self, endpoint, fn, *args):
+        breaker = grant_breaker(
+            self.grant_id, endpoint, self.failure_threshold, self.reset_timeout
+        )
+        try:
+            if self.throttled:
+
+                def attempt(call, *call_args):
+                    return breaker.call(call, *call_args, is_failure=self.is_failure)
+
+                token = attempt_guard.set(attempt)
+                try:
+                    return fn(*args)
+                finally:
+                    attempt_guard.reset(token)
+            return breaker.call(fn, *args, is_failure=self.is_failure)
+        except CircuitOpenError:
+            with self.lock:
+                self.counters["rejected"] += 1
+            raise
+
+    def invalidate(self, calendar_id):
+        """
+        Забывает ответы и незавершённые чтения календаря после его изменения
+        """
+        with self.lock:
+            self.generation[calendar_id] += 1
+            for key in self.keys.pop(calendar_id, ()):
+                self.recent.pop(key, None)
+                self.inflight.pop(key, None)
+
+    def create_event(self, request_body, reminders, calendar_id):
+        try:
+            return self.guarded(
+                "create_event",
+                self.service.create_event,
+                request_body,
+                reminders,
+                calendar_id,
+            )
+        finally:
+            self.invalidate(calendar_id)
+
+    def update_event(self, event_id, request_body, reminders, calendar_id):
+        try:
+            return self.guarded(
+                "update_event",
+                self.service.update_event,
+                event_id,
+                request_body,
+                reminders,
+                calendar_id,
+            )
+        finally:
+            self.invalidate(calendar_id)
+
+    def delete_event(self, event_id, calendar_id):
+        try:
+            return self.guarded(
+                "delete_event", self.service.delete_event, event_id, calendar_id
+            )
+        finally:
+            self.invalidate(calendar_id)
+
+    def search_events(self, query_params):
+        key = json.dumps(query_params, sort_keys=True, default=str)
+        calendar_id = query_params.get("calendar_id")
+        with self.lock:
+            now = time.monotonic()
+            cached = self.recent.get(key)
+            if cached is not None and cached[0] > now:
+                self.counters["cached"] += 1
+                return cached[1]
+            future = self.inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self.inflight[key] = Future()
+                self.keys[calendar_id].add(key)
+                generation = self.generation[calendar_id]
+            else:
+                self.counters["coalesced"] += 1
+        if not owner:
+            return future.result()
+        try:
+            response = self.guarded(
+                "search_events", self.service.search_events, query_params
+            )
+        except BaseException as e:
+            with self.lock:
+                if self.inflight.get(key) is future:
+                    del self.inflight[key]
+            future.set_exception(e)
+            raise
+        with self.lock:
+            if self.inflight.get(key) is future:
+                del self.inflight[key]
+            # Ответ, полученный до изменения календаря, не сохраняем
+            if self.generation[calendar_id] == generation:
+                self.prune(now)
+                self.recent[key] = (time.monotonic() + self.ttl, response)
+                self.keys[calendar_id].add(key)
+        future.set_result(response)
+        return response
+
+    def prune(self, now):
+        if len(self.recent) < 1024:
+            return
+        for key, (expires, _) in list(self.recent.items()):
+            if expires <= now:
+                del self.recent[key]
+
+    def page_query(self, query_params, page_size, select=None):
+        return self.service.page_query(query_params, page_size, select)
+
+    def flush(self):
+        return self.service.flush()
@@ -0,0 +1,461 @@
+import argparse
+import bisect
+import calendar
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from service import CalendarService
+
+PRODID = "-//scheduler//ics//RU"
+# Строки iCalendar сворачиваются по 75 октетов (RFC 5545, 3.1)
+LINE_LIMIT = 75
+TRIGGER = re.compile(
+    r"^-P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$"
+)
+DURATION = re.compile(
+    r"^\+?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$"
+)
+METADATA_PREFIX = "X-SCHEDULER-"
+
+
+class IcsError(LookupError):
+    """
+    Ошибка файлового календаря: неизвестное событие
+    """
+
+    status_code = 404
+
+
+class IcsWhen:
+    __slots__ = ("start_time", "end_time")
+
+    def __init__(self, start_time, end_time):
+        self.start_time = start_time
+        self.end_time = end_time
+
+
+class IcsEvent:
+    """
+    Событие файлового календаря. reminders — кортеж минут до начала
+    """
+
+    __slots__ = ("id", "calendar_id", "title", "when", "reminders", "metadata")
+
+    def __init__(self, event_id, calendar_id, title, when, reminders=(), metadata=None):
+        self.id = event_id
+        self.calendar_id = calendar_id
+        self.title = title
+        self.when = when
+        self.reminders = tuple(reminders)
+        self.metadata = metadata or {}
+
+
+class IcsResponse:
+    def __init__(self, data, next_cursor=None):
+        self.data = data
+        self.next_cursor = next_cursor
+
+
+def escape(text):
+    return (
+        text.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\n", "\\n")
+    )
+
+
+def unescape(text):
+    return re.sub(
+        r"\\(.)",
+        lambda match: "\n" if match.group(1) in "nN" else match.group(1),
+        text,
+    )
+
+
+def fold(line):
+    """
+    Сворачивает строку по LINE_LIMIT октетов, не разрывая символы UTF-8
+    """
+    if len(line.encode("utf-8")) <= LINE_LIMIT:
+        return line
+    parts, current, size = [], [], 0
+    for char in line:
+        width = len(char.encode("utf-8"))
+        limit = LINE_LIMIT if not parts else LINE_LIMIT - 1
+        if size + width > limit:
+            parts.append("".join(current))
+            current, size = [], 0
+        current.append(char)
+        size += width
+    parts.append("".join(current))
+    return "\r\n ".join(parts)
+
+
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def parse_time(value, params):
+    """
+    Время iCalendar в timestamp или None для значений-дат (весь день)
+    """
+    if "VALUE=DATE" in params or len(value) == 8:
+        return None
+    if value.endswith("Z"):
+        return calendar.timegm(time.strptime(value, "%Y%m%dT%H%M%SZ"))
+    # Время без зоны или с TZID считаем локальным
+    return int(time.mktime(time.strptime(value, "%Y%m%dT%H%M%S")))
+
+
+def parse_trigger(value):
+    match = TRIGGER.match(value)
+    if match is None:
+        return None
+    weeks, days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return ((weeks * 7 + days) * 24 + hours) * 60 + minutes + seconds // 60
+
+
+def parse_duration(value):
+    """
+    Длительность DURATION в секундах или None
+    """
+    match = DURATION.match(value)
+    if match is None:
+        return None
+    weeks, days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return (((weeks * 7 + days) * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def event_end(event):
+    """
+    Конец события из DTEND, DTSTART + DURATION или, без них, его начало
+    (RFC 5545, 3.6.1)
+    """
+    start = event.get("start")
+    if event.get("end") is not None or start is None:
+        return event.get("end")
+    return start + (event.get("duration") or 0)
+
+
+def format_event(event, stamp):
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{event.id}",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART:{format_time(event.when.start_time)}",
+        f"DTEND:{format_time(event.when.end_time)}",
+        f"SUMMARY:{escape(event.title)}",
+    ]
+    for key, value in sorted(event.metadata.items()):
+        lines.append(f"{METADATA_PREFIX}{key.upper()}:{escape(str(value))}")
+    for minutes in event.reminders:
+        lines += [
+            "BEGIN:VALARM",
+            "ACTION:DISPLAY",
+            f"DESCRIPTION:{escape(event.title)}",
+            f"TRIGGER:-PT{minutes}M",
+            "END:VALARM",
+        ]
+    lines.append("END:VEVENT")
+    return lines
+
+
+def parse_calendar(text, calendar_id):
+    """
+    События из текста iCalendar. Повторяющиеся события не разворачиваются
+    """
+    events = []
+    event = alarm = None
+    text = text.replace("\r\n", "\n").replace("\n ", "").replace("\n\t", "")
+    for line in text.splitlines():
+        name, _, value = line.partition(":")
+        name, _, params = name.partition(";")
+        name = name.upper()
+        if name == "BEGIN" and value == "VEVENT":
+            event = {"reminders": [], "metadata": {}}
+        elif name == "BEGIN" and value == "VALARM":
+            alarm = {}
+        elif name == "END" and value == "VALARM":
+            if event is not None and alarm.get("trigger") is not None:
+                event["reminders"].append(alarm["trigger"])
+            alarm = None
+        elif name == "END" and value == "VEVENT":
+            events.append(
+                IcsEvent(
+                    event.get("uid") or uuid.uuid4().hex,
+                    calendar_id,
+                    event.get("summary", ""),
+                    IcsWhen(event.get("start"), event_end(event)),
+                    event["reminders"],
+                    event["metadata"],
+                )
+            )
+            event = None
+        elif alarm is not None:
+            if name == "TRIGGER":
+                alarm["trigger"] = parse_trigger(value)
+        elif event is not None:
+            if name == "UID":
+                event["uid"] = value
+            elif name == "SUMMARY":
+                event["summary"] = unescape(value)
+            elif name == "DTSTART":
+                event["start"] = parse_time(value, params)
+            elif name == "DTEND":
+                event["end"] = parse_time(value, params)
+            elif name == "DURATION":
+                event["duration"] = parse_duration(value)
+            elif name.startswith(METADATA_PREFIX):
+                key = name[len(METADATA_PREFIX) :].lower()
+                event["metadata"][key] = unescape(value)
+    return events
+
+
+class IcsCalendar:
+    """
+    События одного календаря в памяти с индексами по времени начала
+    и по парам метаданных
+    """
+
+    def __init__(self, calendar_id, events=()):
+        self.calendar_id = calendar_id
+        self.events = {}
+        self.starts = []
+        self.metadata = defaultdict(set)
+        for event in events:
+            self.add(event)
+
+    def start_key(self, event):
+        start = event.when.start_time
+        return (float("-inf") if start is None else start, event.id)
+
+    def add(self, event):
+        self.events[event.id] = event
+        bisect.insort(self.starts, self.start_key(event))
+        for pair in event.metadata.items():
+            self.metadata[pair].add(event.id)
+
+    def remove(self, event_id):
+        event = self.events.pop(event_id)
+        key = self.start_key(event)
+        del self.starts[bisect.bisect_left(self.starts, key)]
+        for pair in event.metadata.items():
+            self.metadata[pair].discard(event.id)
+        return event
+
+    def window(self, start=None, end=None):
+        """
+        События, начинающиеся не раньше start, в порядке начала.
+        С границей start или end события без времени начала (на весь день)
+        пропускаются
+        """
+        lo = 0 if start is None else bisect.bisect_left(self.starts, (start, ""))
+        for _, event_id in self.starts[lo:]:
+            event = self.events[event_id]
+            if end is not None:
+                if event.when.start_time is None:
+                    continue
+                if event.when.start_time >= end:
+                    break
+            yield event
+
+
+def ends_by(event, end):
+    event_end = event.when.end_time
+    if event_end is None:
+        event_end = event.when.start_time
+    return event_end <= end
+
+
+class IcsCalendarService(CalendarService):
+    """
+    CalendarService поверх каталога файлов iCalendar: по файлу
+    <calendar_id>.ics на календарь.
+
+    Календари читаются с диска один раз и дальше обслуживаются из памяти
+    с индексами по времени и метаданным. Изменения копятся в памяти
+    и записываются пачкой: при flush(), close() или после batch_size
+    изменений; файл календаря заменяется атомарно через временный файл.
+    """
+
+    def __init__(self, path, batch_size: int = 1000, page_size: int = 200):
+        self.path = path
+        self.batch_size = batch_size
+        self.page_size = page_size
+        self.grant_id = f"ics:{os.path.abspath(path)}"
+        self.calendars = {}
+        self.dirty = set()
+        self.pending = 0
+        self.lock = threading.RLock()
+        self.stats = {"reads": 0, "writes": 0, "changes": 0}
+        os.makedirs(path, exist_ok=True)
+
+    def file_path(self, calendar_id):
+        name = re.sub(r"[^\w.-]", "_", calendar_id)
+        return os.path.join(self.path, f"{name}.ics")
+
+    def calendar(self, calendar_id):
+        if calendar_id not in self.calendars:
+            events = []
+            try:
+                with open(self.file_path(calendar_id), "r", encoding="utf-8") as file:
+                    events = parse_calendar(file.read(), calendar_id)
+                self.stats["reads"] += 1
+            except FileNotFoundError:
+                pass
+            self.calendars[calendar_id] = IcsCalendar(calendar_id, events)
+        return self.calendars[calendar_id]
+
+    def changed(self, calendar_id):
+        self.dirty.add(calendar_id)
+        self.pending += 1
+        self.stats["changes"] += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            for calendar_id in sorted(self.dirty):
+                self.write(self.calendars[calendar_id])
+            self.dirty.clear()
+            self.pending = 0
+
+    def write(self, ics_calendar):
+        stamp = format_time(time.time())
+        lines = [
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            f"PRODID:{PRODID}",
+            f"X-WR-CALNAME:{escape(ics_calendar.calendar_id)}",
+        ]
+        for event in ics_calendar.window():
+            if event.when.start_time is not None:
+                lines += format_event(event, stamp)
+        lines.append("END:VCALENDAR")
+        path = self.file_path(ics_calendar.calendar_id)
+        descriptor, temp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "w", encoding="utf-8", newline="") as file:
+                file.write("\r\n".join(fold(line) for line in lines) + "\r\n")
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self.stats["writes"] += 1
+
+    def close(self):
+        self.flush()
+
+    def get(self, event_id, calendar_id):
+        event = self.calendar(calendar_id).events.get(event_id)
+        if event is None:
+            raise IcsError(f"Event {event_id} not found in {calendar_id}")
+        return event
+
+    def create_event(self, request_body, reminders, calendar_id):
+        with self.lock:
+            event = IcsEvent(
+                uuid.uuid4().hex,
+                calendar_id,
+                request_body["title"],
+                IcsWhen(**request_body["when"]),
+                reminders or (),
+                request_body.get("metadata"),
+            )
+            self.calendar(calendar_id).add(event)
+            self.changed(calendar_id)
+            return IcsResponse(event)
+
+    def update_event(self, event_id, request_body, reminders, calendar_id):
+        with self.lock:
+            ics_calendar = self.calendar(calendar_id)
+            event = self.get(event_id, calendar_id)
+            ics_calendar.remove(event_id)
+            if "when" in request_body:
+                event.when = IcsWhen(**request_body["when"])
+            if "title" in request_body:
+                event.title = request_body["title"]
+            if "metadata" in request_body:
+                event.metadata = request_body["metadata"]
+            if reminders is not None:
+                event.reminders = tuple(reminders)
+            ics_calendar.add(event)
+            self.changed(calendar_id)
+            return IcsResponse(event)
+
+    def delete_event(self, event_id, calendar_id):
+        with self.lock:
+            self.get(event_id, calendar_id)
+            self.calendar(calendar_id).remove(event_id)
+            self.changed(calendar_id)
+            return IcsResponse(None)
+
+    def search_events(self, query_params):
+        with self.lock:
+            ics_calendar = self.calendar(query_params["calendar_id"])
+            events = ics_calendar.window(
+                query_params.get("start"), query_params.get("end")
+            )
+            pair = query_params.get("metadata_pair")
+            if pair is not None:
+                key, _, value = pair.partition(":")
+                ids = ics_calendar.metadata.get((key, value), set())
+                events = (event for event in events if event.id in ids)
+            title = query_params.get("title")
+            end = query_params.get("end")
+            matched = [
+                event
+                for event in events
+                if (title is None or event.title == title)
+                and (end is None or ends_by(event, end))
+            ]
+        offset = int(query_params.get("page_token") or 0)
+        limit = min(query_params.get("limit", self.page_size), self.page_size)
+        cursor = str(offset + limit) if offset + limit < len(matched) else None
+        return IcsResponse(matched[offset : offset + limit], cursor)
+
+
+def main(argv=None):
+    from config import LoadSchedule
+    from scheduler import Scheduler
+
+    parser = argparse.ArgumentParser(description="Export routines to iCalendar files")
+    parser.add_argument("--schedule", default="./config/schedule.json")
+    parser.add_argument("--out", default="./export")
+    parser.add_argument("--days", type=int, default=30)
+    args = parser.parse_args(argv)
+    started = time.perf_counter()
+    service = IcsCalendarService(args.out)
+    scheduler = Scheduler(service, LoadSchedule(args.schedule).compile())
+    results = scheduler.reconcile_routine(days=args.days)
+    service.close()
+    failed = [result for result in results if not result.ok]
+    print(
+        json.dumps(
+            {
+                "operations": len(results),
+                "failed": len(failed),
+                "files": sorted(os.listdir(args.out)),
+                "seconds": round(time.perf_counter() - started, 4),
+                **service.stats,
+            },
+            ensure_ascii=False,
+            indent=2,
+        )
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from tracing import span
+
+# Поля событий, которые нужны индексу и сверке
+INDEX_FIELDS = ("id", "title", "when", "reminders", "metadata")
+
+# Ключи метаданных, которыми планировщик помечает свои события.
+# Провайдер умеет фильтровать только по key1-key5.
+OWNER_KEY = "key1"
+ROUTINE_KEY = "key2"
+EVENT_KEY = "key3"
+HASH_KEY = "key4"
+
+
+def event_start(event):
+    """
+    Время начала события (timestamp) или None для событий на весь день
+    и событий, известных только по кэшу или журналу без времени
+    """
+    return getattr(getattr(event, "when", None), "start_time", None)
+
+
+def event_metadata(event):
+    return getattr(event, "metadata", None) or {}
+
+
+def event_key(routine, title):
+    """
+    Ключ события в расписании: рутина и название
+    """
+    return f"{routine}/{title}"
+
+
+def owner_query(owner):
+    """
+    Параметр запроса событий, помеченных указанным расписанием
+    """
+    return {"metadata_pair": f"{OWNER_KEY}:{owner}"}
+
+
+class EventIndex:
+    """
+    Индекс событий календарей в памяти по ключу (calendar_id, owner, key, day).
+
+    Для помеченных событий owner и key берутся из метаданных,
+    непомеченные хранятся с owner=None по названию.
+
+    Заполняется одним потоковым перебором events.list на календарь
+    за всё окно дня вместо отдельного search_events на каждое событие.
+    Из ответа запрашиваются только поля INDEX_FIELDS.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self.events = defaultdict(list)
+        self.loaded = set()
+
+    def load(self, calendar_id, start: datetime, end: datetime):
+        if calendar_id in self.loaded:
+            return
+        with span("load_index", calendar=calendar_id):
+            events = self.service.iter_events(
+                {
+                    "calendar_id": calendar_id,
+                    "start": int(start.timestamp()),
+                    "end": int(end.timestamp()),
+                },
+                select=INDEX_FIELDS,
+            )
+            for event in events:
+                self.add(calendar_id, event)
+        self.loaded.add(calendar_id)
+
+    async def aload(self, calendar_id, start: datetime, end: datetime):
+        """
+        Асинхронный вариант load для AsyncCalendarService
+        """
+        if calendar_id in self.loaded:
+            return
+        with span("load_index", calendar=calendar_id):
+            events = self.service.iter_events(
+                {
+                    "calendar_id": calendar_id,
+                    "start": int(start.timestamp()),
+                    "end": int(end.timestamp()),
+                },
+                select=INDEX_FIELDS,
+            )
+            async for event in events:
+                self.add(calendar_id, event)
+        self.loaded.add(calendar_id)
+
+    def add(self, calendar_id, event):
+        start = event_start(event)
+        if start is None:
+            return
+        self.events[self.key(calendar_id, event, start)].append(event)
+
+    def remove(self, calendar_id, event):
+        start = event_start(event)
+        if start is None:
+            return
+        bucket = self.events.get(self.key(calendar_id, event, start))
+        if bucket and event in bucket:
+            bucket.remove(event)
+
+    def find(self, calendar_id, key, day: date, owner=None):
+        """
+        События владельца owner с ключом key за день, для owner=None —
+        непомеченные события с названием key
+        """
+        return list(self.events.get((calendar_id, owner, key, day), ()))
+
+    @staticmethod
+    def key(calendar_id, event, start):
+        metadata = event_metadata(event)
+        owner = metadata.get(OWNER_KEY)
+        if owner is None or EVENT_KEY not in metadata:
+            return (calendar_id, None, event.title, date.fromtimestamp(start))
+        return (calendar_id, owner, metadata[EVENT_KEY], date.fromtimestamp(start))
+
+    @staticmethod
+    def day_window(day: date, days: int = 1):
+        start = datetime.combine(day, datetime.min.time())
+        return start, start + timedelta(days=days)
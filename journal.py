@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import uuid
+from datetime import date
+
+from cache import CachedEvent
+from index import event_start
+from plan import schedule_name
+from reconcile import DesiredEvent, Operation
+
+
+def journal_path(schedule_path):
+    """
+    Журнал расписания: рядом с его файлом, по имени расписания
+    """
+    directory = os.path.dirname(os.path.abspath(schedule_path))
+    return os.path.join(directory, f"{schedule_name(schedule_path)}.journal.jsonl")
+
+
+def operation_key(operation):
+    """
+    Ключ идемпотентности операции: тип, календарь, событие и содержимое
+    """
+    desired = operation.desired
+    payload = [
+        operation.kind,
+        operation.calendar_id,
+        operation.event.id if operation.event is not None else None,
+        (
+            None
+            if desired is None
+            else [
+                desired.routine,
+                desired.title,
+                desired.start,
+                desired.end,
+                desired.owner,
+            ]
+        ),
+        None if desired is None else sorted(desired.reminders),
+    ]
+    return hashlib.sha1(json.dumps(payload).encode("utf-8")).hexdigest()
+
+
+def operation_record(operation):
+    record = {
+        "kind": operation.kind,
+        "calendar_id": operation.calendar_id,
+        "time_changed": operation.time_changed,
+        "reminders_changed": operation.reminders_changed,
+    }
+    if operation.event is not None:
+        record["event"] = {
+            "id": operation.event.id,
+            "title": operation.event.title,
+            "start": event_start(operation.event),
+        }
+    if operation.desired is not None:
+        desired = operation.desired
+        record["desired"] = {
+            "routine": desired.routine,
+            "title": desired.title,
+            "start": desired.start,
+            "end": desired.end,
+            "reminders": desired.reminders,
+            "owner": desired.owner,
+        }
+    return record
+
+
+def record_day(record):
+    """
+    День операции по записи журнала или None, если время неизвестно
+    """
+    desired = record.get("desired")
+    start = desired["start"] if desired else record.get("event", {}).get("start")
+    return None if start is None else date.fromtimestamp(start)
+
+
+def record_operation(record):
+    desired = record.get("desired")
+    event = record.get("event")
+    return Operation(
+        record["kind"],
+        record["calendar_id"],
+        None if desired is None else DesiredEvent(record["calendar_id"], **desired),
+        (
+            None
+            if event is None
+            else CachedEvent(event["id"], event["title"], event.get("start"))
+        ),
+        record["time_changed"],
+        record["reminders_changed"],
+    )
+
+
+class OperationJournal:
+    """
+    Журнал операций с записью вперёд (append-only JSON Lines).
+
+    Перед выполнением прогона в журнал записываются все запланированные
+    операции с ключами идемпотентности, после каждой успешной операции —
+    отметка о выполнении. Если процесс упал посреди прогона, при следующем
+    запуске pending() вернёт только невыполненный хвост, который можно
+    доделать без повторного поиска событий. Завершённый прогон оставляет
+    в журнале только свои невыполненные (упавшие и пропущенные) операции;
+    операции за прошедшие дни не возобновляются.
+    """
+
+    def __init__(self, path="./config/journal.jsonl", fsync: bool = True):
+        self.path = path
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.keys = {}
+        self.run_id = None
+
+    def write(self, *records):
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as file:
+                for record in records:
+                    file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                file.flush()
+                if self.fsync:
+                    os.fsync(file.fileno())
+
+    def read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                lines = file.readlines()
+        except FileNotFoundError:
+            return []
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # Оборванная последняя строка после падения процесса
+                break
+        return records
+
+    def unfinished(self, run_id=None):
+        """
+        Записи planned без отметки о выполнении, по прогону run_id или все
+        """
+        planned, done = {}, set()
+        for record in self.read():
+            if record["state"] == "planned":
+                if run_id is None or record["run"] == run_id:
+                    planned[record["key"]] = record
+            elif record["state"] == "done":
+                done.add(record["key"])
+        return [record for key, record in planned.items() if key not in done]
+
+    def pending(self):
+        """
+        Невыполненные операции в порядке планирования, кроме операций
+        за прошедшие дни
+        """
+        today = date.today()
+        return [
+            record_operation(record["operation"])
+            for record in self.unfinished()
+            if (record_day(record["operation"]) or today) >= today
+        ]
+
+    def begin(self, operations):
+        self.run_id = uuid.uuid4().hex
+        self.keys = {
+            id(operation): operation_key(operation) for operation in operations
+        }
+        self.write(
+            *(
+                {
+                    "state": "planned",
+                    "run": self.run_id,
+                    "key": self.keys[id(operation)],
+                    "operation": operation_record(operation),
+                }
+                for operation in operations
+            )
+        )
+
+    def commit(self, operation, result):
+        event = getattr(result, "data", None)
+        self.write(
+            {
+                "state": "done",
+                "run": self.run_id,
+                "key": self.keys[id(operation)],
+                "event_id": getattr(event, "id", None),
+            }
+        )
+
+    def finish(self):
+        """
+        Завершает прогон: в журнале остаются только его невыполненные операции
+        """
+        with self.lock:
+            records = self.unfinished(self.run_id)
+            if records:
+                directory = os.path.dirname(os.path.abspath(self.path))
+                descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                try:
+                    with os.fdopen(descriptor, "w", encoding="utf-8") as file:
+                        for record in records:
+                            file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    os.replace(temp_path, self.path)
+                except BaseException:
+                    os.unlink(temp_path)
+                    raise
+            elif os.path.exists(self.path):
+                os.remove(self.path)
+        self.run_id = None
+        self.keys = {}
@@ -0,0 +1,219 @@
+import heapq
+from collections import defaultdict
+
+# Виды привязки начала события
+AT = "at"
+AFTER = "after"
+WAKE_UP = "wake_up"
+SHUTDOWN = "shutdown"
+BETWEEN = "between"
+
+# Переменные раскладки, к которым привязываются события
+VARIABLES = (WAKE_UP, SHUTDOWN)
+
+
+class LayoutError(ValueError):
+    """
+    Ошибка в описании раскладки: повтор имени или цикл привязок
+    """
+
+
+class Anchor:
+    """
+    Привязка начала события.
+
+    at(ts) — абсолютное время, after(name, gap) — конец события name плюс
+    gap секунд, wake_up(offset) и shutdown(offset) — время подъёма или
+    отбоя плюс offset секунд, between(first, second) — середина промежутка
+    между концом first и началом second.
+    """
+
+    def __init__(self, kind, refs=(), offset=0):
+        self.kind = kind
+        self.refs = tuple(refs)
+        self.offset = offset
+
+    @classmethod
+    def at(cls, timestamp):
+        return cls(AT, (), timestamp)
+
+    @classmethod
+    def after(cls, name, gap=0):
+        return cls(AFTER, (name,), gap)
+
+    @classmethod
+    def wake_up(cls, offset=0):
+        return cls(WAKE_UP, (WAKE_UP,), offset)
+
+    @classmethod
+    def shutdown(cls, offset=0):
+        return cls(SHUTDOWN, (SHUTDOWN,), offset)
+
+    @classmethod
+    def between(cls, first, second):
+        return cls(BETWEEN, (first, second))
+
+    def start(self, spans, duration):
+        """
+        Начало события по интервалам ссылок или None, если ссылка не размещена
+        """
+        if self.kind == AT:
+            return self.offset
+        refs = [spans.get(ref) for ref in self.refs]
+        if None in refs:
+            return None
+        if self.kind == AFTER:
+            return refs[0][1] + self.offset
+        if self.kind == BETWEEN:
+            gap = refs[1][0] - refs[0][1]
+            return refs[0][1] + max(0, gap - duration) // 2
+        return refs[0][0] + self.offset
+
+    def __repr__(self):
+        return f"Anchor({self.kind!r}, {self.refs!r}, {self.offset})"
+
+
+class LayoutItem:
+    """
+    Событие раскладки.
+
+    duration — желаемая длительность в секундах. Если событие не успевает
+    закончиться к not_after, оно сокращается, но не короче min_duration;
+    not_before сдвигает слишком раннее начало.
+    """
+
+    def __init__(
+        self,
+        name,
+        anchor: Anchor,
+        duration,
+        min_duration=None,
+        not_before=None,
+        not_after=None,
+    ):
+        self.name = name
+        self.anchor = anchor
+        self.duration = duration
+        self.min_duration = duration if min_duration is None else min_duration
+        self.not_before = not_before
+        self.not_after = not_after
+
+    def place(self, spans):
+        """
+        Интервал [start, end] события или None, если его не разместить
+        """
+        start = self.anchor.start(spans, self.duration)
+        if start is None:
+            return None
+        if self.not_before is not None:
+            start = max(start, self.not_before)
+        end = start + self.duration
+        if self.not_after is not None and end > self.not_after:
+            end = self.not_after
+            if end - start < self.min_duration:
+                return None
+        return (start, end)
+
+
+class Layout:
+    """
+    Раскладка событий дня по привязкам.
+
+    События и переменные (wake_up, shutdown) образуют граф зависимостей,
+    который раскладывается в топологическом порядке. Событие, привязанное
+    к отсутствующему в этот день событию, остаётся неразмещённым (None).
+    update() при смене переменных и pin() при закреплении события
+    пересчитывают только зависимые события и останавливают распространение
+    на тех, чьё время не изменилось.
+    """
+
+    def __init__(self, items, **variables):
+        self.items = {}
+        for item in items:
+            if item.name in self.items or item.name in VARIABLES:
+                raise LayoutError(f"duplicate layout item {item.name!r}")
+            self.items[item.name] = item
+        self.dependents = defaultdict(list)
+        for item in self.items.values():
+            for ref in item.anchor.refs:
+                self.dependents[ref].append(item.name)
+        self.rank = {name: i for i, name in enumerate(self.sort())}
+        self.spans = {}
+        for name in VARIABLES:
+            self.spans[name] = self.variable_span(variables.get(name))
+        for name in sorted(self.items, key=self.rank.get):
+            self.spans[name] = self.items[name].place(self.spans)
+
+    def sort(self):
+        """
+        Топологический порядок событий (алгоритм Кана)
+        """
+        pending = {
+            name: sum(ref in self.items for ref in item.anchor.refs)
+            for name, item in self.items.items()
+        }
+        ready = [name for name, count in pending.items() if count == 0]
+        order = []
+        while ready:
+            name = ready.pop()
+            order.append(name)
+            for dependent in self.dependents.get(name, ()):
+                pending[dependent] -= 1
+                if pending[dependent] == 0:
+                    ready.append(dependent)
+        if len(order) != len(self.items):
+            cycle = sorted(name for name, count in pending.items() if count)
+            raise LayoutError(f"anchor cycle between {cycle}")
+        return order
+
+    @staticmethod
+    def variable_span(value):
+        return None if value is None else (value, value)
+
+    def span(self, name):
+        return self.spans.get(name)
+
+    def update(self, **variables):
+        """
+        Меняет переменные раскладки и возвращает {name: [start, end] или None}
+        только для событий, время которых изменилось
+        """
+        dirty = []
+        for name, value in variables.items():
+            if name not in VARIABLES:
+                raise LayoutError(f"unknown layout variable {name!r}")
+            span = self.variable_span(value)
+            if span == self.spans[name]:
+                continue
+            self.spans[name] = span
+            for dependent in self.dependents.get(name, ()):
+                heapq.heappush(dirty, (self.rank[dependent], dependent))
+        return self.propagate(dirty)
+
+    def pin(self, name, start):
+        """
+        Закрепляет начало события name на start (например, после сдвига
+        из занятого времени) и возвращает изменившиеся события, как update()
+        """
+        self.items[name].anchor = Anchor.at(start)
+        return self.propagate([(self.rank[name], name)])
+
+    def propagate(self, dirty):
+        """
+        Пересчитывает события из кучи dirty и зависимые от них в
+        топологическом порядке
+        """
+        moved, seen = {}, set()
+        while dirty:
+            _, name = heapq.heappop(dirty)
+            if name in seen:
+                continue
+            seen.add(name)
+            span = self.items[name].place(self.spans)
+            if span == self.spans[name]:
+                continue
+            self.spans[name] = span
+            moved[name] = span
+            for dependent in self.dependents.get(name, ()):
+                heapq.heappush(dirty, (self.rank[dependent], dependent))
+        return moved
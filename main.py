@@ -1,12 +1,9 @@
-from config import LoadConfig, LoadSchedule
-from service import NylasService
-from scheduler import Scheduler
+import sys
 
-grant_id, api_key, api_uri = LoadConfig("./config/config.json").load()
-client = NylasService(grant_id, api_key, api_uri)
+from cli import main
 
-# schedule = LoadSchedule("./config/schedule.json").load()
-schedule = LoadSchedule("./config/test_schedule.json").load()
-
-scheduler = Scheduler(client, schedule)
-scheduler.create_routine()
+# Прежний запуск скрипта: тестовое расписание на сегодня. Трассировка
+# и профилирование по-прежнему включаются переменными окружения
+# SCHEDULER_TRACE=trace.json, SCHEDULER_PROFILE=run.prof
+# sys.exit(main(["apply", "--schedule", "./config/schedule.json"]))
+sys.exit(main(["apply", "--schedule", "./config/test_schedule.json"]))
@@ -0,0 +1,288 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from service import CalendarService
+
+# Границы корзин гистограммы задержек в секундах
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def payload_size(payload):
+    """
+    Оценка размера тела запроса или ответа в байтах в виде JSON
+    """
+    if payload is None:
+        return 0
+    data = getattr(payload, "data", payload)
+    if isinstance(data, list):
+        return sum(payload_size(item) for item in data)
+    if hasattr(data, "to_dict"):
+        data = data.to_dict()
+    try:
+        return len(json.dumps(data, ensure_ascii=False, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return 0
+
+
+class Histogram:
+    """
+    Гистограмма с накопительными корзинами в формате Prometheus
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip((*self.buckets, float("inf")), self.counts):
+            total += count
+            yield bound, total
+
+    def quantile(self, q):
+        """
+        Верхняя граница корзины, в которую попадает квантиль q,
+        или None, если это корзина +Inf
+        """
+        if not self.count:
+            return 0.0
+        for bound, total in self.cumulative():
+            if total >= q * self.count:
+                return None if bound == float("inf") else bound
+        return None
+
+
+class CallMetrics:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency = Histogram()
+
+
+class InstrumentedService(CalendarService):
+    """
+    Обёртка над CalendarService, собирающая метрики вызовов.
+
+    Считает вызовы, ошибки, гистограммы задержек и объём данных по методу
+    и календарю, а также повторы и троттлинг обёрнутого сервиса.
+    Результаты выгружаются в текстовом формате Prometheus и в JSON.
+    """
+
+    def __init__(self, service: CalendarService):
+        self.service = service
+        self.metrics = defaultdict(CallMetrics)
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    def __getattr__(self, name):
+        return getattr(self.service, name)
+
+    def observe(self, method, calendar_id, fn, sent, *args):
+        started = time.perf_counter()
+        error = None
+        result = None
+        try:
+            result = fn(*args)
+            return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            received = payload_size(result) if error is None else 0
+            with self.lock:
+                metrics = self.metrics[(method, calendar_id)]
+                metrics.calls += 1
+                metrics.errors += error is not None
+                metrics.bytes_sent += sent
+                metrics.bytes_received += received
+                metrics.latency.observe(elapsed)
+
+    def create_event(self, request_body, reminders, calendar_id):
+        return self.observe(
+            "create_event",
+            calendar_id,
+            self.service.create_event,
+            payload_size(request_body),
+            request_body,
+            reminders,
+            calendar_id,
+        )
+
+    def update_event(self, event_id, request_body, reminders, calendar_id):
+        return self.observe(
+            "update_event",
+            calendar_id,
+            self.service.update_event,
+            payload_size(request_body),
+            event_id,
+            request_body,
+            reminders,
+            calendar_id,
+        )
+
+    def delete_event(self, event_id, calendar_id):
+        return self.observe(
+            "delete_event",
+            calendar_id,
+            self.service.delete_event,
+            0,
+            event_id,
+            calendar_id,
+        )
+
+    def search_events(self, query_params):
+        return self.observe(
+            "search_events",
+            query_params.get("calendar_id"),
+            self.service.search_events,
+            payload_size(query_params),
+            query_params,
+        )
+
+    def list_events(self, query_params):
+        return self.observe(
+            "list_events",
+            query_params.get("calendar_id"),
+            self.service.list_events,
+            payload_size(query_params),
+            query_params,
+        )
+
+    def page_query(self, query_params, page_size, select=None):
+        return self.service.page_query(query_params, page_size, select)
+
+    def flush(self):
+        return self.service.flush()
+
+    def service_stats(self):
+        return dict(getattr(self.service, "stats", {}) or {})
+
+    def summary(self):
+        """
+        Сводка метрик прогона в виде словаря, пригодного для JSON
+        """
+        with self.lock:
+            items = sorted(self.metrics.items(), key=lambda item: str(item[0]))
+            calls = [
+                {
+                    "method": method,
+                    "calendar_id": calendar_id,
+                    "calls": metrics.calls,
+                    "errors": metrics.errors,
+                    "bytes_sent": metrics.bytes_sent,
+                    "bytes_received": metrics.bytes_received,
+                    "latency_sum": round(metrics.latency.sum, 6),
+                    "latency_p50": metrics.latency.quantile(0.5),
+                    "latency_p95": metrics.latency.quantile(0.95),
+                    "latency_p99": metrics.latency.quantile(0.99),
+                }
+                for (method, calendar_id), metrics in items
+            ]
+        return {
+            "duration": round(time.time() - self.started, 3),
+            "calls": calls,
+            "service": self.service_stats(),
+        }
+
+    def prometheus(self):
+        """
+        Метрики в текстовом формате Prometheus
+        """
+        lines = []
+        counters = (
+            ("calls", "Calendar API calls"),
+            ("errors", "Failed calendar API calls"),
+            ("bytes_sent", "Estimated request payload bytes"),
+            ("bytes_received", "Estimated response payload bytes"),
+        )
+        with self.lock:
+            items = sorted(self.metrics.items(), key=lambda item: str(item[0]))
+            for name, help_text in counters:
+                lines.append(f"# HELP scheduler_calendar_{name}_total {help_text}")
+                lines.append(f"# TYPE scheduler_calendar_{name}_total counter")
+                for (method, calendar_id), metrics in items:
+                    labels = format_labels(method=method, calendar=calendar_id)
+                    value = getattr(metrics, name)
+                    lines.append(f"scheduler_calendar_{name}_total{labels} {value}")
+            lines.append(
+                "# HELP scheduler_calendar_latency_seconds Calendar API call latency"
+            )
+            lines.append("# TYPE scheduler_calendar_latency_seconds histogram")
+            for (method, calendar_id), metrics in items:
+                for bound, total in metrics.latency.cumulative():
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    labels = format_labels(method=method, calendar=calendar_id, le=le)
+                    lines.append(
+                        f"scheduler_calendar_latency_seconds_bucket{labels} {total}"
+                    )
+                labels = format_labels(method=method, calendar=calendar_id)
+                latency = metrics.latency
+                lines.append(
+                    f"scheduler_calendar_latency_seconds_sum{labels} {latency.sum}"
+                )
+                lines.append(
+                    f"scheduler_calendar_latency_seconds_count{labels} {latency.count}"
+                )
+        for name, value in sorted(self.service_stats().items()):
+            lines.append(f"# TYPE scheduler_service_{name}_total counter")
+            lines.append(f"scheduler_service_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, prometheus_path=None, json_path=None):
+        if prometheus_path:
+            write_file(prometheus_path, self.prometheus())
+        if json_path:
+            write_file(
+                json_path, json.dumps(self.summary(), ensure_ascii=False, indent=2)
+            )
+
+    def write(self, path):
+        """
+        Выгружает метрики в path: .json — сводка в JSON, иначе формат Prometheus
+        """
+        if path.endswith(".json"):
+            self.export(json_path=path)
+        else:
+            self.export(prometheus_path=path)
+
+
+def write_file(path, text):
+    """
+    Атомарная запись: сборщик метрик не увидит файл наполовину записанным
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "w", encoding="utf-8") as file:
+            file.write(text)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def format_labels(**labels):
+    escaped = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        escaped.append(f'{key}="{value}"')
+    return "{" + ",".join(escaped) + "}"
@@ -0,0 +1,420 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+from index import event_metadata, event_start
+from reconcile import reminder_minutes
+from service import CalendarService
+
+# Поля событий, которые хранит зеркало
+MIRROR_FIELDS = (
+    "id",
+    "title",
+    "when",
+    "reminders",
+    "metadata",
+    "busy",
+    "status",
+    "updated_at",
+)
+CANCELLED = "cancelled"
+# Курсор отступает назад на запас: расхождение часов с провайдером
+# и изменения в ту же секунду, что и запрос
+CURSOR_OVERLAP = 60
+# Запрос изменений охватывает окно зеркала с запасом, чтобы увидеть
+# события, перенесённые за его границы
+DELTA_MARGIN = 365 * 86400
+MIRROR_VERSION = 1
+
+
+class MirrorWhen:
+    __slots__ = ("start_time", "end_time")
+
+    def __init__(self, start_time, end_time):
+        self.start_time = start_time
+        self.end_time = end_time
+
+
+class MirrorEvent:
+    """
+    Копия события календаря в зеркале. reminders — кортеж минут или None
+    для напоминаний по умолчанию
+    """
+
+    __slots__ = (
+        "id",
+        "calendar_id",
+        "title",
+        "when",
+        "reminders",
+        "metadata",
+        "busy",
+        "updated_at",
+    )
+
+    def __init__(
+        self,
+        event_id,
+        calendar_id,
+        title,
+        start,
+        end,
+        reminders=None,
+        metadata=None,
+        busy=True,
+        updated_at=None,
+    ):
+        self.id = event_id
+        self.calendar_id = calendar_id
+        self.title = title
+        self.when = MirrorWhen(start, end)
+        self.reminders = reminders
+        self.metadata = metadata or {}
+        self.busy = busy
+        self.updated_at = updated_at
+
+    @classmethod
+    def from_event(cls, event, calendar_id):
+        return cls(
+            event.id,
+            calendar_id,
+            event.title,
+            event_start(event),
+            getattr(event.when, "end_time", None),
+            reminder_minutes(getattr(event, "reminders", None)),
+            dict(event_metadata(event)),
+            getattr(event, "busy", True),
+            getattr(event, "updated_at", None),
+        )
+
+    @classmethod
+    def from_record(cls, event_id, calendar_id, record):
+        reminders = record.get("reminders")
+        return cls(
+            event_id,
+            calendar_id,
+            record["title"],
+            record["start"],
+            record["end"],
+            None if reminders is None else tuple(reminders),
+            record.get("metadata"),
+            record.get("busy", True),
+            record.get("updated_at"),
+        )
+
+    def record(self):
+        return {
+            "title": self.title,
+            "start": self.when.start_time,
+            "end": self.when.end_time,
+            "reminders": None if self.reminders is None else list(self.reminders),
+            "metadata": self.metadata,
+            "busy": self.busy,
+            "updated_at": self.updated_at,
+        }
+
+
+class MirrorResponse:
+    def __init__(self, data, next_cursor=None):
+        self.data = data
+        self.next_cursor = next_cursor
+
+
+def in_window(event, start, end):
+    event_begin = event.when.start_time
+    if event_begin is None:
+        return False
+    return event_begin >= start and event.when.end_time <= end
+
+
+class MirroredCalendar:
+    """
+    Копия одного календаря: события, покрытые окна [start, end) и курсор
+    изменений (timestamp, после которого изменения ещё не получены)
+    """
+
+    def __init__(self, calendar_id, events=None, covered=(), cursor=None):
+        self.calendar_id = calendar_id
+        self.events = events or {}
+        self.covered = [tuple(window) for window in covered]
+        self.cursor = cursor
+        self.synced = None
+
+    def covers(self, start, end):
+        return any(lo <= start and end <= hi for lo, hi in self.covered)
+
+    def cover(self, start, end):
+        windows = sorted([*self.covered, (start, end)])
+        merged = [windows[0]]
+        for lo, hi in windows[1:]:
+            if lo <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+            else:
+                merged.append((lo, hi))
+        self.covered = merged
+
+    def bounds(self):
+        return self.covered[0][0], self.covered[-1][1]
+
+    def state(self):
+        return {
+            "cursor": self.cursor,
+            "covered": [list(window) for window in self.covered],
+            "events": {
+                event_id: event.record() for event_id, event in self.events.items()
+            },
+        }
+
+
+class CalendarMirror:
+    """
+    Локальное зеркало календарей, поддерживаемое инкрементальной
+    синхронизацией.
+
+    Окно, которое зеркало ещё не покрывает, загружается целиком один раз.
+    Дальше зеркало запрашивает только события, изменённые после курсора
+    (updated_after), вместе с отменёнными (show_cancelled): отменённые
+    и удалённые события приходят надгробиями со статусом cancelled
+    и убираются из копии. Так правки пользователя — перенос или
+    удаление событий планировщика — видны без полного перечитывания.
+
+    path — JSON-файл, в котором копия переживает перезапуск; None —
+    зеркало только в памяти. max_age — сколько секунд копия считается
+    свежей без запроса изменений. clock — часы для курсора, по
+    умолчанию time.time.
+    """
+
+    def __init__(self, service, path=None, max_age: float = 1.0, clock=time.time):
+        self.service = service
+        self.path = path
+        self.max_age = max_age
+        self.clock = clock
+        self.grant_id = getattr(service, "grant_id", None)
+        self.calendars = {}
+        self.dirty = False
+        self.lock = threading.RLock()
+        self.stats = {"full_syncs": 0, "delta_syncs": 0, "fetched": 0, "tombstones": 0}
+        self.load()
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as file:
+            state = json.load(file)
+        if (
+            state.get("version") != MIRROR_VERSION
+            or state.get("grant_id") != self.grant_id
+        ):
+            return
+        for calendar_id, data in state["calendars"].items():
+            events = {
+                event_id: MirrorEvent.from_record(event_id, calendar_id, record)
+                for event_id, record in data["events"].items()
+            }
+            self.calendars[calendar_id] = MirroredCalendar(
+                calendar_id, events, data["covered"], data["cursor"]
+            )
+
+    def save(self):
+        with self.lock:
+            if self.path is None or not self.dirty:
+                return
+            state = {
+                "version": MIRROR_VERSION,
+                "grant_id": self.grant_id,
+                "calendars": {
+                    calendar_id: calendar.state()
+                    for calendar_id, calendar in self.calendars.items()
+                },
+            }
+            directory = os.path.dirname(os.path.abspath(self.path))
+            descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(descriptor, "w", encoding="utf-8") as file:
+                    json.dump(state, file, ensure_ascii=False)
+                os.replace(temp_path, self.path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+            self.dirty = False
+
+    def calendar(self, calendar_id):
+        if calendar_id not in self.calendars:
+            self.calendars[calendar_id] = MirroredCalendar(calendar_id)
+        return self.calendars[calendar_id]
+
+    def sync(self, calendar_id, start, end):
+        """
+        Доводит копию календаря до актуальной для окна [start, end)
+        """
+        with self.lock:
+            calendar = self.calendar(calendar_id)
+            if not calendar.covers(start, end):
+                self.fetch_window(calendar, start, end)
+            elif (
+                calendar.synced is None
+                or time.monotonic() - calendar.synced >= self.max_age
+            ):
+                self.fetch_changes(calendar)
+            else:
+                return
+            self.save()
+
+    def fetch_window(self, calendar, start, end):
+        started = int(self.clock())
+        fetched = {}
+        events = self.service.iter_events(
+            {"calendar_id": calendar.calendar_id, "start": start, "end": end},
+            select=MIRROR_FIELDS,
+        )
+        for event in events:
+            if getattr(event, "status", None) != CANCELLED:
+                fetched[event.id] = MirrorEvent.from_event(event, calendar.calendar_id)
+        # Полная выборка окна авторитетна: всё, чего в ней нет, удалено
+        for event_id, event in list(calendar.events.items()):
+            if event_id not in fetched and in_window(event, start, end):
+                del calendar.events[event_id]
+        calendar.events.update(fetched)
+        calendar.cover(start, end)
+        if calendar.cursor is None:
+            calendar.cursor = started - CURSOR_OVERLAP
+        calendar.synced = time.monotonic()
+        self.stats["full_syncs"] += 1
+        self.stats["fetched"] += len(fetched)
+        self.dirty = True
+
+    def fetch_changes(self, calendar):
+        started = int(self.clock())
+        start, end = calendar.bounds()
+        events = self.service.iter_events(
+            {
+                "calendar_id": calendar.calendar_id,
+                "start": start - DELTA_MARGIN,
+                "end": end + DELTA_MARGIN,
+                "updated_after": calendar.cursor,
+                "show_cancelled": True,
+            },
+            select=MIRROR_FIELDS,
+        )
+        for event in events:
+            self.stats["fetched"] += 1
+            if getattr(event, "status", None) == CANCELLED:
+                self.stats["tombstones"] += 1
+                calendar.events.pop(event.id, None)
+            else:
+                calendar.events[event.id] = MirrorEvent.from_event(
+                    event, calendar.calendar_id
+                )
+        calendar.cursor = started - CURSOR_OVERLAP
+        calendar.synced = time.monotonic()
+        self.stats["delta_syncs"] += 1
+        self.dirty = True
+
+    def put(self, calendar_id, event):
+        with self.lock:
+            if calendar_id in self.calendars and event is not None:
+                self.calendars[calendar_id].events[event.id] = MirrorEvent.from_event(
+                    event, calendar_id
+                )
+                self.dirty = True
+
+    def remove(self, calendar_id, event_id):
+        with self.lock:
+            if calendar_id in self.calendars:
+                self.calendars[calendar_id].events.pop(event_id, None)
+                self.dirty = True
+
+    def events(self, query_params):
+        """
+        События копии по параметрам запроса search_events, по времени начала
+        """
+        calendar_id = query_params["calendar_id"]
+        start, end = query_params["start"], query_params["end"]
+        title = query_params.get("title")
+        pair = query_params.get("metadata_pair")
+        key, _, value = (pair or "").partition(":")
+        with self.lock:
+            self.sync(calendar_id, start, end)
+            matched = [
+                event
+                for event in self.calendars[calendar_id].events.values()
+                if in_window(event, start, end)
+                and (title is None or event.title == title)
+                and (pair is None or event.metadata.get(key) == value)
+            ]
+        return sorted(matched, key=lambda event: (event.when.start_time, event.id))
+
+
+class MirroredService(CalendarService):
+    """
+    CalendarService, отвечающий на оконные запросы событий из зеркала.
+
+    Запросы с календарём и окном (загрузка индекса, занятость) идут
+    в CalendarMirror и стоят сети только на изменения; остальные
+    запросы и все изменения уходят к сервису, а изменения сразу
+    отражаются в копии.
+    """
+
+    def __init__(
+        self,
+        service: CalendarService,
+        path=None,
+        max_age: float = 1.0,
+        clock=time.time,
+    ):
+        self.service = service
+        self.grant_id = getattr(service, "grant_id", None)
+        self.mirror = CalendarMirror(service, path, max_age, clock)
+
+    def __getattr__(self, name):
+        return getattr(self.service, name)
+
+    @property
+    def stats(self):
+        return {**(getattr(self.service, "stats", None) or {}), **self.mirror.stats}
+
+    @staticmethod
+    def mirrored(query_params):
+        return (
+            "start" in query_params
+            and "end" in query_params
+            and "updated_after" not in query_params
+            and not query_params.get("page_token")
+        )
+
+    def search_events(self, query_params):
+        if not self.mirrored(query_params):
+            return self.service.search_events(query_params)
+        return MirrorResponse(self.mirror.events(query_params))
+
+    def create_event(self, request_body, reminders, calendar_id):
+        response = self.service.create_event(request_body, reminders, calendar_id)
+        self.mirror.put(calendar_id, getattr(response, "data", None))
+        return response
+
+    def update_event(self, event_id, request_body, reminders, calendar_id):
+        response = self.service.update_event(
+            event_id, request_body, reminders, calendar_id
+        )
+        self.mirror.put(calendar_id, getattr(response, "data", None))
+        return response
+
+    def delete_event(self, event_id, calendar_id):
+        response = self.service.delete_event(event_id, calendar_id)
+        self.mirror.remove(calendar_id, event_id)
+        return response
+
+    def page_query(self, query_params, page_size, select=None):
+        return self.service.page_query(query_params, page_size, select)
+
+    def flush(self):
+        self.service.flush()
+        self.mirror.save()
+
+    def close(self):
+        self.mirror.save()
+        close = getattr(self.service, "close", None)
+        if close is not None:
+            close()
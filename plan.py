@@ -0,0 +1,342 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+from index import event_key
+from layout import AFTER, AT, BETWEEN, SHUTDOWN, WAKE_UP
+from recurrence import RecurrenceError, RecurrenceRule
+
+# Версия формата кэша: при изменении PlannedEvent или SchedulePlan старые
+# кэши не читаются
+PLAN_VERSION = 5
+
+# Время применения рутин без apply_at: утренняя ставится сразу,
+# дневная и вечерняя — с 11:00, остальные сегодня не ставятся
+DEFAULT_APPLY_AT = {"Morning": 0, "Day": 11 * 60, "Evening": 11 * 60}
+
+
+class ScheduleError(ValueError):
+    """
+    Ошибка в определении расписания
+    """
+
+
+class PlannedEvent:
+    """
+    Событие скомпилированного расписания.
+
+    minute — время начала в минутах от полуночи, offset — сдвиг в минутах
+    от начала рутины (сумма длительностей предыдущих событий),
+    duration — длительность в минутах.
+
+    Необязательные поля раскладки: anchor — привязка начала в виде
+    (вид, ссылка, минуты), min_duration — минимальная длительность
+    в минутах, not_before и not_after — границы в минутах от полуночи,
+    flexible — событие можно сдвигать при пересечении с занятым временем.
+    """
+
+    __slots__ = (
+        "calendar_id",
+        "routine",
+        "title",
+        "minute",
+        "offset",
+        "duration",
+        "reminders",
+        "anchor",
+        "min_duration",
+        "not_before",
+        "not_after",
+        "flexible",
+    )
+
+    def __init__(
+        self,
+        calendar_id,
+        routine,
+        title,
+        minute,
+        offset,
+        duration,
+        reminders,
+        anchor=None,
+        min_duration=None,
+        not_before=None,
+        not_after=None,
+        flexible=False,
+    ):
+        self.calendar_id = calendar_id
+        self.routine = routine
+        self.title = title
+        self.minute = minute
+        self.offset = offset
+        self.duration = duration
+        self.reminders = reminders
+        self.anchor = anchor
+        self.min_duration = min_duration
+        self.not_before = not_before
+        self.not_after = not_after
+        self.flexible = flexible
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+
+class SchedulePlan:
+    """
+    Скомпилированное и проверенное расписание
+    """
+
+    def __init__(self, events, recurrence=None, name=None, apply_at=None):
+        self.events = events
+        # Правило повторения по ключу (calendar_id, routine)
+        self.recurrence = recurrence or {}
+        # Минута дня, с которой рутина ставится на сегодня, по ключу
+        # (calendar_id, routine); None — сегодня не ставится
+        self.apply_at = apply_at or {}
+        # Идентификатор расписания, которым помечаются его события
+        self.name = name
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def __len__(self):
+        return len(self.events)
+
+
+def schedule_name(path):
+    """
+    Идентификатор расписания по имени его файла
+    """
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def parse_minute(value, where):
+    try:
+        hour, minute = map(int, value.split(":"))
+    except (AttributeError, ValueError):
+        raise ScheduleError(f"{where}: time must be 'HH:MM', got {value!r}")
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ScheduleError(f"{where}: time out of range, got {value!r}")
+    return hour * 60 + minute
+
+
+def parse_anchor(anchor, where):
+    """
+    Привязка события из JSON: {"at": "HH:MM"}, {"after": title, "gap": минуты},
+    {"wake_up": минуты}, {"shutdown": минуты} или {"between": [title, title]}
+    """
+    if anchor is None:
+        return None
+    kinds = [
+        kind
+        for kind in (AT, AFTER, WAKE_UP, SHUTDOWN, BETWEEN)
+        if isinstance(anchor, dict) and kind in anchor
+    ]
+    if len(kinds) != 1:
+        raise ScheduleError(
+            f"{where}: anchor must have exactly one kind, got {anchor!r}"
+        )
+    kind = kinds[0]
+    value = anchor[kind]
+    if kind == AT:
+        return (AT, None, parse_minute(value, where))
+    if kind == AFTER:
+        gap = anchor.get("gap", 0)
+        if not isinstance(value, str) or not isinstance(gap, int):
+            raise ScheduleError(
+                f"{where}: 'after' needs an event title and gap minutes"
+            )
+        return (AFTER, value, gap)
+    if kind == BETWEEN:
+        if not (
+            isinstance(value, list)
+            and len(value) == 2
+            and all(isinstance(title, str) for title in value)
+        ):
+            raise ScheduleError(f"{where}: 'between' needs two event titles")
+        return (BETWEEN, tuple(value), 0)
+    if not isinstance(value, int):
+        raise ScheduleError(f"{where}: '{kind}' offset must be minutes")
+    return (kind, None, value)
+
+
+def optional_minute(value, where):
+    return None if value is None else parse_minute(value, where)
+
+
+def compile_schedule(schedule):
+    """
+    Проверяет расписание из JSON и компилирует его в SchedulePlan
+    """
+    events, recurrence, apply_at = [], {}, {}
+    if not isinstance(schedule, list):
+        raise ScheduleError("schedule must be a list of calendars")
+    for calendar in schedule:
+        try:
+            calendar_id = calendar["calendar_id"]
+            routines = calendar["calendar_routine"]
+        except (KeyError, TypeError):
+            raise ScheduleError(
+                "calendar must have 'calendar_id' and 'calendar_routine'"
+            )
+        for routine in routines:
+            routine_title = routine.get("title")
+            if not routine_title:
+                raise ScheduleError(f"{calendar_id}: routine without title")
+            rule = routine.get("recurrence")
+            if rule is not None:
+                try:
+                    if not isinstance(rule, str):
+                        raise RecurrenceError("recurrence must be a string")
+                    RecurrenceRule.parse(rule)
+                except RecurrenceError as e:
+                    raise ScheduleError(f"{calendar_id}/{routine_title}: {e}")
+            recurrence[(calendar_id, routine_title)] = rule
+            apply_at[(calendar_id, routine_title)] = (
+                parse_minute(routine["apply_at"], f"{calendar_id}/{routine_title}")
+                if "apply_at" in routine
+                else DEFAULT_APPLY_AT.get(routine_title)
+            )
+            offset = 0
+            for event in routine.get("schedule", []):
+                where = f"{calendar_id}/{routine_title}/{event.get('title')!r}"
+                if not event.get("title"):
+                    raise ScheduleError(f"{where}: event without title")
+                duration = event.get("duration")
+                if not isinstance(duration, int) or duration <= 0:
+                    raise ScheduleError(f"{where}: duration must be positive minutes")
+                reminders = event.get("reminders") or []
+                if not all(isinstance(minutes, int) for minutes in reminders):
+                    raise ScheduleError(f"{where}: reminders must be minutes")
+                min_duration = event.get("min_duration")
+                if min_duration is not None and not (
+                    isinstance(min_duration, int) and 0 < min_duration <= duration
+                ):
+                    raise ScheduleError(
+                        f"{where}: min_duration must be positive and not above duration"
+                    )
+                events.append(
+                    PlannedEvent(
+                        calendar_id,
+                        routine_title,
+                        event["title"],
+                        parse_minute(event.get("time"), where),
+                        offset,
+                        duration,
+                        tuple(reminders),
+                        parse_anchor(event.get("anchor"), where),
+                        min_duration,
+                        optional_minute(event.get("not_before"), where),
+                        optional_minute(event.get("not_after"), where),
+                        bool(event.get("flexible", False)),
+                    )
+                )
+                offset += duration
+    check_anchor_refs(events)
+    return SchedulePlan(events, recurrence, apply_at=apply_at)
+
+
+def anchor_refs(event):
+    """
+    Ключи событий, к которым привязано событие: название события той же
+    рутины или полный ключ "рутина/название"
+    """
+    if event.anchor is None or event.anchor[0] not in (AFTER, BETWEEN):
+        return ()
+    refs = event.anchor[1]
+    return tuple(
+        ref if "/" in ref else event_key(event.routine, ref)
+        for ref in ((refs,) if isinstance(refs, str) else refs)
+    )
+
+
+def check_anchor_refs(events):
+    known = {
+        (event.calendar_id, event_key(event.routine, event.title)) for event in events
+    }
+    for event in events:
+        for ref in anchor_refs(event):
+            if (event.calendar_id, ref) not in known:
+                raise ScheduleError(
+                    f"{event.calendar_id}/{event.routine}/{event.title!r}: "
+                    f"anchor refers to unknown event {ref!r}"
+                )
+
+
+def load_plan(path, cache_dir=None):
+    """
+    Загружает скомпилированное расписание из кэша на диске.
+
+    Кэш действителен, пока совпадает mtime файла; при смене mtime
+    сравнивается хэш содержимого, и расписание перекомпилируется только
+    если содержимое изменилось. По умолчанию кэш лежит в .plan_cache
+    рядом с файлом расписания, имя файла кэша включает PLAN_VERSION.
+    Кэш пишется через уникальный временный файл, так что параллельные
+    процессы не подменяют его недописанным; если кэш записать нельзя,
+    план возвращается без него.
+    """
+    path = os.path.abspath(path)
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(path), ".plan_cache")
+    key = hashlib.sha1(path.encode("utf-8")).hexdigest()
+    cache_path = os.path.join(cache_dir, f"{key}.v{PLAN_VERSION}.pickle")
+    mtime = os.stat(path).st_mtime_ns
+    cached = None
+    try:
+        with open(cache_path, "rb") as file:
+            cached = pickle.load(file)
+    # Кэш от других определений классов не распаковывается — перекомпилируем
+    except (
+        OSError,
+        pickle.UnpicklingError,
+        EOFError,
+        AttributeError,
+        ImportError,
+        IndexError,
+        TypeError,
+        ValueError,
+    ):
+        pass
+    if not isinstance(cached, dict):
+        cached = None
+    if cached is not None and cached.get("version") != PLAN_VERSION:
+        cached = None
+    if cached is not None and cached["mtime"] == mtime:
+        plan = cached["plan"]
+        plan.name = schedule_name(path)
+        return plan
+
+    with open(path, "rb") as file:
+        content = file.read()
+    digest = hashlib.sha1(content).hexdigest()
+    if cached is not None and cached["hash"] == digest:
+        plan = cached["plan"]
+    else:
+        plan = compile_schedule(json.loads(content.decode("utf-8")))
+    plan.name = schedule_name(path)
+
+    # Кэш не обязателен: каталог расписания может быть только для чтения
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    except OSError:
+        return plan
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            pickle.dump(
+                {"version": PLAN_VERSION, "mtime": mtime, "hash": digest, "plan": plan},
+                file,
+            )
+        os.replace(temp_path, cache_path)
+    except BaseException as e:
+        os.unlink(temp_path)
+        if not isinstance(e, OSError):
+            raise
+    return plan
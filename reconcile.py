@@ -0,0 +1,212 @@
+import hashlib
+import json
+from collections import defaultdict
+from datetime import date
+
+from index import OWNER_KEY, ROUTINE_KEY, EVENT_KEY, HASH_KEY
+from index import event_key, event_metadata, event_start
+
+NOOP = "noop"
+CREATE = "create"
+UPDATE = "update"
+DELETE = "delete"
+
+
+def content_hash(desired):
+    """
+    Хэш содержимого события: время и напоминания
+    """
+    payload = [desired.title, desired.start, desired.end, sorted(desired.reminders)]
+    return hashlib.sha1(json.dumps(payload).encode("utf-8")).hexdigest()
+
+
+class DesiredEvent:
+    """
+    Событие, которое должно оказаться в календаре по расписанию.
+
+    owner — идентификатор расписания; события с владельцем помечаются
+    метаданными и сопоставляются с календарём по ключу, а не по названию.
+    """
+
+    def __init__(self, calendar_id, routine, title, start, end, reminders, owner=None):
+        self.calendar_id = calendar_id
+        self.routine = routine
+        self.title = title
+        self.start = start
+        self.end = end
+        self.reminders = list(reminders)
+        self.owner = owner
+
+    @property
+    def day(self):
+        return date.fromtimestamp(self.start)
+
+    @property
+    def key(self):
+        return event_key(self.routine, self.title)
+
+    def metadata(self):
+        if self.owner is None:
+            return {}
+        return {
+            OWNER_KEY: self.owner,
+            ROUTINE_KEY: self.routine,
+            EVENT_KEY: self.key,
+            HASH_KEY: content_hash(self),
+        }
+
+    def request_body(self):
+        body = {
+            "title": self.title,
+            "when": {"start_time": self.start, "end_time": self.end},
+        }
+        if self.owner is not None:
+            body["metadata"] = self.metadata()
+        return body
+
+    def __repr__(self):
+        return (
+            f"DesiredEvent({self.routine!r}, {self.title!r}, {self.start}, {self.end})"
+        )
+
+
+class Operation:
+    """
+    Операция над календарём, полученная при сверке расписания с календарём
+    """
+
+    def __init__(
+        self,
+        kind,
+        calendar_id,
+        desired=None,
+        event=None,
+        time_changed=False,
+        reminders_changed=False,
+    ):
+        self.kind = kind
+        self.calendar_id = calendar_id
+        self.desired = desired
+        self.event = event
+        self.time_changed = time_changed
+        self.reminders_changed = reminders_changed
+
+    @property
+    def deadline(self):
+        """
+        Срок операции — ближайшее из начал желаемого и текущего события
+        """
+        starts = [self.desired.start] if self.desired else []
+        if self.event is not None and event_start(self.event) is not None:
+            starts.append(event_start(self.event))
+        return min(starts) if starts else None
+
+    def __repr__(self):
+        title = self.desired.title if self.desired else self.event.title
+        return f"Operation({self.kind!r}, {self.calendar_id!r}, {title!r})"
+
+
+def reminder_minutes(reminders):
+    """
+    Нормализует напоминания к кортежу минут, None означает напоминания по умолчанию
+    """
+    if reminders is None:
+        return None
+    if isinstance(reminders, (list, tuple)):
+        return tuple(sorted(reminders)) or None
+    if getattr(reminders, "use_default", False):
+        return None
+    overrides = getattr(reminders, "overrides", None) or []
+    return tuple(sorted(override.reminder_minutes for override in overrides)) or None
+
+
+def diff_event(desired, event):
+    time_changed = (
+        event_start(event) != desired.start
+        or getattr(event.when, "end_time", None) != desired.end
+    )
+    reminders_changed = reminder_minutes(
+        getattr(event, "reminders", None)
+    ) != reminder_minutes(desired.reminders)
+    metadata = desired.metadata()
+    current = event_metadata(event)
+    # Непомеченное или устаревшее событие обновляется ради метаданных
+    metadata_changed = any(current.get(key) != value for key, value in metadata.items())
+    if not time_changed and not reminders_changed and not metadata_changed:
+        return Operation(NOOP, desired.calendar_id, desired, event)
+    return Operation(
+        UPDATE, desired.calendar_id, desired, event, time_changed, reminders_changed
+    )
+
+
+def reconcile(desired_events, index):
+    """
+    Сравнивает желаемые события с событиями календаря и возвращает операции.
+
+    События с владельцем ищутся точно по ключу из метаданных; непомеченные
+    события с тем же названием принимаются под управление, но лишние из них
+    не удаляются. События без владельца ищутся по названию. Внутри группы
+    события сопоставляются по близости времени начала, лишние копии
+    управляемых событий удаляются, недостающие создаются.
+    """
+    groups = defaultdict(list)
+    for desired in desired_events:
+        key = desired.title if desired.owner is None else desired.key
+        groups[(desired.calendar_id, desired.owner, key, desired.day)].append(desired)
+
+    operations = []
+    adopted = set()
+    for (calendar_id, owner, key, day), wanted in groups.items():
+        existing = index.find(calendar_id, key, day, owner)
+        owned = len(existing)
+        if owner is not None:
+            existing += [
+                event
+                for event in index.find(calendar_id, wanted[0].title, day)
+                if id(event) not in adopted
+            ]
+        pairs = sorted(
+            (abs(event_start(event) - desired.start), i, j)
+            for i, desired in enumerate(wanted)
+            for j, event in enumerate(existing)
+        )
+        matched_wanted, matched_existing = set(), set()
+        for _, i, j in pairs:
+            if i in matched_wanted or j in matched_existing:
+                continue
+            matched_wanted.add(i)
+            matched_existing.add(j)
+            if j >= owned:
+                adopted.add(id(existing[j]))
+            operations.append(diff_event(wanted[i], existing[j]))
+        for i, desired in enumerate(wanted):
+            if i not in matched_wanted:
+                operations.append(Operation(CREATE, calendar_id, desired))
+        for j, event in enumerate(existing[:owned]):
+            if j not in matched_existing:
+                operations.append(Operation(DELETE, calendar_id, event=event))
+    return operations
+
+
+def apply_operation(service, operation):
+    """
+    Выполняет одну операцию сверки через CalendarService
+    """
+    desired = operation.desired
+    if operation.kind == CREATE:
+        return service.create_event(
+            desired.request_body(), desired.reminders, operation.calendar_id
+        )
+    if operation.kind == UPDATE:
+        request_body = {}
+        if operation.time_changed:
+            request_body["when"] = desired.request_body()["when"]
+        if desired.owner is not None:
+            request_body["metadata"] = desired.metadata()
+        reminders = desired.reminders if operation.reminders_changed else None
+        return service.update_event(
+            operation.event.id, request_body, reminders, operation.calendar_id
+        )
+    if operation.kind == DELETE:
+        return service.delete_event(operation.event.id, operation.calendar_id)
+    return None
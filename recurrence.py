@@ -0,0 +1,208 @@
+import re
+from datetime import date, datetime, timedelta
+
+WEEKDAYS = {"MO": 0, "TU": 1, "WE": 2, "TH": 3, "FR": 4, "SA": 5, "SU": 6}
+FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY")
+# Элемент BYDAY: день недели с необязательным номером в месяце (1MO, -1FR)
+BYDAY_ITEM = re.compile(r"([+-]?[1-5])?(MO|TU|WE|TH|FR|SA|SU)")
+
+
+class RecurrenceError(ValueError):
+    """
+    Неподдерживаемое или некорректное правило повторения
+    """
+
+
+class RecurrenceRule:
+    """
+    Разобранное правило RRULE (FREQ, INTERVAL, BYDAY, COUNT, UNTIL)
+    с необязательным DTSTART.
+
+    byday — дни недели без номера, ordinals — пары (номер, день недели)
+    для MONTHLY: 1MO — первый понедельник месяца, -1FR — последняя пятница.
+
+    Правило, даты которого зависят от начала серии (INTERVAL больше 1,
+    COUNT, UNTIL, WEEKLY и MONTHLY без BYDAY), требует DTSTART: иначе
+    серия начиналась бы заново в каждом окне запроса.
+    """
+
+    def __init__(
+        self,
+        freq,
+        interval=1,
+        byday=None,
+        count=None,
+        until=None,
+        dtstart=None,
+        ordinals=(),
+    ):
+        self.freq = freq
+        self.interval = interval
+        self.byday = byday
+        self.ordinals = frozenset(ordinals)
+        self.count = count
+        self.until = until
+        self.dtstart = dtstart
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Разбирает строку вида "DTSTART:20250101\\nRRULE:FREQ=WEEKLY;BYDAY=MO,WE"
+        """
+        parts, dtstart = {}, None
+        for line in text.splitlines():
+            line = line.strip()
+            if line.startswith("DTSTART"):
+                dtstart = parse_date(line.split(":", 1)[1])
+            elif line.startswith("RRULE:"):
+                for item in line[len("RRULE:") :].split(";"):
+                    if item:
+                        key, _, value = item.partition("=")
+                        parts[key.upper()] = value.upper()
+            elif line:
+                raise RecurrenceError(f"unsupported recurrence line {line!r}")
+        freq = parts.pop("FREQ", None)
+        if freq not in FREQUENCIES:
+            raise RecurrenceError(f"unsupported FREQ {freq!r} in {text!r}")
+        try:
+            interval = int(parts.pop("INTERVAL", 1))
+            count = int(parts.pop("COUNT")) if "COUNT" in parts else None
+            until = parse_date(parts.pop("UNTIL")) if "UNTIL" in parts else None
+            byday, ordinals = None, set()
+            if "BYDAY" in parts:
+                byday = set()
+                for item in parts.pop("BYDAY").split(","):
+                    match = BYDAY_ITEM.fullmatch(item)
+                    if match is None:
+                        raise ValueError(f"invalid BYDAY {item!r}")
+                    number, weekday = match.groups()
+                    if number is None:
+                        byday.add(WEEKDAYS[weekday])
+                    elif freq == "MONTHLY":
+                        ordinals.add((int(number), WEEKDAYS[weekday]))
+                    else:
+                        raise ValueError(f"BYDAY {item!r} needs FREQ=MONTHLY")
+                byday = sorted(byday)
+        except (KeyError, ValueError) as e:
+            raise RecurrenceError(f"invalid recurrence {text!r}: {e}")
+        if parts:
+            raise RecurrenceError(
+                f"unsupported RRULE parts {sorted(parts)} in {text!r}"
+            )
+        if interval < 1:
+            raise RecurrenceError(f"INTERVAL must be positive in {text!r}")
+        rule = cls(freq, interval, byday, count, until, dtstart, ordinals)
+        if dtstart is None and rule.anchored:
+            raise RecurrenceError(
+                f"DTSTART is required for INTERVAL, COUNT, UNTIL or "
+                f"{freq} without BYDAY in {text!r}"
+            )
+        return rule
+
+    @property
+    def anchored(self):
+        """
+        Зависят ли даты повторений от начала серии
+        """
+        return (
+            self.interval > 1
+            or self.count is not None
+            or self.until is not None
+            or (self.freq != "DAILY" and self.byday is None)
+        )
+
+    def between(self, start: date, days: int):
+        """
+        Даты повторений в окне [start, start + days).
+
+        INTERVAL и COUNT считаются от DTSTART. Правило без DTSTART от начала
+        серии не зависит, и перебор можно начать прямо с окна.
+        """
+        dtstart = self.dtstart or start
+        end = start + timedelta(days=days)
+        if self.until is not None:
+            end = min(end, self.until + timedelta(days=1))
+        occurrences = []
+        produced = 0
+        for day in self.iterate(dtstart):
+            if day >= end or (self.count is not None and produced >= self.count):
+                break
+            produced += 1
+            if day >= start:
+                occurrences.append(day)
+        return occurrences
+
+    def iterate(self, dtstart: date):
+        if self.freq == "DAILY":
+            day = dtstart
+            step = timedelta(days=self.interval)
+            while True:
+                if self.byday is None or day.weekday() in self.byday:
+                    yield day
+                day += step
+        elif self.freq == "WEEKLY":
+            byday = self.byday or [dtstart.weekday()]
+            week = dtstart - timedelta(days=dtstart.weekday())
+            step = timedelta(weeks=self.interval)
+            while True:
+                for weekday in byday:
+                    day = week + timedelta(days=weekday)
+                    if day >= dtstart:
+                        yield day
+                week += step
+        else:
+            year, month = dtstart.year, dtstart.month
+            while True:
+                if self.byday is None:
+                    days = [dtstart.day]
+                else:
+                    last = days_in_month(year, month)
+                    days = [
+                        d
+                        for d in range(1, last + 1)
+                        if self.matches(date(year, month, d), last)
+                    ]
+                for d in days:
+                    if d <= days_in_month(year, month):
+                        day = date(year, month, d)
+                        if day >= dtstart:
+                            yield day
+                month += self.interval
+                year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+
+    def matches(self, day: date, last: int):
+        """
+        Подходит ли день месяца из last дней под BYDAY
+        """
+        weekday = day.weekday()
+        return (
+            weekday in self.byday
+            or ((day.day - 1) // 7 + 1, weekday) in self.ordinals
+            or (-((last - day.day) // 7 + 1), weekday) in self.ordinals
+        )
+
+
+def days_in_month(year, month):
+    following = date(year + month // 12, month % 12 + 1, 1)
+    return (following - timedelta(days=1)).day
+
+
+def parse_date(value):
+    return datetime.strptime(value[:8], "%Y%m%d").date()
+
+
+def expand(rules, start: date, days: int):
+    """
+    Развёртывает правила повторения в даты для окна из days дней.
+
+    rules — словарь {ключ: строка RRULE или None}; None означает
+    ежедневное повторение. Возвращает {ключ: множество дат}.
+    """
+    parsed = {}
+    expanded = {}
+    for key, text in rules.items():
+        text = text or "RRULE:FREQ=DAILY"
+        if text not in parsed:
+            parsed[text] = set(RecurrenceRule.parse(text).between(start, days))
+        expanded[key] = parsed[text]
+    return expanded
@@ -1,8 +1,43 @@
-from service import NylasService
 from config import LoadSchedule
+from index import EventIndex, event_key, event_metadata, event_start, owner_query
+from index import EVENT_KEY
+from reconcile import DesiredEvent, Operation, reconcile, apply_operation
+from reconcile import CREATE, DELETE, NOOP, UPDATE
+from executor import OperationExecutor, lead_report
+from cache import EventCache
+from journal import OperationJournal
+from plan import DEFAULT_APPLY_AT, SchedulePlan, compile_schedule
+from conflicts import ConflictDetector
+from layout import AFTER, AT, BETWEEN, Anchor, Layout, LayoutItem
+from recurrence import expand
+from tracing import span
 
-import pytz
+from collections import defaultdict
 from datetime import datetime, timedelta, date, time
+from typing import TYPE_CHECKING
+from zoneinfo import ZoneInfo
+
+if TYPE_CHECKING:
+    # service тянет SDK Nylas, а планировщику нужен только интерфейс
+    from service import CalendarService
+
+# Продолжительность бодрствования для времени отбоя по умолчанию
+AWAKE_HOURS = 16
+
+
+def in_day(event_span, day: date):
+    """
+    Размещено ли событие и начинается ли оно в день day
+    """
+    return event_span is not None and date.fromtimestamp(event_span[0]) == day
+
+
+def layout_name(calendar_id, routine, ref, n=0):
+    """
+    Имя события в раскладке: (календарь, ключ события, номер повтора).
+    ref — название события той же рутины или полный ключ "рутина/название"
+    """
+    return (calendar_id, ref if "/" in ref else event_key(routine, ref), n)
 
 
 class Scheduler:
@@ -10,96 +45,506 @@ class Scheduler:
     Класс для управления событиями в календаре
     """
 
-    def __init__(self, service: NylasService, schedule: LoadSchedule):
+    def __init__(
+        self,
+        service: "CalendarService",
+        schedule: LoadSchedule | SchedulePlan,
+        max_workers: int = 8,
+        cache: EventCache = None,
+        journal: OperationJournal = None,
+        schedule_id: str = None,
+        busy_calendars=None,
+        shift_conflicts: bool = False,
+    ):
         self.service = service
         self.schedule = schedule
-        tz_info = pytz.timezone("Europe/Moscow")
+        self.plan = (
+            schedule
+            if isinstance(schedule, SchedulePlan)
+            else compile_schedule(schedule)
+        )
+        # Идентификатор расписания в метаданных событий, None — без пометок
+        self.schedule_id = schedule_id or self.plan.name
+        self.executor = OperationExecutor(max_workers)
+        self.cache = cache
+        self.journal = journal
+        self.grant_id = getattr(service, "grant_id", "")
+        tz_info = ZoneInfo("Europe/Moscow")
         self.wake_up = datetime.now(tz=tz_info).replace(second=0) + timedelta(minutes=5)
+        # Время отбоя, по умолчанию через AWAKE_HOURS после подъёма
+        self.shutdown = None
+        self.overrides = {}
+        # Сегодняшняя раскладка последнего расчёта для move_wake_up
+        self.layouts = {}
+        # Календари, занятость которых проверяется перед сверкой (None —
+        # не проверять), и конфликты последнего прогона
+        self.busy_calendars = busy_calendars
+        self.shift_conflicts = shift_conflicts
+        self.conflicts = []
+        # Опережение созданных и изменённых событий в последнем прогоне
+        self.lead = None
 
-    def calc_time(self, routine_title, event_time, event_duration, duration_offset):
-        start_time, end_time = None, None
-        edge_to_run = 10
-        if routine_title == "Morning":
-            start_time = self.wake_up + duration_offset
-            end_time = start_time + event_duration
-        elif self.wake_up.hour > edge_to_run and routine_title == "Day":
-            # TODO: это просто заглушка которая ничего не меняет
-            start_time = event_time
-            end_time = start_time + event_duration
-        elif self.wake_up.hour > edge_to_run and routine_title == "Evening":
-            # TODO: это просто заглушка которая ничего не меняет
-            start_time = event_time
-            end_time = start_time + event_duration
-        return [int(start_time.timestamp()), int(end_time.timestamp())]
+    def routine_ready(self, calendar_id, routine_title):
+        """
+        Должна ли рутина уже ставиться сегодня: время подъёма не раньше
+        её apply_at из расписания
+        """
+        minute = self.plan.apply_at.get(
+            (calendar_id, routine_title), DEFAULT_APPLY_AT.get(routine_title)
+        )
+        if minute is None:
+            return False
+        return self.wake_up.hour * 60 + self.wake_up.minute >= minute
 
-    def create_routine(self):
-        for calendar in self.schedule:
-            # calendar_title = calendar["calendar_title"]
-            calendar_id = calendar["calendar_id"]
-            for routine in calendar["calendar_routine"]:
-                routine_title = routine["title"]
-                recurrence = routine["recurrence"]
-                duration_offset = timedelta(minutes=0)
-                for event in routine["schedule"]:
-                    event_title = event["title"]
-                    hour, minute = map(int, event["time"].split(":"))
-                    event_time = datetime.combine(
-                        date.today(), time(hour=hour, minute=minute)
-                    )
-                    event_duration = timedelta(minutes=event["duration"])
-                    event_reminders = event["reminders"]
-                    search_response = self.service.search_events(
-                        {
-                            "calendar_id": calendar_id,
-                            "title": event_title,
-                            "start": int(
-                                datetime.combine(
-                                    datetime.now(), time(hour=0, minute=0, second=0)
-                                ).timestamp()
-                            ),
-                            "end": int(
-                                (
-                                    event_time + event_duration + timedelta(hours=2)
-                                ).timestamp()
-                            ),
-                        }
-                    )
-                    if search_response.data:
-                        self.service.delete_event(
-                            search_response.data[0].id, calendar_id
-                        )
-                        # self.service.create_event(
-                        #     {
-                        #         "title": event_title,
-                        #         "when": {
-                        #             "start_time": int(
-                        #                 (event_time + timedelta(days=1)).timestamp()
-                        #             ),
-                        #             "end_time": int(
-                        #                 (
-                        #                     event_time
-                        #                     + event_duration
-                        #                     + timedelta(days=1)
-                        #                 ).timestamp()
-                        #             ),
-                        #         },
-                        #         "recurrence": [recurrence],
-                        #     },
-                        #     event_reminders,
-                        #     calendar_id,
-                        # )
-                    start_time, end_time = self.calc_time(
-                        routine_title, event_time, event_duration, duration_offset
+    @property
+    def wake_up_ts(self):
+        return int(self.wake_up.timestamp())
+
+    @property
+    def shutdown_ts(self):
+        if self.shutdown is None:
+            return self.wake_up_ts + AWAKE_HOURS * 3600
+        return int(self.shutdown.timestamp())
+
+    def anchor(self, event, day, day_start):
+        """
+        Привязка начала события в раскладке дня.
+
+        Запись overrides привязывает начало рутины к указанному времени,
+        затем действует явная привязка anchor из расписания. По умолчанию
+        сегодняшняя утренняя рутина идёт от подъёма, остальные события
+        стоят на времени из расписания.
+        """
+        override = self.overrides.get((event.routine, day))
+        if override is not None:
+            return Anchor.at(override + event.offset * 60)
+        if event.anchor is not None:
+            kind, ref, offset = event.anchor
+            if kind == AT:
+                return Anchor.at(day_start + offset * 60)
+            if kind == AFTER:
+                return Anchor.after(
+                    layout_name(event.calendar_id, event.routine, ref), offset * 60
+                )
+            if kind == BETWEEN:
+                return Anchor.between(
+                    *(
+                        layout_name(event.calendar_id, event.routine, title)
+                        for title in ref
                     )
-                    self.service.create_event(
-                        {
-                            "title": event_title,
-                            "when": {
-                                "start_time": start_time,
-                                "end_time": end_time,
-                            },
-                        },
-                        event_reminders,
-                        calendar_id,
+                )
+            return Anchor(kind, (kind,), offset * 60)
+        if day == date.today() and event.routine == "Morning":
+            return Anchor.wake_up(event.offset * 60)
+        return Anchor.at(day_start + event.minute * 60)
+
+    def day_layout(self, day, events):
+        """
+        Раскладка событий плана events на день day и список пар
+        (имя в раскладке, событие плана).
+
+        Сегодня переменные раскладки — wake_up и shutdown планировщика,
+        в другие дни подъём берётся из начала утренней рутины по расписанию.
+        """
+        seen = defaultdict(int)
+        placed = []
+        for event in events:
+            name = layout_name(event.calendar_id, event.routine, event.title)
+            placed.append((name[:2] + (seen[name],), event))
+            seen[name] += 1
+        day_start = int(datetime.combine(day, time()).timestamp())
+        if day == date.today():
+            wake_up, shutdown = self.wake_up_ts, self.shutdown_ts
+        else:
+            morning = [event.minute for event in events if event.routine == "Morning"]
+            wake_up = day_start + min(morning) * 60 if morning else None
+            shutdown = None if wake_up is None else wake_up + AWAKE_HOURS * 3600
+        items = [
+            LayoutItem(
+                name,
+                self.anchor(event, day, day_start),
+                event.duration * 60,
+                None if event.min_duration is None else event.min_duration * 60,
+                None if event.not_before is None else day_start + event.not_before * 60,
+                None if event.not_after is None else day_start + event.not_after * 60,
+            )
+            for name, event in placed
+        ]
+        return Layout(items, wake_up=wake_up, shutdown=shutdown), placed
+
+    def desired_event(self, event, event_span):
+        return DesiredEvent(
+            event.calendar_id,
+            event.routine,
+            event.title,
+            *event_span,
+            event.reminders,
+            self.schedule_id,
+        )
+
+    def scheduled_today(self, event, day):
+        """
+        Ставится ли событие сегодня: привязанные через overrides рутины
+        ставятся всегда, остальные — когда рутине пора запускаться
+        """
+        return (event.routine, day) in self.overrides or self.routine_ready(
+            event.calendar_id, event.routine
+        )
+
+    def desired_events(self, day: date, days: int = 1, detector=None):
+        """
+        Желаемый набор событий на days дней начиная с day.
+
+        Дни выбираются по правилам повторения рутин, время событий
+        считается раскладкой дня (см. anchor и day_layout). Запись
+        в overrides {(routine, date): timestamp} привязывает начало рутины
+        в этот день к указанному времени. С detector события дня проверяются
+        на конфликты (см. resolve_conflicts) до выдачи.
+        """
+        today = date.today()
+        occurrences = expand(self.plan.recurrence, day, days)
+        for current in (day + timedelta(days=n) for n in range(days)):
+            events = [
+                event
+                for event in self.plan
+                if current in occurrences[(event.calendar_id, event.routine)]
+            ]
+            with span("layout", day=current):
+                layout, placed = self.day_layout(current, events)
+            if current == today:
+                self.layouts = {today: (layout, placed)}
+            desired = {}
+            for name, event in placed:
+                if current == today and not self.scheduled_today(event, current):
+                    continue
+                event_span = layout.span(name)
+                if not in_day(event_span, current):
+                    continue
+                desired[name] = (self.desired_event(event, event_span), event)
+            if detector is not None:
+                with span("conflicts", day=current):
+                    self.resolve_conflicts(detector, layout, desired, current)
+            for desired_event, _ in desired.values():
+                yield desired_event
+
+    def move_wake_up(self, wake_up: datetime):
+        """
+        Переносит время подъёма и сдвигает в календаре только те события,
+        время которых от этого изменилось
+        """
+        today = date.today()
+        if today not in self.layouts:
+            for _ in self.desired_events(today):
+                pass
+        layout, placed = self.layouts[today]
+        self.wake_up = wake_up
+        with span("layout", day=today):
+            moved = layout.update(wake_up=self.wake_up_ts, shutdown=self.shutdown_ts)
+        moved_events = [
+            (name, event)
+            for name, event in placed
+            if name in moved and self.scheduled_today(event, today)
+        ]
+        index = EventIndex(self.service)
+        start, end = EventIndex.day_window(today)
+        for calendar_id in dict.fromkeys(
+            event.calendar_id for _, event in moved_events
+        ):
+            index.load(calendar_id, start, end)
+        desired, operations = [], []
+        for name, event in moved_events:
+            event_span = moved[name]
+            if in_day(event_span, today):
+                desired.append(self.desired_event(event, event_span))
+                continue
+            # Событие больше не помещается в день
+            key = event_key(event.routine, event.title)
+            for found in index.find(event.calendar_id, key, today, self.schedule_id):
+                operations.append(Operation(DELETE, event.calendar_id, event=found))
+        with span("reconcile"):
+            operations += reconcile(desired, index)
+        return self.execute(operations)
+
+    def create_routine(self):
+        with span("create_routine"):
+            resumed = self.resume()
+            today = date.today()
+            index = EventIndex(self.service)
+            with span("plan"):
+                desired_events = list(self.desired_events(today))
+            for calendar_id in dict.fromkeys(e.calendar_id for e in desired_events):
+                index.load(calendar_id, *EventIndex.day_window(today))
+            return resumed + self.execute(self.recreate(index, desired_events, today))
+
+    async def acreate_routine(self):
+        """
+        Асинхронный вариант create_routine для AsyncCalendarService.
+
+        События календарей загружаются параллельно, операции выполняются
+        через asyncio.gather не больше max_workers одновременно.
+        """
+        import asyncio
+
+        with span("create_routine"):
+            resumed = []
+            if self.journal is not None and (pending := self.journal.pending()):
+                resumed = await self.aexecute(pending)
+            today = date.today()
+            index = EventIndex(self.service)
+            with span("plan"):
+                desired_events = list(self.desired_events(today))
+            start, end = EventIndex.day_window(today)
+            await asyncio.gather(
+                *(
+                    index.aload(calendar_id, start, end)
+                    for calendar_id in dict.fromkeys(
+                        event.calendar_id for event in desired_events
                     )
-                    duration_offset += event_duration
+                )
+            )
+            return resumed + await self.aexecute(
+                self.recreate(index, desired_events, today)
+            )
+
+    @staticmethod
+    def recreate(index, desired_events, day):
+        """
+        Операции пересоздания: удалить найденное событие и создать заново
+        """
+        operations = []
+        for desired in desired_events:
+            calendar_id = desired.calendar_id
+            found = index.find(
+                calendar_id, desired.key, day, desired.owner
+            ) or index.find(calendar_id, desired.title, day)
+            if found:
+                index.remove(calendar_id, found[0])
+                # desired у удаления — замена события: обе операции попадают
+                # в одну цепочку исполнителя
+                operations.append(
+                    Operation(DELETE, calendar_id, desired=desired, event=found[0])
+                )
+            operations.append(Operation(CREATE, calendar_id, desired))
+        return operations
+
+    def reconcile_routine(self, verify: bool = False, days: int = 1):
+        """
+        Приводит календари к расписанию минимальным набором изменений.
+
+        days задаёт горизонт планирования: события на все дни сверяются
+        одним оконным запросом на календарь. Если подключён кэш,
+        календари, все события которых есть в кэше, сверяются без запросов
+        к провайдеру. verify=True игнорирует кэш, сверяет все календари
+        с провайдером и пересобирает записи кэша.
+        """
+        with span("reconcile_routine", days=days, verify=verify):
+            resumed = self.resume()
+            return resumed + self.execute(self.drift(verify, days))
+
+    def drift(self, verify: bool = False, days: int = 1):
+        """
+        Операции, которые привели бы календари к расписанию, без их выполнения
+        """
+        today = date.today()
+        detector = None
+        if self.busy_calendars is not None:
+            self.conflicts = []
+            with span("conflicts"):
+                detector = self.conflict_detector(today, days)
+        with span("plan"):
+            desired = list(self.desired_events(today, days, detector))
+        operations, calendars = [], {event.calendar_id for event in desired}
+        if self.cache is not None and not verify:
+            with span("cache"):
+                operations, calendars = self.cache.plan(self.grant_id, desired)
+        index = EventIndex(self.service)
+        start, end = EventIndex.day_window(today, days)
+        for calendar_id in calendars:
+            index.load(calendar_id, start, end)
+        with span("reconcile"):
+            operations += reconcile(
+                [event for event in desired if event.calendar_id in calendars],
+                index,
+            )
+        return operations
+
+    def conflict_detector(self, day: date, days: int = 1):
+        """
+        Занятость календарей расписания и busy_calendars на days дней
+        начиная с day
+        """
+        calendars = dict.fromkeys(
+            [*(event.calendar_id for event in self.plan), *self.busy_calendars]
+        )
+        start, end = EventIndex.day_window(day, days)
+        return ConflictDetector(self.service, calendars).load(
+            int(start.timestamp()),
+            int(end.timestamp()),
+            self.schedule_id,
+            {(event.calendar_id, event.title) for event in self.plan},
+        )
+
+    def resolve_conflicts(self, detector, layout, desired, day: date):
+        """
+        Ищет пересечения событий дня desired {имя: (желаемое, событие плана)}
+        с занятостью и добавляет их в conflicts. При shift_conflicts гибкие
+        события сдвигаются в ближайшее свободное окно того же дня:
+        сдвинутое событие закрепляется в раскладке, а привязанные к нему
+        события пересчитываются до своей проверки. События, выпавшие из дня,
+        убираются из desired.
+        """
+        names = {
+            id(desired_event): name for name, (desired_event, _) in desired.items()
+        }
+
+        def moved(desired_event):
+            changes = []
+            shifted = layout.pin(names[id(desired_event)], desired_event.start)
+            for name, event_span in shifted.items():
+                if name not in desired or desired[name][0] is desired_event:
+                    continue
+                if not in_day(event_span, day):
+                    changes.append((desired.pop(name)[0], None))
+                else:
+                    changes.append((desired[name][0], event_span))
+            return changes
+
+        ordered = sorted(desired.items(), key=lambda item: layout.rank[item[0]])
+        self.conflicts += detector.resolve(
+            [desired_event for _, (desired_event, _) in ordered],
+            lambda desired_event: self.shift_conflicts
+            and desired[names[id(desired_event)]][1].flexible,
+            moved=moved,
+        )
+
+    def sweep(self, calendars=(), day: date = None):
+        """
+        Удаляет из календарей события этого расписания, ключей которых
+        в расписании больше нет.
+
+        События выбираются одним постраничным запросом на календарь по
+        метке владельца в метаданных, начиная с day (по умолчанию с
+        сегодняшнего дня): прошедшие вхождения остаются историей. Кроме
+        календарей расписания обходятся calendars — например, убранные
+        из него: сами по себе они больше нигде не видны.
+        """
+        if self.schedule_id is None:
+            return []
+        with span("sweep"):
+            keys = {
+                (event.calendar_id, event_key(event.routine, event.title))
+                for event in self.plan
+            }
+            start, _ = EventIndex.day_window(date.today() if day is None else day)
+            operations = []
+            for calendar_id in sorted({c for c, _ in keys}.union(calendars)):
+                events = self.service.iter_events(
+                    {
+                        "calendar_id": calendar_id,
+                        "start": int(start.timestamp()),
+                        **owner_query(self.schedule_id),
+                    },
+                    select=("id", "title", "metadata"),
+                )
+                for event in events:
+                    if (calendar_id, event_metadata(event).get(EVENT_KEY)) not in keys:
+                        operations.append(Operation(DELETE, calendar_id, event=event))
+            return self.execute(operations)
+
+    def resume(self):
+        """
+        Доделывает прерванный прогон по журналу, если он есть.
+
+        Выполняются только операции, не отмеченные в журнале как выполненные,
+        без повторного поиска событий. Возвращает их результаты; обычная
+        сверка после этого идёт как всегда и исправляет то, что не удалось.
+        """
+        if self.journal is None:
+            return []
+        pending = self.journal.pending()
+        if not pending:
+            return []
+        return self.execute(pending)
+
+    def execute(self, operations):
+        changes = self.submit(operations, self.apply)
+        with span("apply", operations=changes):
+            results = self.executor.run()
+        return self.complete(operations, results)
+
+    async def aexecute(self, operations):
+        changes = self.submit(operations, self.aapply)
+        with span("apply", operations=changes):
+            results = await self.executor.arun()
+        return self.complete(operations, results)
+
+    def submit(self, operations, fn):
+        changes = [operation for operation in operations if operation.kind != NOOP]
+        if self.journal is not None:
+            self.journal.begin(changes)
+        for operation in changes:
+            self.executor.submit(
+                self.chain_key(operation),
+                operation,
+                fn,
+                operation,
+                deadline=operation.deadline,
+            )
+        return len(changes)
+
+    def complete(self, operations, results):
+        if operations:
+            self.service.flush()
+        self.lead = lead_report(
+            [result for result in results if result.operation.kind in (CREATE, UPDATE)]
+        )
+        if self.cache is not None:
+            self.cache.record(self.grant_id, operations, results)
+        if self.journal is not None:
+            self.journal.finish()
+        return results
+
+    def apply(self, operation):
+        with self.operation_span(operation):
+            result = apply_operation(self.service, operation)
+        if self.journal is not None:
+            self.journal.commit(operation, result)
+        return result
+
+    async def aapply(self, operation):
+        with self.operation_span(operation):
+            # Для AsyncCalendarService apply_operation возвращает корутину
+            result = await apply_operation(self.service, operation)
+        if self.journal is not None:
+            self.journal.commit(operation, result)
+        return result
+
+    @staticmethod
+    def chain_key(operation):
+        """
+        Ключ цепочки исполнителя — группа сверки (календарь, владелец,
+        событие, день): удаление и повторное создание одного события идут
+        по порядку, а разные события и дни — каждое со своим сроком.
+        Удаление при пересоздании несёт desired замены и ключуется по нему
+        """
+        desired = operation.desired
+        if desired is None:
+            event = operation.event
+            start = event_start(event)
+            if start is None:
+                # Событие из журнала без времени — отдельная цепочка
+                return (operation.calendar_id, event.id)
+            return EventIndex.key(operation.calendar_id, event, start)
+        day = date.fromtimestamp(desired.start)
+        return (operation.calendar_id, desired.owner, desired.key, day)
+
+    @staticmethod
+    def operation_span(operation):
+        title = (operation.desired or operation.event).title
+        routine = operation.desired.routine if operation.desired else None
+        return span(
+            operation.kind,
+            calendar=operation.calendar_id,
+            routine=routine,
+            event=title,
+        )
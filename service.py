@@ -1,4 +1,182 @@
+import threading
+
+import requests
 from nylas import Client
+from nylas.handler.http_client import HttpClient, _validate_response
+from nylas.models.errors import NylasSdkTimeoutError
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError
+
+from throttle import Throttle, grant_bucket
+
+# Максимальный размер страницы events.list в API Nylas
+MAX_PAGE_SIZE = 200
+# Поля, без которых SDK не соберёт модель Event из ответа
+REQUIRED_EVENT_FIELDS = (
+    "id",
+    "grant_id",
+    "calendar_id",
+    "busy",
+    "participants",
+    "when",
+)
+
+
+def build_reminders(reminders):
+    """
+    Тело запроса для напоминаний события
+    """
+    if not reminders:
+        return {"use_default": True}
+    return {
+        "use_default": False,
+        "overrides": [
+            {"reminder_minutes": minutes, "reminder_method": "display"}
+            for minutes in reminders
+        ],
+    }
+
+
+class CountingAdapter(HTTPAdapter):
+    """
+    HTTPAdapter, считающий отправленные запросы и установленные соединения
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.connections = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: self.counting_pool(pool_class)
+            for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+    def counting_pool(self, pool_class):
+        adapter = self
+
+        class CountingConnection(pool_class.ConnectionCls):
+            def connect(self):
+                adapter.count("connections")
+                super().connect()
+
+        return type(
+            pool_class.__name__, (pool_class,), {"ConnectionCls": CountingConnection}
+        )
+
+    def send(self, request, *args, **kwargs):
+        self.count("requests")
+        return super().send(request, *args, **kwargs)
+
+
+def pooled_session(
+    pool_size: int = 10,
+    pool_block: bool = True,
+    keep_alive: bool = True,
+    gzip: bool = True,
+):
+    """
+    Сессия requests с пулом соединений на pool_size соединений к хосту.
+
+    pool_block=True заставляет ждать свободное соединение вместо открытия
+    лишних, которые после запроса всё равно закрываются. Сессию можно
+    разделить между несколькими NylasService одного процесса: ключ API
+    передаётся в заголовках каждого запроса.
+    """
+    session = requests.Session()
+    adapter = CountingAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, pool_block=pool_block
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if not keep_alive:
+        session.headers["Connection"] = "close"
+    session.headers["Accept-Encoding"] = "gzip, deflate" if gzip else "identity"
+    return session
+
+
+class PooledHttpClient(HttpClient):
+    """
+    HTTP-клиент Nylas, переиспользующий keep-alive соединения из общего пула.
+
+    timeout — таймаут чтения, connect_timeout — таймаут установки
+    соединения. requests работает только по HTTP/1.1, HTTP/2 доступен
+    в AsyncNylasService.
+    """
+
+    def __init__(
+        self,
+        api_server,
+        api_key,
+        timeout,
+        pool_size: int = 10,
+        connect_timeout: float = 10,
+        session: requests.Session = None,
+        **session_options,
+    ):
+        super().__init__(api_server, api_key, timeout)
+        self.connect_timeout = connect_timeout
+        self.owns_session = session is None
+        self.session = session or pooled_session(pool_size, **session_options)
+
+    def connection_stats(self):
+        """
+        Число установленных соединений и отправленных запросов сессии.
+        reused — запросы по уже открытым keep-alive соединениям
+        """
+        adapters = [
+            adapter
+            for adapter in set(self.session.adapters.values())
+            if isinstance(adapter, CountingAdapter)
+        ]
+        connections = sum(adapter.connections for adapter in adapters)
+        requests_count = sum(adapter.requests for adapter in adapters)
+        return {
+            "connections": connections,
+            "requests": requests_count,
+            "reused": max(0, requests_count - connections),
+        }
+
+    def _execute(
+        self,
+        method,
+        path,
+        headers=None,
+        query_params=None,
+        request_body=None,
+        data=None,
+        overrides=None,
+    ) -> dict:
+        request = self._build_request(
+            method, path, headers, query_params, request_body, data, overrides
+        )
+        timeout = self.timeout
+        if overrides and overrides.get("timeout"):
+            timeout = overrides["timeout"]
+        timeout = (self.connect_timeout, timeout)
+        try:
+            response = self.session.request(
+                request["method"],
+                request["url"],
+                headers=request["headers"],
+                json=request_body,
+                timeout=timeout,
+                data=data,
+            )
+        except requests.exceptions.Timeout as exc:
+            raise NylasSdkTimeoutError(url=request["url"], timeout=timeout) from exc
+        return _validate_response(response)
+
+    def close(self):
+        if self.owns_session:
+            self.session.close()
 
 
 class CalendarService:
@@ -9,52 +187,182 @@ class CalendarService:
     def create_event(self, request_body, reminders, calendar_id):
         raise NotImplementedError
 
+    def update_event(self, event_id, request_body, reminders, calendar_id):
+        raise NotImplementedError
+
     def delete_event(self, event_id, calendar_id):
         raise NotImplementedError
 
     def search_events(self, query_params):
+        """
+        Одна страница выдачи: ответ с полями data и next_cursor
+        """
+        raise NotImplementedError
+
+    def iter_events(self, query_params, page_size: int = 200, select=None):
+        """
+        Лениво перебирает события выдачи, следуя за next_cursor.
+
+        Следующая страница запрашивается, только когда вызывающий дочитал
+        предыдущую, поэтому прерванный перебор не тянет лишних страниц,
+        а в памяти держится не больше одной страницы. select ограничивает
+        набор полей событий в ответе.
+        """
+        query_params = self.page_query(query_params, page_size, select)
+        while True:
+            response = self.search_events(query_params)
+            yield from response.data
+            if not response.next_cursor:
+                return
+            query_params["page_token"] = response.next_cursor
+
+    def page_query(self, query_params, page_size, select=None):
+        """
+        Параметры запроса страницы с её размером и выбранными полями
+        """
+        query_params = dict(query_params, limit=page_size)
+        if select:
+            query_params["select"] = ",".join(select)
+        return query_params
+
+    def list_events(self, query_params):
+        return list(self.iter_events(query_params))
+
+    def flush(self):
+        """
+        Сохраняет накопленные изменения. Сервисы, пишущие сразу, ничего не делают
+        """
+
+
+class AsyncCalendarService:
+    """
+    Абстрактный асинхронный сервис для работы с календарём
+    """
+
+    async def create_event(self, request_body, reminders, calendar_id):
+        raise NotImplementedError
+
+    async def update_event(self, event_id, request_body, reminders, calendar_id):
+        raise NotImplementedError
+
+    async def delete_event(self, event_id, calendar_id):
+        raise NotImplementedError
+
+    async def search_events(self, query_params):
+        """
+        Одна страница выдачи: ответ с полями data и next_cursor
+        """
         raise NotImplementedError
 
+    async def iter_events(self, query_params, page_size: int = 200, select=None):
+        """
+        Асинхронный вариант CalendarService.iter_events
+        """
+        query_params = self.page_query(query_params, page_size, select)
+        while True:
+            response = await self.search_events(query_params)
+            for event in response.data:
+                yield event
+            if not response.next_cursor:
+                return
+            query_params["page_token"] = response.next_cursor
+
+    page_query = CalendarService.page_query
+    flush = CalendarService.flush
+
+    async def list_events(self, query_params):
+        return [event async for event in self.iter_events(query_params)]
+
 
 class NylasService(CalendarService):
     """
-    Реализация CalendarService для работы с API Nylas
+    Реализация CalendarService для работы с API Nylas.
+
+    Параметры транспорта: pool_size — размер пула соединений (обычно равен
+    числу потоков исполнителя), connect_timeout и read_timeout — таймауты
+    в секундах, keep_alive и gzip — переиспользование соединений и сжатие
+    ответов, session — общая сессия pooled_session() для нескольких сервисов.
     """
 
-    def __init__(self, grant_id: str, api_key: str, api_uri: str):
+    def __init__(
+        self,
+        grant_id: str,
+        api_key: str,
+        api_uri: str,
+        rate: float = 5.0,
+        burst: float = 10.0,
+        max_retries: int = 4,
+        pool_size: int = 10,
+        connect_timeout: float = 10,
+        read_timeout: float = None,
+        keep_alive: bool = True,
+        gzip: bool = True,
+        session: requests.Session = None,
+    ):
         self.grant_id = grant_id
         self.client = Client(api_key, api_uri)
+        self.client.http_client = PooledHttpClient(
+            api_uri,
+            api_key,
+            read_timeout or self.client.http_client.timeout,
+            pool_size,
+            connect_timeout,
+            session,
+            keep_alive=keep_alive,
+            gzip=gzip,
+        )
+        self.throttle = Throttle(
+            grant_bucket(grant_id, rate, burst),
+            max_retries=max_retries,
+            transient_errors=(NylasSdkTimeoutError, ConnectionError),
+        )
+
+    @property
+    def stats(self):
+        return {
+            **self.throttle.stats,
+            **self.client.http_client.connection_stats(),
+        }
+
+    def close(self):
+        self.client.http_client.close()
 
     def create_event(self, request_body, reminders, calendar_id):
-        # TODO: добвить функицю которая будет составлять реквест для напоминаний события
-        reminders_list = []
-        if reminders:
-            for minutes in reminders:
-                reminders_list.append(
-                    {
-                        "reminder_minutes": minutes,
-                        "reminder_method": "display",
-                    }
-                )
-
-            request_body["reminders"] = {
-                "use_default": False,
-                "overrides": reminders_list,
-            }
-        else:
-            request_body["reminders"] = {"use_default": True}
-        return self.client.events.create(
+        request_body["reminders"] = build_reminders(reminders)
+        # Создание не идемпотентно: повторяем только отклонённые провайдером запросы
+        return self.throttle.call(
+            self.client.events.create,
             self.grant_id,
             request_body,
             {"notify_participants": False, "calendar_id": calendar_id},
+            idempotent=False,
+        )
+
+    def update_event(self, event_id, request_body, reminders, calendar_id):
+        if reminders is not None:
+            request_body["reminders"] = build_reminders(reminders)
+        return self.throttle.call(
+            self.client.events.update,
+            self.grant_id,
+            event_id,
+            request_body,
+            {"notify_participants": False, "calendar_id": calendar_id},
         )
 
     def delete_event(self, event_id, calendar_id):
-        return self.client.events.destroy(
+        return self.throttle.call(
+            self.client.events.destroy,
             self.grant_id,
             event_id,
             {"notify_participants": False, "calendar_id": calendar_id},
         )
 
     def search_events(self, query_params):
-        return self.client.events.list(self.grant_id, query_params)
+        return self.throttle.call(self.client.events.list, self.grant_id, query_params)
+
+    def page_query(self, query_params, page_size, select=None):
+        if select:
+            select = dict.fromkeys((*REQUIRED_EVENT_FIELDS, *select))
+        return CalendarService.page_query(
+            self, query_params, min(page_size, MAX_PAGE_SIZE), select
+        )
@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import sys
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from config import LoadConfig, LoadSchedule
+from guard import READ_TIMEOUT, GuardedService
+from scheduler import Scheduler
+from service import NylasService, pooled_session
+
+# Пул клиентов внутри процесса-воркера: один прогретый сервис на grant
+clients = {}
+# Общие сессии по адресу API: пользователи шарда делят одни соединения
+sessions = {}
+
+
+class Tenant:
+    """
+    Пользователь планировщика: его доступ к API и файлы расписаний
+    """
+
+    def __init__(self, name, config_path, schedule_paths, rate=5.0, burst=10.0):
+        self.name = name
+        self.config_path = config_path
+        self.schedule_paths = list(schedule_paths)
+        self.rate = rate
+        self.burst = burst
+
+
+def load_tenants(path):
+    """
+    Загружает список пользователей из манифеста или каталога.
+
+    Манифест — JSON-список объектов {"name", "config", "schedules",
+    "rate", "burst"}, пути в нём считаются от каталога манифеста.
+    Каталог — подкаталоги пользователей с config.json и файлами
+    расписаний *.json.
+    """
+    if os.path.isdir(path):
+        tenants = []
+        for name in sorted(os.listdir(path)):
+            tenant_dir = os.path.join(path, name)
+            config_path = os.path.join(tenant_dir, "config.json")
+            if not os.path.isfile(config_path):
+                continue
+            schedules = sorted(
+                os.path.join(tenant_dir, file_name)
+                for file_name in os.listdir(tenant_dir)
+                if file_name.endswith(".json") and file_name != "config.json"
+            )
+            tenants.append(Tenant(name, config_path, schedules))
+        return tenants
+
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, "r", encoding="utf-8") as file:
+        manifest = json.load(file)
+    return [
+        Tenant(
+            entry["name"],
+            os.path.join(base, entry["config"]),
+            [os.path.join(base, schedule) for schedule in entry["schedules"]],
+            entry.get("rate", 5.0),
+            entry.get("burst", 10.0),
+        )
+        for entry in manifest
+    ]
+
+
+def nylas_service(tenant):
+    grant_id, api_key, api_uri = LoadConfig(tenant.config_path).load()
+    key = (grant_id, api_key, api_uri)
+    if key not in clients:
+        if api_uri not in sessions:
+            sessions[api_uri] = pooled_session()
+        clients[key] = GuardedService(
+            NylasService(
+                grant_id,
+                api_key,
+                api_uri,
+                rate=tenant.rate,
+                burst=tenant.burst,
+                session=sessions[api_uri],
+                read_timeout=READ_TIMEOUT,
+            )
+        )
+    return clients[key]
+
+
+def run_tenant(tenant, factory, max_workers, days):
+    started = time.perf_counter()
+    report = {"tenant": tenant.name, "operations": Counter(), "errors": []}
+    try:
+        service = factory(tenant)
+        for path in tenant.schedule_paths:
+            scheduler = Scheduler(
+                service, LoadSchedule(path).compile(), max_workers=max_workers
+            )
+            for result in scheduler.reconcile_routine(days=days):
+                report["operations"][result.operation.kind] += 1
+                if not result.ok:
+                    report["errors"].append(f"{result.operation} | {result.error}")
+        report["stats"] = getattr(service, "stats", {})
+    except Exception as e:
+        report["errors"].append(f"{type(e).__name__}: {e}")
+    report["operations"] = dict(report["operations"])
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def run_shard(shard, factory, max_workers, days):
+    return [run_tenant(tenant, factory, max_workers, days) for tenant in shard]
+
+
+def shard_tenants(tenants, shards):
+    """
+    Раскладывает пользователей по шардам стабильно по имени, чтобы
+    один пользователь всегда попадал в один процесс и делил одну квоту
+    """
+    buckets = [[] for _ in range(shards)]
+    for tenant in tenants:
+        buckets[zlib.crc32(tenant.name.encode("utf-8")) % shards].append(tenant)
+    return [bucket for bucket in buckets if bucket]
+
+
+def run_tenants(tenants, processes=None, factory=nylas_service, max_workers=8, days=1):
+    """
+    Запускает расписания всех пользователей в пуле процессов и
+    возвращает сводный отчёт
+    """
+    processes = processes or os.cpu_count() or 1
+    started = time.perf_counter()
+    shards = shard_tenants(tenants, processes)
+    with ProcessPoolExecutor(max_workers=len(shards) or 1) as pool:
+        futures = [
+            pool.submit(run_shard, shard, factory, max_workers, days)
+            for shard in shards
+        ]
+        reports = [report for future in futures for report in future.result()]
+    totals = Counter()
+    for report in reports:
+        totals.update(report["operations"])
+    return {
+        "tenants": len(reports),
+        "failed_tenants": sum(1 for report in reports if report["errors"]),
+        "operations": dict(totals),
+        "seconds": round(time.perf_counter() - started, 3),
+        "reports": sorted(reports, key=lambda report: report["tenant"]),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-tenant scheduler runner")
+    parser.add_argument("tenants", help="manifest JSON or directory of tenants")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--report", default=None)
+    args = parser.parse_args(argv)
+    summary = run_tenants(
+        load_tenants(args.tenants),
+        args.processes,
+        max_workers=args.workers,
+        days=args.days,
+    )
+    output = json.dumps(summary, ensure_ascii=False, indent=2)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as file:
+            file.write(output)
+    else:
+        print(output)
+    return 1 if summary["failed_tenants"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,8 @@
 from service import NylasService
 from config import LoadSchedule
 
-import pytz
 from datetime import datetime, timedelta, date, time
+from zoneinfo import ZoneInfo
 
 
 class Scheduler:
@@ -13,7 +13,7 @@ class Scheduler:
     def __init__(self, service: NylasService, schedule: LoadSchedule):
         self.service = service
         self.schedule = schedule
-        tz_info = pytz.timezone("Europe/Moscow")
+        tz_info = ZoneInfo("Europe/Moscow")
         self.wake_up = datetime.now(tz=tz_info).replace(second=0) + timedelta(minutes=5)
 
     def calc_time(self, routine_title, event_time, event_duration, duration_offset):
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from fake import FakeCalendarService
+from scheduler import Scheduler
+
+
+@pytest.fixture
+def provider(tmp_path, monkeypatch):
+    service = FakeCalendarService()
+    service.close = lambda: None
+    monkeypatch.setattr("service.NylasService", lambda *args, **kwargs: service)
+    config = tmp_path / "config.json"
+    config.write_text(json.dumps({"grant_id": "g", "api_key": "k", "api_uri": "u"}))
+    schedule = tmp_path / "home.json"
+    routine = {
+        "title": "Day",
+        "apply_at": "00:00",
+        "schedule": [{"title": "Lunch", "time": "12:00", "duration": 30}],
+    }
+    schedule.write_text(
+        json.dumps([{"calendar_id": "cal", "calendar_routine": [routine]}])
+    )
+    return service, ["--config", str(config), "--schedule", str(schedule)]
+
+
+@pytest.fixture
+def schedule():
+    """
+    Фабрика расписания из двух событий рутины Day в календаре cal
+    """
+
+    def make(time="13:00"):
+        return [
+            {
+                "calendar_title": "c",
+                "calendar_id": "cal",
+                "calendar_routine": [
+                    {
+                        "title": "Day",
+                        "schedule": [
+                            {"title": "Lunch", "time": time, "duration": 30},
+                            {"title": "Walk", "time": "15:00", "duration": 20},
+                        ],
+                    }
+                ],
+            }
+        ]
+
+    return make
+
+
+@pytest.fixture
+def scheduler():
+    """
+    Фабрика однопоточного планировщика с подъёмом в 12 часов, чтобы
+    рутина Day ставилась в любое время запуска
+    """
+
+    def make(service, plan, **kwargs):
+        result = Scheduler(service, plan, max_workers=1, **kwargs)
+        result.wake_up = result.wake_up.replace(hour=12)
+        return result
+
+    return make
@@ -0,0 +1,119 @@
+import asyncio
+import json
+from uuid import uuid4
+
+import pytest
+
+from async_service import AsyncNylasService
+from fake import FakeApiError, FakeCalendarService
+from reconcile import CREATE, DELETE
+
+# httpx ставится только с дополнением async
+httpx = pytest.importorskip("httpx")
+
+API_URI = "https://api.test"
+
+
+def event_json(event, grant_id):
+    overrides = [
+        {"reminder_minutes": override.reminder_minutes, "reminder_method": "display"}
+        for override in event.reminders.overrides or []
+    ]
+    return {
+        "id": event.id,
+        "grant_id": grant_id,
+        "calendar_id": event.calendar_id,
+        "busy": True,
+        "participants": [],
+        "title": event.title,
+        "when": {
+            "object": "timespan",
+            "start_time": event.when.start_time,
+            "end_time": event.when.end_time,
+        },
+        "metadata": event.metadata,
+        "reminders": {"use_default": False, "overrides": overrides},
+    }
+
+
+def nylas_api(fake, grant_id):
+    """
+    REST API Nylas поверх FakeCalendarService для httpx.MockTransport
+    """
+
+    def handle(request):
+        params = dict(request.url.params)
+        for name in ("start", "end", "limit"):
+            if name in params:
+                params[name] = int(params[name])
+        event_id = request.url.path.rpartition("/events")[2].strip("/")
+        calendar_id = params.get("calendar_id")
+        try:
+            if request.method == "GET":
+                response = fake.search_events(params)
+                return httpx.Response(
+                    200,
+                    json={
+                        "request_id": "r",
+                        "data": [event_json(e, grant_id) for e in response.data],
+                        "next_cursor": response.next_cursor,
+                    },
+                )
+            if request.method == "DELETE":
+                fake.delete_event(event_id, calendar_id)
+                return httpx.Response(200, json={"request_id": "r"})
+            body = json.loads(request.content)
+            reminders = [
+                override["reminder_minutes"]
+                for override in body.pop("reminders").get("overrides", [])
+            ]
+            if request.method == "POST":
+                event = fake.create_event(body, reminders, calendar_id).data
+            else:
+                event = fake.update_event(event_id, body, reminders, calendar_id).data
+            return httpx.Response(
+                200, json={"request_id": "r", "data": event_json(event, grant_id)}
+            )
+        except FakeApiError as e:
+            return httpx.Response(
+                e.status_code,
+                json={"request_id": "r", "error": {"type": "api", "message": str(e)}},
+            )
+
+    return handle
+
+
+@pytest.fixture
+def async_service():
+    fake = FakeCalendarService()
+    grant_id = uuid4().hex
+    service = AsyncNylasService(grant_id, "key", API_URI, rate=1000, burst=1000)
+    service.client = httpx.AsyncClient(
+        base_url=API_URI, transport=httpx.MockTransport(nylas_api(fake, grant_id))
+    )
+    return service, fake
+
+
+def test_create_routine_through_async_service(async_service, schedule, scheduler):
+    service, fake = async_service
+
+    async def run():
+        try:
+            first = await scheduler(service, schedule()).acreate_routine()
+            second = await scheduler(service, schedule()).acreate_routine()
+        finally:
+            await service.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert [result.operation.kind for result in first] == [CREATE, CREATE]
+    # Повторный запуск пересоздаёт найденные события
+    assert [result.operation.kind for result in second] == [
+        DELETE,
+        CREATE,
+        DELETE,
+        CREATE,
+    ]
+    assert all(result.ok for result in first + second)
+    assert sorted(event.title for event in fake.events.values()) == ["Lunch", "Walk"]
+    assert fake.calls["search_events"] == 2
@@ -0,0 +1,103 @@
+from datetime import date, datetime, time
+
+import cli
+from scheduler import Scheduler
+
+
+def noon():
+    return int(datetime.combine(date.today(), time(12)).timestamp())
+
+
+def busy(service, calendar_id, title, metadata=None):
+    body = {"title": title, "when": {"start_time": noon(), "end_time": noon() + 600}}
+    if metadata:
+        body["metadata"] = metadata
+    service.create_event(body, [], calendar_id)
+
+
+def test_same_title_in_other_calendar_conflicts(provider, capsys):
+    service, args = provider
+    busy(service, "family", "Lunch")
+    assert cli.main(["apply", *args, "--busy", "family", "--no-journal"]) == 0
+    captured = capsys.readouterr()
+    assert '"conflicts": 1' in captured.out
+    assert "CONFLICT" in captured.err and "busy: Lunch" in captured.err
+
+
+def test_own_tagged_events_are_not_busy(provider, capsys):
+    service, args = provider
+    assert cli.main(["apply", *args, "--busy", "--no-journal"]) == 0
+    assert cli.main(["verify", *args, "--busy"]) == 0
+    assert "CONFLICT" not in capsys.readouterr().err
+
+
+def test_untagged_schedule_skips_own_calendar_only(provider):
+    service, _ = provider
+    busy(service, "cal", "Lunch")
+    busy(service, "family", "Lunch")
+    plan = [
+        {
+            "calendar_id": "cal",
+            "calendar_routine": [
+                {
+                    "title": "Day",
+                    "apply_at": "00:00",
+                    "schedule": [{"title": "Lunch", "time": "12:00", "duration": 30}],
+                }
+            ],
+        }
+    ]
+    scheduler = Scheduler(service, plan, busy_calendars=["family"])
+    scheduler.drift()
+    (conflict,) = scheduler.conflicts
+    assert [block.calendar_id for _, _, block in conflict.blocks] == ["family"]
+
+
+def test_shifted_flexible_events_do_not_overlap(provider):
+    service, _ = provider
+    service.create_event(
+        {"title": "Meeting", "when": {"start_time": noon(), "end_time": noon() + 7200}},
+        [],
+        "family",
+    )
+    plan = [
+        {
+            "calendar_id": "cal",
+            "calendar_routine": [
+                {
+                    "title": "Day",
+                    "apply_at": "00:00",
+                    "schedule": [
+                        {
+                            "title": "A",
+                            "time": "12:00",
+                            "duration": 30,
+                            "flexible": True,
+                        },
+                        {
+                            "title": "B",
+                            "time": "12:30",
+                            "duration": 30,
+                            "flexible": True,
+                        },
+                        {
+                            "title": "C",
+                            "time": "12:30",
+                            "duration": 15,
+                            "anchor": {"after": "A"},
+                        },
+                    ],
+                }
+            ],
+        }
+    ]
+    scheduler = Scheduler(
+        service, plan, busy_calendars=["family"], shift_conflicts=True
+    )
+    events = {op.desired.title: op.desired for op in scheduler.drift()}
+    assert len(scheduler.conflicts) == 2
+    assert all(conflict.shifted for conflict in scheduler.conflicts)
+    assert events["C"].start == events["A"].end
+    spans = sorted((event.start, event.end) for event in events.values())
+    assert spans[0][0] == noon() + 7200
+    assert all(end <= start for (_, end), (start, _) in zip(spans, spans[1:]))
@@ -0,0 +1,72 @@
+import threading
+import time
+
+from executor import OperationExecutor
+
+
+def recorder():
+    order = []
+    lock = threading.Lock()
+
+    def step(name, delay=0.0):
+        time.sleep(delay)
+        with lock:
+            order.append(name)
+        return name
+
+    return order, step
+
+
+def test_urgent_chain_runs_first():
+    order, step = recorder()
+    executor = OperationExecutor(max_workers=1)
+    executor.submit("later", "a1", step, "a1", deadline=200)
+    executor.submit("later", "a2", step, "a2", deadline=300)
+    executor.submit("undated", "c1", step, "c1")
+    executor.submit("urgent", "b1", step, "b1", deadline=100)
+    results = executor.run()
+    assert order == ["b1", "a1", "a2", "c1"]
+    # Результаты — в порядке добавления цепочек
+    assert [result.operation for result in results] == ["a1", "a2", "c1", "b1"]
+    assert all(result.ok for result in results)
+
+
+def test_later_operation_raises_chain_priority():
+    order, step = recorder()
+    executor = OperationExecutor(max_workers=1)
+    executor.submit("first", "a1", step, "a1", deadline=200)
+    executor.submit("second", "b1", step, "b1", deadline=300)
+    executor.submit("second", "b2", step, "b2", deadline=100)
+    executor.run()
+    assert order == ["b1", "b2", "a1"]
+
+
+def test_chain_keeps_order_across_workers():
+    order, step = recorder()
+    executor = OperationExecutor(max_workers=4)
+    for n in range(3):
+        # Первые шаги цепочек медленнее следующих
+        for chain in ("x", "y"):
+            name = f"{chain}{n}"
+            executor.submit(chain, name, step, name, 0.02 * (3 - n), deadline=n)
+    executor.run()
+    for chain in ("x", "y"):
+        assert [name for name in order if name[0] == chain] == [
+            f"{chain}{n}" for n in range(3)
+        ]
+
+
+def test_failure_skips_rest_of_chain():
+    order, step = recorder()
+
+    def fail():
+        raise RuntimeError("provider down")
+
+    executor = OperationExecutor(max_workers=2)
+    executor.submit("k", "delete", fail, deadline=1)
+    executor.submit("k", "create", step, "create", deadline=1)
+    executor.submit("other", "walk", step, "walk", deadline=2)
+    results = {result.operation: result for result in executor.run()}
+    assert results["delete"].error is not None
+    assert results["create"].skipped and results["walk"].ok
+    assert order == ["walk"]
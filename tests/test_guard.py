@@ -0,0 +1,119 @@
+import threading
+from uuid import uuid4
+
+import pytest
+
+from guard import CLOSED, OPEN, CircuitBreaker, CircuitOpenError, GuardedService
+from throttle import Throttle
+
+
+class FlakyService:
+    """
+    Провайдер, чтения которого падают ConnectionError, пока fail=True
+    """
+
+    def __init__(self, throttled=True):
+        self.grant_id = uuid4().hex
+        self.fail = True
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+        if throttled:
+            self.throttle = Throttle(
+                max_retries=4, base_delay=0, transient_errors=(ConnectionError,)
+            )
+
+    def list_events(self, query_params):
+        self.calls += 1
+        self.release.wait(5)
+        if self.fail:
+            raise ConnectionError("provider down")
+        return [query_params["calendar_id"]]
+
+    def search_events(self, query_params):
+        if not hasattr(self, "throttle"):
+            return self.list_events(query_params)
+        return self.throttle.call(self.list_events, query_params)
+
+    def create_event(self, request_body, reminders, calendar_id):
+        return request_body
+
+
+def fail():
+    raise ConnectionError("provider down")
+
+
+def test_breaker_opens_and_probe_closes():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: "ok")
+    breaker.opened -= 60
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == CLOSED
+
+
+def test_interrupted_probe_releases_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=60)
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    breaker.opened -= 60
+
+    def interrupt():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        breaker.call(interrupt)
+    assert breaker.call(lambda: "ok") == "ok"
+
+
+def test_breaker_counts_each_retry_attempt():
+    service = FlakyService()
+    guarded = GuardedService(service, failure_threshold=2)
+    with pytest.raises(CircuitOpenError):
+        guarded.search_events({"calendar_id": "c"})
+    # Третья попытка отклонена автоматом без обращения к провайдеру
+    assert service.calls == 2
+    assert guarded.stats["rejected"] == 1
+
+
+def test_unthrottled_service_is_guarded_per_call():
+    service = FlakyService(throttled=False)
+    guarded = GuardedService(service, failure_threshold=1)
+    with pytest.raises(ConnectionError):
+        guarded.search_events({"calendar_id": "c"})
+    with pytest.raises(CircuitOpenError):
+        guarded.search_events({"calendar_id": "c"})
+    assert service.calls == 1
+
+
+def test_concurrent_reads_are_coalesced():
+    service = FlakyService()
+    service.fail = False
+    service.release.clear()
+    guarded = GuardedService(service, ttl=60)
+    query = {"calendar_id": "c"}
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(guarded.search_events(query)))
+        for _ in range(2)
+    ]
+    threads[0].start()
+    while service.calls == 0:
+        pass
+    threads[1].start()
+    while guarded.counters["coalesced"] == 0:
+        pass
+    service.release.set()
+    for thread in threads:
+        thread.join()
+    assert results == [["c"], ["c"]] and service.calls == 1
+    assert guarded.search_events(query) == ["c"] and service.calls == 1
+    assert guarded.counters["cached"] == 1
+    # Изменение календаря сбрасывает сохранённый ответ
+    guarded.create_event({}, [], "c")
+    guarded.search_events(query)
+    assert service.calls == 2
@@ -0,0 +1,60 @@
+from ics import IcsCalendarService
+
+NOON = 1792227600
+
+
+def test_round_trip(tmp_path):
+    service = IcsCalendarService(str(tmp_path))
+    title = "Разминка; шея, плечи\nи спина — " + "очень длинное название " * 3
+    body = {
+        "title": title,
+        "when": {"start_time": NOON, "end_time": NOON + 1800},
+        "metadata": {"owner": "home", "key": "Morning/Разминка"},
+    }
+    created = service.create_event(body, [10, 60], "cal").data
+    service.close()
+
+    (event,) = (
+        IcsCalendarService(str(tmp_path)).search_events({"calendar_id": "cal"}).data
+    )
+    assert event.id == created.id and event.title == title
+    assert (event.when.start_time, event.when.end_time) == (NOON, NOON + 1800)
+    assert event.reminders == (10, 60)
+    assert event.metadata == body["metadata"]
+
+
+def test_events_without_dtend(tmp_path):
+    (tmp_path / "cal.ics").write_text(
+        "\r\n".join(
+            [
+                "BEGIN:VCALENDAR",
+                "BEGIN:VEVENT",
+                "UID:all-day",
+                "DTSTART;VALUE=DATE:20261019",
+                "SUMMARY:Holiday",
+                "END:VEVENT",
+                "BEGIN:VEVENT",
+                "UID:duration",
+                "DTSTART:20261019T090000Z",
+                "DURATION:PT30M",
+                "SUMMARY:Call",
+                "END:VEVENT",
+                "BEGIN:VEVENT",
+                "UID:instant",
+                "DTSTART:20261019T100000Z",
+                "SUMMARY:Reminder",
+                "END:VEVENT",
+                "END:VCALENDAR",
+            ]
+        )
+    )
+    service = IcsCalendarService(str(tmp_path))
+    start = 1792400400  # 2026-10-19T09:00:00Z
+    found = service.search_events({"calendar_id": "cal", "end": start + 7200}).data
+    assert [event.id for event in found] == ["duration", "instant"]
+    assert found[0].when.end_time == start + 1800
+    assert found[1].when.end_time == start + 3600
+    found = service.search_events(
+        {"calendar_id": "cal", "start": start, "end": start + 1800}
+    ).data
+    assert [event.id for event in found] == ["duration"]
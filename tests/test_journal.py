@@ -0,0 +1,73 @@
+import os
+import time
+
+from fake import FakeApiError, FakeCalendarService
+from journal import OperationJournal, journal_path, operation_record
+from reconcile import CREATE, DesiredEvent, Operation
+
+
+def failing_create(service, title):
+    create = service._create
+
+    def fail(request_body, reminders, calendar_id):
+        if request_body["title"] == title:
+            raise FakeApiError("Internal error", 500)
+        return create(request_body, reminders, calendar_id)
+
+    return fail
+
+
+def test_finish_keeps_failed_operations(tmp_path, schedule, scheduler):
+    path = str(tmp_path / "journal.jsonl")
+    service = FakeCalendarService()
+    service._create = failing_create(service, "Lunch")
+    results = scheduler(
+        service, schedule(), journal=OperationJournal(path, fsync=False)
+    ).reconcile_routine()
+    assert [result.ok for result in results] == [False, True]
+    pending = OperationJournal(path).pending()
+    assert [(op.kind, op.desired.title) for op in pending] == [(CREATE, "Lunch")]
+
+    del service._create
+    journal = OperationJournal(path, fsync=False)
+    results = scheduler(service, schedule(), journal=journal).reconcile_routine()
+    assert [result.ok for result in results] == [True]
+    assert not os.path.exists(path)
+    assert sorted(event.title for event in service.events.values()) == [
+        "Lunch",
+        "Walk",
+    ]
+
+
+def test_failing_replay_does_not_block_run(tmp_path, schedule, scheduler):
+    path = str(tmp_path / "journal.jsonl")
+    service = FakeCalendarService()
+    service._create = failing_create(service, "Lunch")
+    journal = OperationJournal(path, fsync=False)
+    scheduler(service, schedule(), journal=journal).reconcile_routine()
+    scheduler(service, schedule("13:30"), journal=journal).reconcile_routine()
+    assert [op.desired.title for op in journal.pending()] == ["Lunch"]
+    assert [event.title for event in service.events.values()] == ["Walk"]
+
+
+def test_pending_skips_past_days(tmp_path):
+    journal = OperationJournal(str(tmp_path / "journal.jsonl"), fsync=False)
+    start = time.time()
+    operations = [
+        Operation(
+            CREATE,
+            "cal",
+            DesiredEvent(
+                "cal", "Day", title, start + days * 86400, start + days * 86400 + 60, ()
+            ),
+        )
+        for title, days in (("Old", -2), ("New", 1))
+    ]
+    journal.begin(operations)
+    assert [op.desired.title for op in journal.pending()] == ["New"]
+    assert operation_record(operations[0])["desired"]["start"] < start
+
+
+def test_journal_path_follows_schedule(tmp_path):
+    path = journal_path(str(tmp_path / "home.json"))
+    assert path == str(tmp_path / "home.journal.jsonl")
@@ -0,0 +1,56 @@
+from datetime import date
+
+import pytest
+
+from plan import ScheduleError, compile_schedule
+from scheduler import Scheduler
+
+
+def schedule(ref="Day/Workout"):
+    return [
+        {
+            "calendar_id": "c",
+            "calendar_routine": [
+                {
+                    "title": "Day",
+                    "recurrence": "RRULE:FREQ=WEEKLY;BYDAY=MO",
+                    "schedule": [{"title": "Workout", "time": "17:00", "duration": 60}],
+                },
+                {
+                    "title": "Evening",
+                    "schedule": [
+                        {
+                            "title": "Stretch",
+                            "time": "19:00",
+                            "duration": 15,
+                            "anchor": {"after": ref},
+                        },
+                        {"title": "Read", "time": "21:00", "duration": 30},
+                    ],
+                },
+            ],
+        }
+    ]
+
+
+def test_missing_anchor_leaves_dependent_unplaced():
+    scheduler = Scheduler(None, schedule())
+    scheduler.wake_up = scheduler.wake_up.replace(hour=12)
+    today = date.today()
+    events = list(scheduler.desired_events(today, 7))
+    days = {(event.key, event.day) for event in events}
+    for day in {event.day for event in events}:
+        monday = day.weekday() == 0
+        assert ("Day/Workout", day) in days if monday else True
+        assert (("Evening/Stretch", day) in days) == monday
+        assert ("Evening/Read", day) in days
+    stretch = [event for event in events if event.key == "Evening/Stretch"]
+    workout = {event.day: event for event in events if event.key == "Day/Workout"}
+    assert all(event.start == workout[event.day].end for event in stretch)
+
+
+def test_compile_rejects_unknown_anchor():
+    with pytest.raises(ScheduleError):
+        compile_schedule(schedule("Day/Yoga"))
+    with pytest.raises(ScheduleError):
+        compile_schedule(schedule("Workout"))
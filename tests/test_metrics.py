@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+import cli
+
+
+@pytest.mark.parametrize("name", ["metrics.json", "metrics.prom"])
+def test_apply_exports_metrics(tmp_path, provider, name):
+    service, args = provider
+    path = tmp_path / name
+    assert cli.main(["apply", *args, "--metrics", str(path)]) == 0
+    assert len(service.events) == 1
+    text = path.read_text()
+    if name.endswith(".json"):
+        calls = {call["method"]: call["calls"] for call in json.loads(text)["calls"]}
+        assert calls["create_event"] == 1 and calls["search_events"] >= 1
+    else:
+        assert 'scheduler_calendar_calls_total{method="create_event"' in text
+
+
+def test_metrics_exported_when_run_fails(tmp_path, provider):
+    service, args = provider
+
+    def fail(query_params):
+        raise RuntimeError("provider down")
+
+    service.search_events = fail
+    path = tmp_path / "metrics.json"
+    with pytest.raises(RuntimeError):
+        cli.main(["verify", *args, "--metrics", str(path)])
+    calls = json.loads(path.read_text())["calls"]
+    assert [(call["method"], call["errors"]) for call in calls] == [
+        ("search_events", 1)
+    ]
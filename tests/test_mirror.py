@@ -0,0 +1,59 @@
+import os
+
+from fake import ReplayCalendarService
+from mirror import MirroredService
+
+HISTORY = os.path.join(os.path.dirname(__file__), "fixtures", "replay_history.json")
+# Окно запроса: событие x до переноса лежит за его пределами
+QUERY = {"calendar_id": "c", "start": 0, "end": 10000}
+
+
+def mirrored(replay, path):
+    return MirroredService(replay, path, max_age=0, clock=replay.now)
+
+
+def listed(service):
+    return [(event.id, event.when.start_time) for event in service.list_events(QUERY)]
+
+
+def test_delta_sync_replays_history(tmp_path):
+    replay = ReplayCalendarService(HISTORY, clock=1500)
+    service = mirrored(replay, str(tmp_path / "mirror.json"))
+    assert listed(service) == [("a", 5000), ("b", 7000)]
+    assert service.stats == {
+        "full_syncs": 1,
+        "delta_syncs": 0,
+        "fetched": 2,
+        "tombstones": 0,
+    }
+
+    replay.advance(3000)
+    # Перенос a, удаление b, перенос x в окно и новое событие n
+    assert listed(service) == [("n", 100), ("x", 6000), ("a", 8000)]
+    assert service.stats["full_syncs"] == 1
+    assert service.stats["delta_syncs"] == 1
+    assert service.stats["tombstones"] == 1
+    assert "b" not in service.mirror.calendars["c"].events
+    assert replay.calls["search_events"] == 2
+
+    replay.advance(4000)
+    assert listed(service) == [("n", 100), ("x", 6000), ("a", 8000)]
+    assert service.stats["delta_syncs"] == 2
+    assert service.stats["fetched"] == 6
+
+
+def test_mirror_survives_restart(tmp_path):
+    path = str(tmp_path / "mirror.json")
+    replay = ReplayCalendarService(HISTORY, clock=1500)
+    service = mirrored(replay, path)
+    listed(service)
+    service.close()
+
+    replay.advance(3000)
+    restarted = mirrored(replay, path)
+    assert listed(restarted) == [("n", 100), ("x", 6000), ("a", 8000)]
+    assert restarted.stats["full_syncs"] == 0
+    assert restarted.stats["delta_syncs"] == 1
+    assert restarted.stats["tombstones"] == 1
+    restarted.close()
+    assert "b" not in mirrored(replay, path).mirror.calendars["c"].events
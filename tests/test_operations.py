@@ -0,0 +1,97 @@
+from datetime import date, datetime, timedelta
+
+from cache import EventCache
+from fake import FakeApiError, FakeCalendarService
+from index import EVENT_KEY, OWNER_KEY, EventIndex
+from journal import OperationJournal
+from reconcile import CREATE, DELETE, UPDATE
+
+
+def test_cached_update_after_time_change(tmp_path, schedule, scheduler):
+    service = FakeCalendarService()
+    cache = EventCache(str(tmp_path / "events.sqlite3"))
+    scheduler(service, schedule(), cache=cache).reconcile_routine()
+    service.calls.clear()
+    results = scheduler(service, schedule("14:00"), cache=cache).reconcile_routine()
+    assert [result.operation.kind for result in results] == [UPDATE]
+    assert all(result.ok for result in results)
+    assert "search_events" not in service.calls
+
+
+def test_resume_journaled_operations(tmp_path, schedule, scheduler):
+    service = FakeCalendarService()
+    scheduler(service, schedule()).reconcile_routine()
+    journal = OperationJournal(str(tmp_path / "journal.jsonl"), fsync=False)
+    first = scheduler(service, schedule("14:00"), journal=journal)
+    index = EventIndex(service)
+    index.load("cal", *EventIndex.day_window(date.today()))
+    operations = first.recreate(
+        index, list(first.desired_events(date.today())), date.today()
+    )
+    journal.begin([operation for operation in operations if operation.kind != CREATE])
+
+    results = scheduler(service, schedule(), journal=journal).resume()
+    assert [result.operation.kind for result in results] == [DELETE, DELETE]
+    assert all(result.ok for result in results)
+    assert all(result.operation.deadline is not None for result in results)
+    assert not service.events
+
+
+def test_recreate_pairs_share_chain(schedule, scheduler):
+    service = FakeCalendarService()
+    scheduler(service, schedule()).reconcile_routine()
+    tagged = scheduler(service, schedule(), schedule_id="s")
+    index = EventIndex(service)
+    index.load("cal", *EventIndex.day_window(date.today()))
+    operations = tagged.recreate(
+        index, list(tagged.desired_events(date.today())), date.today()
+    )
+    assert [operation.kind for operation in operations] == [
+        DELETE,
+        CREATE,
+        DELETE,
+        CREATE,
+    ]
+    keys = [tagged.chain_key(operation) for operation in operations]
+    assert keys[0] == keys[1] and keys[2] == keys[3] and keys[0] != keys[2]
+
+
+def test_failed_delete_skips_create(schedule, scheduler):
+    service = FakeCalendarService()
+    scheduler(service, schedule()).reconcile_routine()
+    tagged = scheduler(service, schedule(), schedule_id="s")
+
+    def fail(*args):
+        raise FakeApiError("Internal error", 500)
+
+    service._delete = fail
+    results = tagged.create_routine()
+    assert {result.operation.kind for result in results if result.skipped} == {CREATE}
+    assert len(service.events) == 2
+
+
+def test_sweep_deletes_orphans_from_today(schedule, scheduler):
+    service = FakeCalendarService()
+    tagged = scheduler(service, schedule(), schedule_id="s")
+    tagged.reconcile_routine()
+    today = datetime.combine(date.today(), datetime.min.time())
+
+    def orphan(calendar_id, day):
+        start = int((today + timedelta(days=day, hours=9)).timestamp())
+        body = {
+            "title": "Gone",
+            "when": {"start_time": start, "end_time": start + 600},
+            "metadata": {OWNER_KEY: "s", EVENT_KEY: "Old/Gone"},
+        }
+        return service.create_event(body, [], calendar_id).data.id
+
+    # Календарь old убран из расписания, вчерашние события — история
+    removed = orphan("old", 1)
+    history = {orphan("old", -1), orphan("cal", -1)}
+    stale = orphan("cal", 0)
+
+    results = tagged.sweep(calendars={"old"})
+    assert all(result.ok for result in results)
+    assert {result.operation.event.id for result in results} == {removed, stale}
+    assert history < set(service.events)
+    assert len(service.events) == 4
@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+from plan import PLAN_VERSION, load_plan
+
+SCHEDULE = """[{"calendar_id": "cal", "calendar_routine": [
+    {"title": "Day", "schedule": [{"title": "Lunch", "time": "12:00", "duration": 30}]}
+]}]"""
+
+
+def write_schedule(directory):
+    path = directory / "home.json"
+    path.write_text(SCHEDULE)
+    return path
+
+
+def test_cache_lives_next_to_schedule(tmp_path, monkeypatch):
+    path = write_schedule(tmp_path)
+    elsewhere = tmp_path / "cwd"
+    elsewhere.mkdir()
+    monkeypatch.chdir(elsewhere)
+    plan = load_plan(str(path))
+    assert plan.name == "home" and len(plan) == 1
+    assert not os.listdir(elsewhere)
+    (cached,) = os.listdir(tmp_path / ".plan_cache")
+    assert cached.endswith(f".v{PLAN_VERSION}.pickle")
+    assert len(load_plan(str(path))) == 1
+
+
+@pytest.mark.parametrize(
+    "stale",
+    [
+        # Класс, которого больше нет в модуле, и модуль, которого больше нет
+        b"cplan\nRemovedPlan\n)\x81.",
+        b"cvanished_module\nPlan\n)\x81.",
+    ],
+)
+def test_stale_pickle_recompiles(tmp_path, stale):
+    path = write_schedule(tmp_path)
+    load_plan(str(path))
+    (cached,) = (tmp_path / ".plan_cache").iterdir()
+    cached.write_bytes(stale)
+    os.utime(path, ns=(1, 1))
+    assert len(load_plan(str(path))) == 1
+
+
+def test_unwritable_cache_still_returns_plan(tmp_path):
+    path = write_schedule(tmp_path)
+    blocker = tmp_path / "blocker"
+    blocker.write_text("")
+    assert len(load_plan(str(path), cache_dir=str(blocker / "cache"))) == 1
+
+
+def test_failed_cache_write_leaves_no_temp_files(tmp_path, monkeypatch):
+    path = write_schedule(tmp_path)
+
+    def replace(source, target):
+        raise PermissionError(target)
+
+    monkeypatch.setattr("plan.os.replace", replace)
+    assert len(load_plan(str(path))) == 1
+    assert not os.listdir(tmp_path / ".plan_cache")
@@ -0,0 +1,81 @@
+from datetime import date, timedelta
+
+import pytest
+
+from plan import ScheduleError, compile_schedule
+from recurrence import RecurrenceError, RecurrenceRule, expand
+
+MONDAY = date(2026, 10, 19)
+
+
+def daily_runs(text, runs=4):
+    return [
+        sorted(expand({"r": text}, MONDAY + timedelta(days=i), 1)["r"])
+        for i in range(runs)
+    ]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "RRULE:FREQ=DAILY;INTERVAL=2",
+        "RRULE:FREQ=DAILY;COUNT=1",
+        "RRULE:FREQ=DAILY;UNTIL=20261231",
+        "RRULE:FREQ=WEEKLY",
+        "RRULE:FREQ=MONTHLY",
+    ],
+)
+def test_series_rules_need_dtstart(text):
+    with pytest.raises(RecurrenceError):
+        RecurrenceRule.parse(text)
+
+
+def test_interval_does_not_follow_window():
+    runs = daily_runs("DTSTART:20261019\nRRULE:FREQ=DAILY;INTERVAL=2")
+    assert [len(days) for days in runs] == [1, 0, 1, 0]
+
+
+def test_count_does_not_follow_window():
+    runs = daily_runs("DTSTART:20261019\nRRULE:FREQ=DAILY;COUNT=1")
+    assert runs == [[MONDAY], [], [], []]
+
+
+def test_rules_without_series_start():
+    runs = daily_runs("RRULE:FREQ=WEEKLY;BYDAY=MO,WE", runs=7)
+    assert [len(days) for days in runs] == [1, 0, 1, 0, 0, 0, 0]
+    assert all(daily_runs("RRULE:FREQ=DAILY"))
+
+
+def test_compile_rejects_unanchored_rule():
+    schedule = [
+        {
+            "calendar_id": "cal",
+            "calendar_routine": [
+                {"title": "Day", "recurrence": "RRULE:FREQ=DAILY;INTERVAL=2"}
+            ],
+        }
+    ]
+    with pytest.raises(ScheduleError):
+        compile_schedule(schedule)
+
+
+def test_monthly_ordinal_byday():
+    first_monday = RecurrenceRule.parse("RRULE:FREQ=MONTHLY;BYDAY=1MO")
+    assert first_monday.between(date(2026, 10, 1), 61) == [
+        date(2026, 10, 5),
+        date(2026, 11, 2),
+    ]
+    last_friday = RecurrenceRule.parse("RRULE:FREQ=MONTHLY;BYDAY=-1FR,+2TU")
+    assert last_friday.between(date(2026, 10, 1), 31) == [
+        date(2026, 10, 13),
+        date(2026, 10, 30),
+    ]
+
+
+@pytest.mark.parametrize(
+    "byday", ["XMO", "0MO", "6MO", "1XX", "MO1", "RRULE:FREQ=WEEKLY;BYDAY=1MO"]
+)
+def test_invalid_byday_is_rejected(byday):
+    text = byday if byday.startswith("RRULE") else f"RRULE:FREQ=MONTHLY;BYDAY={byday}"
+    with pytest.raises(RecurrenceError):
+        RecurrenceRule.parse(text)
@@ -0,0 +1,78 @@
+import pytest
+
+from throttle import Throttle, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class ApiError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(status_code)
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def failing(*errors):
+    errors = list(errors)
+    calls = []
+
+    def call():
+        calls.append(len(calls))
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    return call, calls
+
+
+def test_burst_exhaustion_waits_for_refill():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock, sleep=clock.sleep)
+    assert [bucket.take() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take() == pytest.approx(0.5)
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert clock.sleeps == [pytest.approx(0.5)]
+    clock.now += 10
+    # Запас не копится выше capacity
+    assert [bucket.take() for _ in range(4)][-1] == pytest.approx(0.5)
+
+
+def test_rate_limit_honours_retry_after():
+    clock = FakeClock()
+    throttle = Throttle(sleep=clock.sleep)
+    call, calls = failing(ApiError(429, {"Retry-After": "7"}))
+    # 429 повторяется и для неидемпотентных запросов: провайдер его не выполнил
+    assert throttle.call(call, idempotent=False) == "ok"
+    assert len(calls) == 2 and clock.sleeps == [7.0]
+    assert throttle.stats["rate_limited"] == 1 and throttle.stats["retried"] == 1
+
+
+def test_gives_up_after_max_retries():
+    clock = FakeClock()
+    throttle = Throttle(max_retries=2, base_delay=1, sleep=clock.sleep)
+    call, calls = failing(*(ApiError(500) for _ in range(5)))
+    with pytest.raises(ApiError):
+        throttle.call(call)
+    assert len(calls) == 3
+    # Задержка с разбросом не больше base_delay * 2 ** attempt
+    assert len(clock.sleeps) == 2
+    assert all(0 <= delay <= 2**n for n, delay in enumerate(clock.sleeps))
+
+
+def test_non_idempotent_server_error_is_not_retried():
+    throttle = Throttle(sleep=FakeClock().sleep)
+    call, calls = failing(ApiError(500))
+    with pytest.raises(ApiError):
+        throttle.call(call, idempotent=False)
+    assert len(calls) == 1
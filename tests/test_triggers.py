@@ -0,0 +1,58 @@
+from triggers import TimerWheel, TriggerEngine
+
+
+def test_timers_cascade_through_levels_and_overflow():
+    # Колесо на 4 * 4 тика: 6 и 15 ждут на уровне 1, 40 — в overflow
+    wheel = TimerWheel(slots=4, levels=2, start=0)
+    for when in (3, 6, 15, 40):
+        wheel.schedule(when, when)
+    assert [timer.item for slot in wheel.wheels[1] for timer in slot] == [6, 15]
+    assert [timer.item for timer in wheel.overflow] == [40]
+    fired = {}
+    for now in range(1, 46):
+        for timer in wheel.advance(now):
+            fired[timer.item] = now
+    assert fired == {3: 3, 6: 6, 15: 15, 40: 40}
+    assert len(wheel) == 0
+
+
+def test_next_due_stops_at_upper_level_boundary():
+    wheel = TimerWheel(slots=64, levels=4, start=0)
+    wheel.schedule(100, "far")
+    assert wheel.next_due() == 64
+    near = wheel.schedule(3, "near")
+    assert wheel.next_due() == 3
+    wheel.cancel(near)
+    assert wheel.next_due() == 64
+
+
+def test_engine_cancel_and_reschedule():
+    engine = TriggerEngine(clock=lambda: 0.0)
+    calls = []
+    engine.schedule("a", 100, calls.append, "a")
+    engine.schedule("b", 5000, calls.append, "b")
+    assert engine.due("a") == 100 and len(engine) == 2
+    engine.cancel("b")
+    assert engine.due("b") is None
+    # Повторное назначение ключа заменяет прежний триггер
+    engine.schedule("a", 200, calls.append, "a2")
+    assert engine.due("a") == 200 and len(engine) == 1
+    assert engine.fire(150) == [] and calls == []
+    assert engine.fire(200) == ["a"] and calls == ["a2"]
+    assert engine.fire(6000) == [] and calls == ["a2"]
+    assert len(engine) == 0 and len(engine.wheel) == 0
+
+
+def test_action_reschedules_itself():
+    engine = TriggerEngine(clock=lambda: 0.0)
+    runs = []
+
+    def tick():
+        runs.append(engine.now)
+        engine.schedule("tick", engine.now + 60, tick)
+
+    engine.schedule("tick", 60, tick)
+    for now in range(30, 301, 30):
+        engine.fire(now)
+    assert runs == [60, 120, 180, 240, 300]
+    assert engine.due("tick") == 360
@@ -0,0 +1,197 @@
+import random
+import threading
+import time
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+
+
+class TokenBucket:
+    """
+    Клиентский ограничитель частоты запросов: rate токенов в секунду,
+    не больше capacity токенов в запасе. clock и sleep — часы и ожидание
+    (в тестах подменяются)
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float = None,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.capacity
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """
+        Забирает токен, если он есть. Возвращает 0 или время до следующего токена
+        """
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """
+        Забирает токен, при необходимости ждёт. Возвращает время ожидания
+        """
+        waited = 0.0
+        while delay := self.take():
+            self.sleep(delay)
+            waited += delay
+        return waited
+
+    async def aacquire(self):
+        """
+        Асинхронный вариант acquire, ожидание не блокирует цикл событий
+        """
+        import asyncio
+
+        waited = 0.0
+        while delay := self.take():
+            await asyncio.sleep(delay)
+            waited += delay
+        return waited
+
+
+# Общие ограничители на grant, чтобы все клиенты одного пользователя
+# делили одну квоту
+buckets = {}
+buckets_lock = threading.Lock()
+
+
+def grant_bucket(grant_id, rate, capacity=None):
+    with buckets_lock:
+        if grant_id not in buckets:
+            buckets[grant_id] = TokenBucket(rate, capacity)
+        return buckets[grant_id]
+
+
+# Обёртка каждой попытки Throttle.call (см. GuardedService.guarded):
+# автомат отключения видит каждую попытку, а не весь вызов с повторами
+attempt_guard = ContextVar("attempt_guard", default=None)
+
+
+def retry_after(error):
+    """
+    Значение заголовка Retry-After в секундах или None
+    """
+    headers = getattr(error, "headers", None) or {}
+    value = headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class Throttle:
+    """
+    Ограничение частоты и повтор запросов к провайдеру.
+
+    Ответы 429 и 503 повторяются для любых запросов с учётом Retry-After,
+    так как провайдер их не выполнил. Остальные временные ошибки (5xx,
+    таймауты, обрывы соединения) повторяются только для идемпотентных
+    запросов с экспоненциальной задержкой и случайным разбросом.
+    Если задан attempt_guard, каждая попытка идёт через него.
+    """
+
+    RETRY_AFTER_STATUSES = (429, 503)
+
+    def __init__(
+        self,
+        bucket: TokenBucket = None,
+        max_retries: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        transient_errors=(),
+        sleep=time.sleep,
+    ):
+        self.bucket = bucket
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.transient_errors = tuple(transient_errors)
+        self.sleep = sleep
+        self.stats = {"calls": 0, "throttled": 0, "rate_limited": 0, "retried": 0}
+        self.lock = threading.Lock()
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def retry_delay(self, error, attempt, idempotent):
+        """
+        Задержка перед повтором или None, если запрос повторять нельзя
+        """
+        status = getattr(error, "status_code", None)
+        if status in self.RETRY_AFTER_STATUSES:
+            if status == 429:
+                self.count("rate_limited")
+            delay = retry_after(error)
+            return self.backoff(attempt) if delay is None else delay
+        if not idempotent:
+            return None
+        if (status is not None and status >= 500) or isinstance(
+            error, self.transient_errors
+        ):
+            return self.backoff(attempt)
+        return None
+
+    def call(self, fn, *args, idempotent=True):
+        attempt = 0
+        while True:
+            if self.bucket is not None and self.bucket.acquire():
+                self.count("throttled")
+            self.count("calls")
+            guard = attempt_guard.get()
+            try:
+                return fn(*args) if guard is None else guard(fn, *args)
+            except Exception as e:
+                delay = self.retry_delay(e, attempt, idempotent)
+                if delay is None or attempt >= self.max_retries:
+                    raise
+            attempt += 1
+            self.count("retried")
+            self.sleep(min(delay, self.max_delay))
+
+    async def acall(self, fn, *args, idempotent=True):
+        """
+        Асинхронный вариант call для корутинных функций
+        """
+        # asyncio нужен только асинхронным прогонам, см. OperationExecutor
+        import asyncio
+
+        attempt = 0
+        while True:
+            if self.bucket is not None and await self.bucket.aacquire():
+                self.count("throttled")
+            self.count("calls")
+            try:
+                return await fn(*args)
+            except Exception as e:
+                delay = self.retry_delay(e, attempt, idempotent)
+                if delay is None or attempt >= self.max_retries:
+                    raise
+            attempt += 1
+            self.count("retried")
+            await asyncio.sleep(min(delay, self.max_delay))
@@ -0,0 +1,83 @@
+import contextlib
+import cProfile
+import json
+import os
+import threading
+import time
+
+
+class Tracer:
+    """
+    Лёгкая трассировка прогона вложенными интервалами (span).
+
+    Выключена по умолчанию: span() тогда ничего не записывает. Включённая
+    трассировка собирает интервалы всех потоков и пишет их в формате
+    Chrome trace (chrome://tracing, Perfetto).
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+
+    def enable(self):
+        self.enabled = True
+        self.events = []
+        self.origin = time.perf_counter()
+
+    def disable(self):
+        self.enabled = False
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            finished = time.perf_counter()
+            event = {
+                "name": name,
+                "ph": "X",
+                "ts": (started - self.origin) * 1e6,
+                "dur": (finished - started) * 1e6,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+            }
+            if args:
+                event["args"] = {key: str(value) for key, value in args.items()}
+            with self.lock:
+                self.events.append(event)
+
+    def write(self, path):
+        with self.lock:
+            events = sorted(self.events, key=lambda event: event["ts"])
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(
+                {"traceEvents": events, "displayTimeUnit": "ms"},
+                file,
+                ensure_ascii=False,
+            )
+
+    @contextlib.contextmanager
+    def profile(self, path):
+        """
+        Профилирует блок через cProfile и сохраняет статистику в path
+        """
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+
+
+tracer = Tracer()
+
+
+def span(name, **args):
+    return tracer.span(name, **args)
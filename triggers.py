@@ -0,0 +1,230 @@
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+from recurrence import expand
+
+logger = logging.getLogger("scheduler")
+
+
+class Timer:
+    """
+    Запланированное срабатывание: время when и произвольный item
+    """
+
+    __slots__ = ("when", "tick", "item", "cancelled")
+
+    def __init__(self, when, tick, item):
+        self.when = when
+        self.tick = tick
+        self.item = item
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerWheel:
+    """
+    Иерархическое колесо таймеров.
+
+    Время делится на тики по resolution секунд. Уровень 0 — slots ячеек
+    по одному тику, каждый следующий уровень — slots ячеек, каждая
+    в slots раз шире ячейки предыдущего. Таймер кладётся на самый мелкий
+    уровень, до ячейки которого меньше slots шагов, а по мере хода
+    времени содержимое ячеек старших уровней раскладывается вниз.
+    Добавление и отмена — O(1), срабатывание — O(1) амортизированно
+    на таймер; то, что дальше всего колеса, ждёт в overflow.
+    """
+
+    def __init__(
+        self, resolution: float = 1.0, slots: int = 64, levels: int = 4, start=None
+    ):
+        self.resolution = resolution
+        self.slots = slots
+        self.levels = levels
+        self.wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self.overflow = []
+        self.tick = int((time.time() if start is None else start) // resolution)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def schedule(self, when, item):
+        timer = Timer(when, max(math.ceil(when / self.resolution), self.tick + 1), item)
+        self.place(timer)
+        self.count += 1
+        return timer
+
+    def cancel(self, timer):
+        if not timer.cancelled:
+            timer.cancel()
+            self.count -= 1
+
+    def place(self, timer):
+        for level in range(self.levels):
+            shift = self.slots**level
+            if timer.tick // shift - self.tick // shift < self.slots:
+                self.wheels[level][(timer.tick // shift) % self.slots].append(timer)
+                return
+        self.overflow.append(timer)
+
+    def cascade(self, level):
+        """
+        Раскладывает ячейку уровня level, наступившую на текущем тике
+        """
+        if level >= self.levels:
+            timers, self.overflow = self.overflow, []
+        else:
+            index = (self.tick // self.slots**level) % self.slots
+            if index == 0:
+                self.cascade(level + 1)
+            timers, self.wheels[level][index] = self.wheels[level][index], []
+        for timer in timers:
+            if not timer.cancelled:
+                self.place(timer)
+
+    def advance(self, now):
+        """
+        Продвигает колесо до времени now и возвращает сработавшие таймеры
+        """
+        target = int(now // self.resolution)
+        fired = []
+        while self.tick < target:
+            if not self.count:
+                # Пустое колесо перескакивает сразу к target, ячейки
+                # с отменёнными таймерами очищаются
+                self.wheels = [
+                    [[] for _ in range(self.slots)] for _ in range(self.levels)
+                ]
+                self.overflow = []
+                self.tick = target
+                break
+            self.tick += 1
+            if self.tick % self.slots == 0:
+                self.cascade(1)
+            slot = self.wheels[0][self.tick % self.slots]
+            if slot:
+                self.wheels[0][self.tick % self.slots] = []
+                for timer in slot:
+                    if not timer.cancelled:
+                        timer.cancelled = True
+                        self.count -= 1
+                        fired.append(timer)
+        return fired
+
+    def next_due(self):
+        """
+        Время, до которого колесо можно не продвигать: ближайший таймер
+        нижнего уровня или граница ячейки старшего уровня. None — таймеров нет
+        """
+        if not self.count:
+            return None
+        upper = bool(self.overflow) or any(
+            slot for wheel in self.wheels[1:] for slot in wheel
+        )
+        for step in range(1, self.slots + 1):
+            tick = self.tick + step
+            if any(not timer.cancelled for timer in self.wheels[0][tick % self.slots]):
+                return tick * self.resolution
+            if upper and tick % self.slots == 0:
+                return tick * self.resolution
+        return None
+
+
+class TriggerEngine:
+    """
+    Запуск действий в назначенное время на колесе таймеров.
+
+    Триггер — ключ, время и действие; повторное назначение ключа
+    заменяет прежний триггер. run() спит до ближайшего срока (без опроса
+    по расписанию) и просыпается раньше, если назначен более ранний
+    триггер. Действие может назначить свой следующий запуск.
+    """
+
+    def __init__(self, resolution: float = 1.0, clock=time.time):
+        self.clock = clock
+        self.wheel = TimerWheel(resolution, start=clock())
+        self.timers = {}
+        # Время последнего fire(): по нему действия назначают следующий запуск
+        self.now = self.wheel.tick * resolution
+        self.condition = threading.Condition()
+        self.stopped = False
+
+    def __len__(self):
+        return len(self.timers)
+
+    def schedule(self, key, when, action, *args):
+        with self.condition:
+            previous = self.timers.pop(key, None)
+            if previous is not None:
+                self.wheel.cancel(previous)
+            self.timers[key] = self.wheel.schedule(when, (key, action, args))
+            self.condition.notify()
+
+    def cancel(self, key):
+        with self.condition:
+            timer = self.timers.pop(key, None)
+            if timer is not None:
+                self.wheel.cancel(timer)
+
+    def due(self, key):
+        timer = self.timers.get(key)
+        return None if timer is None else timer.when
+
+    def fire(self, now=None):
+        """
+        Выполняет действия наступивших триггеров и возвращает их ключи
+        """
+        with self.condition:
+            self.now = self.clock() if now is None else now
+            fired = self.wheel.advance(self.now)
+            for timer in fired:
+                key = timer.item[0]
+                if self.timers.get(key) is timer:
+                    del self.timers[key]
+        keys = []
+        for timer in sorted(fired, key=lambda timer: timer.when):
+            key, action, args = timer.item
+            keys.append(key)
+            try:
+                action(*args)
+            except Exception as e:
+                logger.exception(f"Trigger {key} failed | {e}")
+        return keys
+
+    def run(self):
+        while not self.stopped:
+            self.fire()
+            with self.condition:
+                if self.stopped:
+                    return
+                due = self.wheel.next_due()
+                timeout = None if due is None else max(0.0, due - self.clock())
+                self.condition.wait(timeout)
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+
+def next_apply(plan, key, after: datetime, horizon: int = 370):
+    """
+    Ближайшее после after время применения рутины key = (calendar_id,
+    routine): её apply_at в день, когда рутина повторяется. None, если
+    у рутины нет apply_at или повторов в пределах horizon дней
+    """
+    minute = plan.apply_at.get(key)
+    if minute is None:
+        return None
+    start = after.date()
+    days = sorted(expand({key: plan.recurrence.get(key)}, start, horizon)[key])
+    for day in days:
+        moment = datetime.combine(day, datetime.min.time()) + timedelta(minutes=minute)
+        if moment.timestamp() > after.timestamp():
+            return moment.timestamp()
+    return None